@@ -16,6 +16,10 @@ import inspect
 import types
 import functools
 
+from harness.cgroup_scope import CgroupScope
+from harness.perf_counters import PerfCounters
+from harness.pinning import Pinning
+
 
 BENCHMARK_METRICS = '__benchmark_metrics__'
 BENCHMARK_MACHINES = '__benchmark_machines__'
@@ -44,8 +48,23 @@ def default(value, **kwargs):
     return value
 
 
-def benchmark(metrics: list = None, machines: int = 1) -> types.FunctionType:
-    """Define a benchmark function with metrics."""
+def _add(totals: dict, values: dict):
+    """Adds values into totals, key by key."""
+    for key, value in values.items():
+        totals[key] = totals.get(key, 0) + value
+
+
+def benchmark(metrics: list = None, machines: int = 1,
+              throughput: list = None) -> types.FunctionType:
+    """Define a benchmark function with metrics.
+
+    :param metrics: the metric functions. A function returning None reports
+        nothing, e.g. for a value that was not measured.
+    :param machines: the number of machines required.
+    :param throughput: the metrics that are rates per second. For each, the
+        amount per CPU-second used by the benchmark's containers is also
+        reported, as <metric>_per_cpu_second.
+    """
     if not metrics:
         # The default passes through.
         metrics = [default]
@@ -56,7 +75,10 @@ def benchmark(metrics: list = None, machines: int = 1) -> types.FunctionType:
         #   runtime: The runtime to use for the benchmark (str, required).
         #   metrics: The metrics to use, if not the default (str, optional).
         @functools.wraps(func)
-        def wrapper(*args, runtime: str, metric: list = None, **kwargs):
+        # pylint: disable-msg=too-many-arguments
+        def wrapper(*args, runtime: str, metric: list = None, counters: str = "",
+                    accounting: bool = False, cpuset: str = "", mems: str = "",
+                    helper_cpuset: str = "", check_idle: bool = False, **kwargs):
             """Wrapper function."""
             # First -- ensure that we marshall all types appropriately. In
             # general, we will call this with only strings. These strings will
@@ -77,14 +99,55 @@ def benchmark(metrics: list = None, machines: int = 1) -> types.FunctionType:
                     # be passed to the metric function for evaluation.
                     kwargs[param.name] = param.default
 
+            # Account the resources used by the benchmark's containers on all
+            # machines, and optionally count their hardware events. The
+            # results are reported as extra metrics.
+            if isinstance(accounting, str):
+                accounting = accounting.lower() not in ("false", "0", "no")
+            usage = {}
+
+            # Pin the containers and runtime helpers to the given CPUs and
+            # NUMA nodes, checking first that they are idle if asked to.
+            pinning = Pinning(cpuset, mems, helper_cpuset, check_idle)
+
+            def call():
+                with pinning.applied(list(args)) as machines:
+                    return measure(machines)
+
+            def measure(machines):
+                if not counters and not accounting:
+                    return func(*machines, runtime=runtime, **kwargs)
+                scopes = [CgroupScope(machine) for machine in machines]
+                counting = [PerfCounters(scope.host, scope.name, counters)
+                            for scope in scopes] if counters else []
+                for counter in counting:
+                    counter.start()
+                try:
+                    return func(*[scope.machine for scope in scopes], runtime=runtime, **kwargs)
+                finally:
+                    for counter in counting:
+                        _add(usage, counter.stop())
+                    for scope in scopes:
+                        if accounting:
+                            scope_usage = scope.usage()
+                            # The containers ran for the longest of the times.
+                            usage["elapsed"] = max(usage.get("elapsed", 0),
+                                                   scope_usage.pop("elapsed", 0))
+                            _add(usage, scope_usage)
+                        scope.close()
+
             # Next, figure out how to apply a metric. We do this prior to
             # running the underlying function to prevent having to wait a few
             # minutes for a result just to see some error.
+            rates = {}
             if not metric:
                 # Return all metrics in the iterator.
-                result = func(*args, runtime=runtime, **kwargs)
+                result = call()
                 for metric_func in metrics:
-                    yield (metric_func.__name__, metric_func(result, **kwargs))
+                    value = metric_func(result, **kwargs)
+                    if value is not None:
+                        rates[metric_func.__name__] = value
+                        yield metric_func.__name__, value
             else:
                 result = None
                 for single_metric in metric:
@@ -92,10 +155,28 @@ def benchmark(metrics: list = None, machines: int = 1) -> types.FunctionType:
                         # Is this a function that matches the name?
                         # Apply this function to the result.
                         if metric_func.__name__ == single_metric:
-                            if not result:
+                            if result is None:
                                 # Lazy evaluation: only if metric matches.
-                                result = func(*args, runtime=runtime, **kwargs)
-                            yield single_metric, metric_func(result, **kwargs)
+                                result = call()
+                            value = metric_func(result, **kwargs)
+                            if value is not None:
+                                rates[single_metric] = value
+                                yield single_metric, value
+            for name, value in usage.items():
+                if name == "startup_seconds":
+                    # The mean over the runs, e.g. a microVM's boot or restore.
+                    yield name, value / usage["startups"]
+                elif name not in ("elapsed", "startups"):
+                    yield name, value
+            if usage.get("cycles"):
+                yield "ipc", usage.get("instructions", 0) / usage["cycles"]
+            if usage.get("cpu_seconds") and usage.get("elapsed"):
+                # Rates are scaled to amounts over the time the containers
+                # ran, divided by the CPU time they used.
+                for metric_func in throughput or []:
+                    if metric_func.__name__ in rates:
+                        yield (metric_func.__name__ + "_per_cpu_second",
+                               rates[metric_func.__name__] * usage["elapsed"] / usage["cpu_seconds"])
 
         # Set metadata on the benchmark (used above).
         setattr(wrapper, BENCHMARK_METRICS, metrics)
@@ -14,17 +14,21 @@
 """absl build benchmark."""
 
 from benchmarks import benchmark
+import benchmarks.helpers as helpers
 from harness.machine import Machine
-from workloads.absl import elapsed_time
+from workloads.absl import action_rate, completed_actions, elapsed_time
 
-@benchmark(metrics=[elapsed_time], machines=1)
-def absl(machine: Machine, **kwargs) -> str:
+@benchmark(metrics=[elapsed_time, action_rate], machines=1)
+def absl(machine: Machine, **kwargs) -> helpers.StreamedOutput:
     """Runs the absl workload and report the absl build time.
 
     Runs the 'bazel build //absl/...' in a clean bazel directory and
-    monitors time elapsed.
+    monitors time elapsed. The bazel progress lines are sampled as they are
+    written rather than kept.
 
     :param machine: A machine object.
     """
     image = machine.pull("absl")
-    return machine.container(image, **kwargs).run()
+    return helpers.parse_stream(machine.container(image, **kwargs).stream(),
+                                progress={"completed_actions": completed_actions},
+                                keep=r"Elapsed time")
@@ -0,0 +1,71 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Boot-time breakdown benchmarks."""
+
+import time
+
+from benchmarks import benchmark
+from harness.machine import Machine
+from harness.result_store import STATS
+
+# PHASES are the phases of a start, in order. Runtimes report those they know
+# (see Container.boot_phases); for the others, only "total" is timed here.
+PHASES = ["vmm", "api", "kernel", "kernel_guest", "init", "resume", "workload", "total"]
+
+# PERCENTILES are the statistics reported for each phase, by metric suffix.
+PERCENTILES = {"p50": "median", "p90": "p90", "p99": "p99"}
+
+
+def phase_metric(phase: str, percentile: str):
+    """Returns the metric of a percentile of a phase's duration, reporting
+    nothing for phases the runtime does not measure."""
+    #pylint: disable-msg=unused-argument
+    def metric(value, **kwargs):
+        samples = value.get(phase)
+        return STATS[PERCENTILES[percentile]](samples) * 1000 if samples else None
+    metric.__name__ = "%s_%s_ms" % (phase, percentile)
+    metric.__doc__ = "Returns the %s of the %s phase in milliseconds, if measured." % (
+        percentile, phase)
+    return metric
+
+
+@benchmark(metrics=[phase_metric(phase, percentile) for phase in PHASES
+                    for percentile in PERCENTILES], machines=1)
+def breakdown(machine: Machine, count: int = 20, workload: str = "true", **kwargs) -> dict:
+    """Break the start of a trivial workload down into phases, over many starts.
+
+    For a microVM the phases are the VMM process start, the API calls, the
+    kernel boot, init and the workload's first output. Kernel and root
+    filesystem variants are runtime arguments, and so dimensions, e.g.
+    --kernel=vmlinux-5.10 --kernel=vmlinux-6.1 for Firecracker.
+
+    :param machine: machine object
+    :param kwargs:
+        :param count: Number of starts.
+        :param workload: The workload to start; it must have echo.
+    :return: The seconds of each start's phases, by phase.
+    """
+    image = machine.pull(workload)
+    phases = {}
+    for _ in range(count):
+        container = machine.container(image, command="echo ready", **kwargs)
+        launched = time.time()
+        first = None
+        for timestamp, _ in container.stream():
+            first = first or timestamp
+        reported = container.boot_phases()
+        if not reported and first is not None:
+            reported = {"total": first - launched}
+        for phase, seconds in reported.items():
+            phases.setdefault(phase, []).append(seconds)
+    return phases
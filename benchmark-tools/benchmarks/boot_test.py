@@ -0,0 +1,58 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the boot-time breakdown."""
+
+import time
+
+from benchmarks import boot
+from harness.container import Container
+from harness.machine import MockMachine
+
+
+class PhasedContainer(Container):
+    """Container printing one line, and reporting some boot phases."""
+
+    def __init__(self, phases: dict):
+        self._phases = phases
+
+    def stream(self, **env):
+        yield time.time(), "ready\n"
+
+    def boot_phases(self) -> dict:
+        return self._phases
+
+
+class PhasedMachine(MockMachine):
+    """Mock machine of phased containers."""
+
+    def __init__(self, phases: dict):
+        self._phases = phases
+
+    def container(self, image: str, **kwargs) -> Container:
+        return PhasedContainer(self._phases)
+
+
+def test_measured_phases_only():
+    """Test only the phases the runtime measured are reported."""
+    phases = {"vmm": 0.01, "kernel": 0.1, "total": 0.2}
+    results = dict(boot.breakdown(PhasedMachine(phases), runtime="runc", count=3))
+    assert sorted(results) == sorted("%s_%s_ms" % (phase, percentile) for phase in phases
+                                     for percentile in boot.PERCENTILES)
+    assert results["kernel_p50_ms"] == 100.0
+
+
+def test_total_only():
+    """Test runtimes reporting no phases get the total alone."""
+    results = dict(boot.breakdown(PhasedMachine({}), runtime="runc", count=2,
+                                  metric=["total_p50_ms", "vmm_p50_ms"]))
+    assert list(results) == ["total_p50_ms"]
@@ -12,6 +12,10 @@
 # limitations under the License.
 """Density tests."""
 
+import contextlib
+import csv
+import logging
+import math
 import re
 import types
 
@@ -22,8 +26,32 @@ from harness.container import Container
 
 #pylint: disable-msg=unused-argument
 def memory_usage(value, **kwargs):
-    """Returns the passed value."""
-    return value
+    """Returns the average memory usage per container in bytes, from /proc/meminfo."""
+    return value["memory_usage"]
+
+
+def _distribution(field: str, description: str, percentile: int) -> types.FunctionType:
+    """Returns a metric for a percentile of a per-container memory field."""
+    def metric(value, **kwargs):
+        samples = sorted(usage[field] for usage in value["containers"].values())
+        if not samples:
+            return 0.0
+        # Nearest rank.
+        return float(samples[max(0, math.ceil(percentile / 100 * len(samples)) - 1)])
+    metric.__name__ = "%s_p%d" % (field, percentile)
+    metric.__doc__ = "Returns the p%d of %s per container in bytes." % (percentile, description)
+    return metric
+
+
+# DENSITY_METRICS are memory_usage and the distribution over containers of
+# the accounting from helpers.container_memory.
+DENSITY_METRICS = [memory_usage] + [
+    _distribution(field, description, percentile)
+    for field, description in [("pss", "the proportional set size"),
+                               ("uss", "the unique set size"),
+                               ("cgroup", "the cgroup memory usage"),
+                               ("kernel", "the kernel memory charged to the cgroup")]
+    for percentile in (50, 90, 100)]
 
 
 def density(machine: Machine, workload: str, count: int = 50, wait: float = 0,
@@ -36,13 +64,14 @@ def density(machine: Machine, workload: str, count: int = 50, wait: float = 0,
     :param wait: The time to wait after starting.
     :param load_func: Callback that is called after 'count' 'images' have
     been started on 'machine'.
-    :return: The average usage in Kb per container.
+    :return: a dict of "memory_usage", the average usage in bytes per
+        container from /proc/meminfo, and "containers", the per container
+        accounting from helpers.container_memory.
     """
     count = int(count)
 
     # Drop all caches.
-    helpers.drop_caches(machine)
-    before = machine.read("/proc/meminfo")
+    _, before = helpers.drop_caches(machine)
 
     # Load the workload.
     image = machine.pull(workload)
@@ -55,14 +84,17 @@ def density(machine: Machine, workload: str, count: int = 50, wait: float = 0,
         machine.sleep(wait)
 
         # Drop caches again.
-        helpers.drop_caches(machine)
-        after = machine.read("/proc/meminfo")
+        _, after = helpers.drop_caches(machine)
+        usage = helpers.container_memory(machine, containers)
 
     # Calculate the memory used.
     available_re = re.compile(r"MemAvailable:\s*(\d+)\skB\n")
     before_available = available_re.findall(before)
     after_available = available_re.findall(after)
-    return 1024 * float(int(before_available[0]) - int(after_available[0]))/float(count)
+    return {
+        "memory_usage": 1024 * float(int(before_available[0]) - int(after_available[0]))/float(count),
+        "containers": usage,
+    }
 
 
 def load_redis(machine: Machine, containers: Container):
@@ -73,8 +105,8 @@ def load_redis(machine: Machine, containers: Container):
         machine.container("redisbenchmark", links={name: name}).run(host=name, flags=flags)
 
 
-@benchmark(metrics=[memory_usage], machines=1)
-def empty(machine: Machine, **kwargs) -> float:
+@benchmark(metrics=DENSITY_METRICS, machines=1)
+def empty(machine: Machine, **kwargs) -> dict:
     """Run trivial containers in a density test.
 
     :param count: The container count.
@@ -82,8 +114,8 @@ def empty(machine: Machine, **kwargs) -> float:
     return density(machine, workload="sleep", wait=1.0, **kwargs)
 
 
-@benchmark(metrics=[memory_usage], machines=1)
-def node(machine: Machine, **kwargs) -> float:
+@benchmark(metrics=DENSITY_METRICS, machines=1)
+def node(machine: Machine, **kwargs) -> dict:
     """Run node containers in a density test.
 
     :param count: The container count.
@@ -91,8 +123,8 @@ def node(machine: Machine, **kwargs) -> float:
     return density(machine, workload="node", wait=3.0, **kwargs)
 
 
-@benchmark(metrics=[memory_usage], machines=1)
-def ruby(machine: Machine, **kwargs) -> float:
+@benchmark(metrics=DENSITY_METRICS, machines=1)
+def ruby(machine: Machine, **kwargs) -> dict:
     """Run ruby containers in a density test.
 
     :param count: The container count.
@@ -100,8 +132,8 @@ def ruby(machine: Machine, **kwargs) -> float:
     return density(machine, workload="ruby", wait=3.0, **kwargs)
 
 
-@benchmark(metrics=[memory_usage], machines=1)
-def redis(machine: Machine, **kwargs) -> float:
+@benchmark(metrics=DENSITY_METRICS, machines=1)
+def redis(machine: Machine, **kwargs) -> dict:
     """Run redis containers in a density test.
 
     :param count: The container count.
@@ -109,3 +141,210 @@ def redis(machine: Machine, **kwargs) -> float:
     if "count" not in kwargs:
         kwargs["count"] = 5
     return density(machine, workload="redis", wait=3.0, load_func=load_redis, **kwargs)
+
+
+def probe_startup(machine: Machine) -> float:
+    """Returns the seconds taken to start and run a trivial container."""
+    image = machine.pull("true")
+    with helpers.Timer() as timer:
+        machine.container(image).run()
+        return timer.elapsed()
+
+
+#pylint: disable-msg=too-many-arguments,too-many-locals
+def density_curve(machine: Machine, workload: str, step: int = 10, max_count: int = 100,
+                  max_latency: float = 1.0, min_available: float = 0.1, wait: float = 0,
+                  load_func: types.FunctionType = None,
+                  probe_func: types.FunctionType = probe_startup, **kwargs) -> list:
+    """Adds containers in steps, measuring memory and responsiveness after each.
+
+    Containers from earlier steps keep running, so a single launch measures
+    the whole curve. It stops after the step that crosses a threshold.
+
+    :param machine: A machine object.
+    :param workload: The workload to run.
+    :param step: The number of containers added per step.
+    :param max_count: The number of containers to stop at.
+    :param max_latency: The probe latency in seconds to stop at.
+    :param min_available: The fraction of memory available to stop at.
+    :param wait: The time to wait after each step.
+    :param load_func: Callback that is called with each step's containers.
+    :param probe_func: Callback returning a latency in seconds.
+    :return: a list of dicts, one per step, of "count", "memory_usage" (the
+        average usage in bytes per container), "available" (bytes),
+        "latency" (seconds) and "within" (whether no threshold was crossed).
+    """
+    _, before = helpers.drop_caches(machine)
+    baseline = helpers.parse_meminfo(before)["MemAvailable"]
+    image = machine.pull(workload)
+    points = []
+    with contextlib.ExitStack() as stack:
+        count = 0
+        while count < max_count:
+            batch = min(step, max_count - count)
+            containers = stack.enter_context(
+                machine.container(image=image, count=batch, **kwargs).detach())
+            count += batch
+            if load_func:
+                load_func(machine, containers)
+            machine.sleep(wait)
+
+            _, after = helpers.drop_caches(machine)
+            meminfo = helpers.parse_meminfo(after)
+            latency = probe_func(machine)
+            within = latency <= max_latency and \
+                meminfo["MemAvailable"] >= min_available * meminfo["MemTotal"]
+            points.append({
+                "count": count,
+                "memory_usage": 1024 * float(baseline - meminfo["MemAvailable"]) / count,
+                "available": 1024 * meminfo["MemAvailable"],
+                "latency": latency,
+                "within": within,
+            })
+            logging.info("density curve %s: %s", workload, points[-1])
+            if not within:
+                break
+    return points
+
+
+def max_containers(value, **kwargs):
+    """Returns the largest container count reached within the thresholds."""
+    return max([point["count"] for point in value if point["within"]], default=0)
+
+
+def marginal_memory(value, **kwargs):
+    """Returns the memory in bytes used by each added container (the slope of the curve)."""
+    if len(value) < 2:
+        return value[0]["memory_usage"] if value else 0.0
+    counts = [point["count"] for point in value]
+    used = [point["memory_usage"] * point["count"] for point in value]
+    mean_count = sum(counts) / len(counts)
+    mean_used = sum(used) / len(used)
+    return sum((c - mean_count) * (u - mean_used) for c, u in zip(counts, used)) / \
+        sum((c - mean_count) ** 2 for c in counts)
+
+
+def probe_latency(value, **kwargs):
+    """Returns the probe latency in seconds at the largest count within the thresholds."""
+    within = [point["latency"] for point in value if point["within"]]
+    return within[-1] if within else 0.0
+
+
+# LOAD_FUNCS are the load callbacks that can be named by the curve benchmark.
+LOAD_FUNCS = {"redis": load_redis}
+
+
+@benchmark(metrics=[max_containers, marginal_memory, probe_latency], machines=1)
+def curve(machine: Machine, workload: str = "sleep", step: int = 10, max_count: int = 100,
+          max_latency: float = 1.0, min_available: float = 0.1, wait: float = 1.0,
+          load: str = "", curve_file: str = "", **kwargs) -> list:
+    """Measure a density curve, adding containers until a threshold.
+
+    :param workload: The workload to run.
+    :param step: The number of containers added per step.
+    :param max_count: The number of containers to stop at.
+    :param max_latency: The container startup latency in seconds to stop at.
+    :param min_available: The fraction of memory available to stop at.
+    :param load: The load to apply to each step's containers (e.g. redis).
+    :param curve_file: A csv file to write every step to.
+    """
+    points = density_curve(machine, workload=workload, step=step, max_count=max_count,
+                           max_latency=max_latency, min_available=min_available,
+                           wait=wait, load_func=LOAD_FUNCS[load] if load else None, **kwargs)
+    if curve_file:
+        with open(curve_file, "w", newline="") as curve_csv:
+            writer = csv.DictWriter(curve_csv, fieldnames=list(points[0].keys()))
+            writer.writeheader()
+            writer.writerows(points)
+    return points
+
+
+#pylint: disable-msg=too-many-arguments
+def density_reclaim(machine: Machine, workload: str, count: int = 10, duration: float = 60,
+                    interval: float = 5, pressure: int = 0,
+                    load_func: types.FunctionType = None, **kwargs) -> list:
+    """Samples container memory and KSM counters over time after launch.
+
+    :param machine: A machine object.
+    :param workload: The workload to run.
+    :param count: The number of containers to start.
+    :param duration: The seconds to sample for after launch.
+    :param interval: The seconds between samples.
+    :param pressure: If non-zero, the bytes to reclaim from each container
+        after the first sample.
+    :param load_func: Callback that is called after the containers start.
+    :return: a list of samples, each a dict of "time" (seconds since the
+        first sample), "ksm" (helpers.read_ksm) and "containers"
+        (helpers.container_memory).
+    """
+    image = machine.pull(workload)
+    samples = []
+    with machine.container(image=image, count=count, **kwargs).detach() as containers:
+        if load_func:
+            load_func(machine, containers)
+        timer = helpers.Timer()
+        for index in range(int(duration / interval) + 1):
+            if index:
+                machine.sleep(interval)
+            samples.append({
+                "time": timer.elapsed(),
+                "ksm": helpers.read_ksm(machine),
+                "containers": helpers.container_memory(machine, containers),
+            })
+            if not index and pressure:
+                helpers.reclaim_containers(machine, containers, pressure)
+    return samples
+
+
+def _pss_range(value) -> list:
+    """Returns (first, lowest) PSS in bytes of every container sampled."""
+    names = value[0]["containers"].keys() if value else []
+    return [(value[0]["containers"][name]["pss"],
+             min(sample["containers"][name]["pss"] for sample in value
+                 if name in sample["containers"]))
+            for name in names]
+
+
+def reclaimable_memory(value, **kwargs):
+    """Returns the average bytes per container released after launch (KSM, reclaim, balloon)."""
+    ranges = _pss_range(value)
+    if not ranges:
+        return 0.0
+    return sum(first - lowest for first, lowest in ranges) / len(ranges)
+
+
+def pinned_memory(value, **kwargs):
+    """Returns the average bytes per container that were never released."""
+    ranges = _pss_range(value)
+    if not ranges:
+        return 0.0
+    return sum(lowest for _, lowest in ranges) / len(ranges)
+
+
+def ksm_saved(value, **kwargs):
+    """Returns the bytes per container saved by KSM at the end of sampling."""
+    ksm = value[-1]["ksm"] if value else {}
+    containers = len(value[-1]["containers"]) if value else 0
+    if not ksm or not containers:
+        return 0.0
+    return float(ksm["pages_sharing"] * ksm["page_size"]) / containers
+
+
+@benchmark(metrics=[reclaimable_memory, pinned_memory, ksm_saved], machines=1)
+def reclaim(machine: Machine, workload: str = "sleep", count: int = 10, duration: float = 60,
+            interval: float = 5, pressure: int = 0, load: str = "", **kwargs) -> list:
+    """Measure how much container memory is released over time after launch.
+
+    Memory merged by KSM, reclaimed by the kernel or returned by a VM
+    balloon shows up as a drop in each sandbox's PSS.
+
+    :param workload: The workload to run.
+    :param count: The container count.
+    :param duration: The seconds to sample for.
+    :param interval: The seconds between samples.
+    :param pressure: The bytes to reclaim from each container, if any.
+    :param load: The load to apply to the containers (e.g. redis).
+    """
+    return density_reclaim(machine, workload=workload, count=count, duration=duration,
+                           interval=interval, pressure=pressure,
+                           load_func=LOAD_FUNCS[load] if load else None, **kwargs)
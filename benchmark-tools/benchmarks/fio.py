@@ -12,10 +12,11 @@
 # limitations under the License.
 """File I/O tests."""
 
-import os
+import re
 
 from benchmarks import benchmark, helpers
 from harness.machine import Machine
+from harness.storage import default_backend, provision
 from workloads.fio import read_bandwidth, write_bandwidth
 from workloads.fio import read_io_ops, write_io_ops
 
@@ -33,6 +34,8 @@ def fio(machine: Machine,
         filename: str = "file.dat",
         tmpfs: bool = False,
         ramp_time: int = 0,
+        options: str = "",
+        backend: str = "",
         **kwargs: dict) -> str:
     """
     For more on fio see:
@@ -47,63 +50,65 @@ def fio(machine: Machine,
     :param filename: name of the file to creat inside container. For a path of /dir/dir/file,
     the script setup a volume like 'docker run -v mount_dir:/dir/dir fio' and fio will create
     (and delete) the file /dir/dir/file. If tmpfs is set, this /dir/dir will be a tmpfs.
-    :param mount_dir: absolute path on the host to mount a bind mount.
-    :param tmpfs: if true, mount on tmpfs.
+    :param mount_dir: absolute path on the host to mount a bind mount, or of
+    the loop image or raw file.
+    :param tmpfs: if true, mount on tmpfs (the tmpfs backend).
     :param ramp_time: time to run before recording statistics
+    :param options: additional fio options for the test, e.g. "--numjobs=4".
+    :param backend: the storage backend of the file: bind (the default, or
+    overlay for firecracker), tmpfs, overlay, loop or raw (see harness/storage.py).
+    The raw file is the only file, so raw needs one file and one job.
     :return: The output of fio as a string.
+    :raises ValueError: if options ask for several files or jobs of a raw file.
     """
+    if backend == "raw" and any(
+            int(count) > 1 for count in re.findall(r"--(?:nrfiles|numjobs)=(\d+)", options)):
+        raise ValueError("the raw backend is a single file: use --nrfiles=1 and --numjobs=1")
     # Pull the image before dropping caches.
     image = machine.pull("fio")
 
-    if not mount_dir:
-        stdout, _ = machine.run("pwd")
-        mount_dir = stdout.rstrip()
-
-    # Setup the volumes.
-    volumes = {mount_dir: {"bind": "/disk", "mode": "rw"}} if not tmpfs else None
-    tmpfs = {"/disk": ""} if tmpfs else None
-
-    # Construct a file in the volume.
-    filepath = os.path.join("/disk", filename)
-
-    # If we are running a read test, us fio to write a file and then flush file
-    # data from memory.
-    if "read" in test:
-        machine.container(image, volumes=volumes, tmpfs=tmpfs, **kwargs).run(
-            test="write", ioengine="sync", size=size, iodepth=iodepth, blocksize=blocksize,
-            path=filepath)
-        helpers.drop_caches(machine)
-
-    # Run the test.
-    time_str = "--time_base --runtime={time}".format(time=time) if int(time) > 0 else ""
-    res = machine.container(image, volumes=volumes, tmpfs=tmpfs, **kwargs).run(
-        test=test, ioengine=ioengine, size=size, iodepth=iodepth, blocksize=blocksize,
-        time=time_str, path=filepath, ramp_time=ramp_time)
-
-    machine.run("rm {path}".format(path=os.path.join(mount_dir.rstrip(), filename)))
-
-    return res
-
-
-@benchmark(metrics=[read_bandwidth, read_io_ops], machines=1)
+    if not backend:
+        backend = "tmpfs" if tmpfs else default_backend(kwargs.get("runtime", ""))
+    with provision(machine, backend, filename, size, directory=mount_dir,
+                   runtime=kwargs.get("runtime", "")) as (volumes, filepath):
+        # If we are running a read test, us fio to write a file and then flush file
+        # data from memory.
+        if "read" in test:
+            machine.container(image, **volumes, **kwargs).run(
+                test="write", ioengine="sync", size=size, iodepth=iodepth, blocksize=blocksize,
+                path=filepath)
+            helpers.drop_caches(machine)
+
+        # Run the test.
+        time_str = "--time_base --runtime={time}".format(time=time) if int(time) > 0 else ""
+        return machine.container(image, **volumes, **kwargs).run(
+            test=test, ioengine=ioengine, size=size, iodepth=iodepth, blocksize=blocksize,
+            time=time_str, path=filepath, ramp_time=ramp_time, options=options)
+
+
+@benchmark(metrics=[read_bandwidth, read_io_ops], machines=1,
+           throughput=[read_bandwidth, read_io_ops])
 def read(*args, **kwargs):
     """Read test.\n"""
     return fio(*args, test="read", **kwargs)
 
 
-@benchmark(metrics=[read_bandwidth, read_io_ops], machines=1)
+@benchmark(metrics=[read_bandwidth, read_io_ops], machines=1,
+           throughput=[read_bandwidth, read_io_ops])
 def randread(*args, **kwargs):
     """Random read test.\n"""
     return fio(*args, test="randread", **kwargs)
 
 
-@benchmark(metrics=[write_bandwidth, write_io_ops], machines=1)
+@benchmark(metrics=[write_bandwidth, write_io_ops], machines=1,
+           throughput=[write_bandwidth, write_io_ops])
 def write(*args, **kwargs):
     """Write test.\n"""
     return fio(*args, test="write", **kwargs)
 
 
-@benchmark(metrics=[write_bandwidth, write_io_ops], machines=1)
+@benchmark(metrics=[write_bandwidth, write_io_ops], machines=1,
+           throughput=[write_bandwidth, write_io_ops])
 def randwrite(*args, **kwargs):
     """Random write test.\n"""
     return fio(*args, test="randwrite", **kwargs)
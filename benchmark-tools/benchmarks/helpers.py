@@ -12,7 +12,11 @@
 # limitations under the License.
 """Benchmark helpers."""
 
+import logging
+import re
+import types
 from datetime import datetime
+from harness.container import Container
 from harness.machine import Machine
 
 class Timer:
@@ -41,12 +45,252 @@ class Timer:
         pass
 
 
-def drop_caches(machine: Machine):
+# DROP_CACHES_SCRIPT prepares the host's cache state in a single command:
+# writeback, drop the page cache and slab objects, compact free memory so
+# that huge pages can be formed, and let the kernel settle. It prints the
+# time the preparation took, followed by the resulting /proc/meminfo.
+DROP_CACHES_SCRIPT = """sudo sh -c '
+start=$(date +%s%N)
+sync
+echo 3 > /proc/sys/vm/drop_caches
+if [ -w /proc/sys/vm/compact_memory ]; then echo 1 > /proc/sys/vm/compact_memory; fi
+sleep {settle}
+echo 3 > /proc/sys/vm/drop_caches
+echo elapsed_ns: $(($(date +%s%N) - start))
+cat /proc/meminfo
+'"""
+
+# MAX_CACHED_FRACTION is the fraction of total memory that may still be held
+# by reclaimable caches after a drop before a warning is logged.
+MAX_CACHED_FRACTION = 0.05
+
+
+def parse_meminfo(data: str) -> dict:
+    """Parses /proc/meminfo.
+
+    :param data: contents of /proc/meminfo.
+    :return: a dict of field names to values in kB.
+    """
+    return {key: int(value) for key, value in
+            re.findall(r"^(\w+(?:\(\w+\))?):\s*(\d+)", data, re.MULTILINE)}
+
+
+def drop_caches(machine: Machine, settle: float = 0.1) -> (float, str):
     """Drops caches on the machine.
 
+    The whole preparation is one machine.run call, so a remote machine pays
+    a single round trip. The resulting /proc/meminfo is checked for leftover
+    page cache.
+
     :param machine: A machine
-    :return: None
+    :param settle: seconds to wait after compacting memory.
+    :return: the seconds the drop took and the /proc/meminfo afterwards.
+    """
+    stdout, _ = machine.run(DROP_CACHES_SCRIPT.format(settle=settle))
+    match = re.search(r"^elapsed_ns: (\d+)$", stdout, re.MULTILINE)
+    if match is None:
+        # Nothing was printed (e.g. a mock machine).
+        return 0.0, machine.read("/proc/meminfo")
+    elapsed = int(match.group(1)) / 1e9
+    meminfo = stdout[match.end():].lstrip("\n")
+    fields = parse_meminfo(meminfo)
+    cached = fields["Buffers"] + fields["Cached"] - fields.get("Shmem", 0)
+    if cached > MAX_CACHED_FRACTION * fields["MemTotal"]:
+        logging.warning("%d kB of page cache remain after dropping caches", cached)
+    logging.info("Dropped caches in %fs, %d kB available", elapsed, fields["MemAvailable"])
+    return elapsed, meminfo
+
+
+# CGROUP_DIR_FUNC defines a shell function setting "dir" to the memory cgroup
+# directory of the given pid, for cgroup v2 or v1, and "usage" to the name of
+# its usage file. It is pasted into the scripts below.
+CGROUP_DIR_FUNC = """cgroup_dir() {
+  cg=$(awk -F: '$1 == "0" {print $3}' /proc/$1/cgroup)
+  if [ -n "$cg" ] && [ -f /sys/fs/cgroup$cg/memory.current ]; then
+    dir=/sys/fs/cgroup$cg; usage=memory.current
+  else
+    cg=$(awk -F: '$2 ~ /(^|,)memory(,|$)/ {print $3}' /proc/$1/cgroup)
+    dir=/sys/fs/cgroup/memory$cg; usage=memory.usage_in_bytes
+  fi
+}"""
+
+# CONTAINER_MEMORY_SCRIPT dumps the memory accounting of containers in one
+# command. It is given "name:pid" arguments, where pid is the container's init
+# process. For each container it prints the cgroup usage and memory.stat, then
+# the smaps_rollup totals of every process in the cgroup, plus the runtime
+# shim the init process hangs off, which lives outside the cgroup.
+CONTAINER_MEMORY_SCRIPT = """sudo sh -s -- {containers} <<'EOF'
+{cgroup_dir}
+for entry in "$@"; do
+  name=${{entry%:*}}; pid=${{entry##*:}}
+  cgroup_dir $pid
+  echo "container $name"
+  echo "usage $(cat $dir/$usage)"
+  sed 's/^/stat /' $dir/memory.stat
+  ppid=$(awk '/^PPid:/ {{print $2}}' /proc/$pid/status)
+  shim=
+  case "$(cat /proc/$ppid/comm)" in containerd-shim*) shim=$ppid;; esac
+  for proc in $(cat $dir/cgroup.procs) $shim; do
+    echo "process $proc $(cat /proc/$proc/comm)"
+    grep -E '^(Rss|Pss|Private_Clean|Private_Dirty):' /proc/$proc/smaps_rollup
+  done
+done
+EOF"""
+
+
+def parse_container_memory(data: str) -> dict:
+    """Parses the output of CONTAINER_MEMORY_SCRIPT.
+
+    :param data: the script output.
+    :return: a dict of container names to a dict with the cgroup "usage" and
+        its memory.stat "stat" in bytes, and "processes", a dict of pids to the
+        process name ("comm") and smaps_rollup totals in kB.
+    """
+    result = {}
+    current = process = None
+    for line in data.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0] == "container":
+            current = result[fields[1]] = {"usage": 0, "stat": {}, "processes": {}}
+        elif current is None:
+            continue
+        elif fields[0] == "usage" and len(fields) == 2:
+            current["usage"] = int(fields[1])
+        elif fields[0] == "stat" and len(fields) == 3:
+            current["stat"][fields[1]] = int(fields[2])
+        elif fields[0] == "process" and len(fields) >= 2:
+            process = current["processes"][int(fields[1])] = {"comm": " ".join(fields[2:])}
+        elif process is not None and fields[0].endswith(":"):
+            process[fields[0].rstrip(":")] = int(fields[1])
+    return result
+
+
+def container_memory(machine: Machine, containers: Container) -> dict:
+    """Measures the memory used by each running container.
+
+    :param machine: the machine running the containers.
+    :param containers: the running containers.
+    :return: a dict of container names to a dict of, in bytes: "rss", "pss"
+        and "uss" (resident, proportional and unique set size summed over the
+        container's processes, including runtime helpers), "cgroup" (cgroup usage),
+        "user" (anonymous and file pages charged to the cgroup) and "kernel"
+        (the rest of the cgroup usage: slab, stacks, page tables, sockets).
+    """
+    pids = ["%s:%d" % (name, pid) for name, pid in containers.get_pids()]
+    if not pids:
+        return {}
+    stdout, _ = machine.run(CONTAINER_MEMORY_SCRIPT.format(
+        cgroup_dir=CGROUP_DIR_FUNC, containers=" ".join(pids)))
+    result = {}
+    for name, info in parse_container_memory(stdout).items():
+        processes = info["processes"].values()
+        stat = info["stat"]
+        if "anon" in stat:
+            user = stat["anon"] + stat.get("file", 0)
+        else:
+            # cgroup v1 names.
+            user = stat.get("rss", 0) + stat.get("cache", 0)
+        result[name] = {
+            "rss": 1024 * sum(process.get("Rss", 0) for process in processes),
+            "pss": 1024 * sum(process.get("Pss", 0) for process in processes),
+            "uss": 1024 * sum(process.get("Private_Clean", 0) +
+                              process.get("Private_Dirty", 0) for process in processes),
+            "cgroup": info["usage"],
+            "user": user,
+            "kernel": max(info["usage"] - user, 0),
+        }
+    return result
+
+
+# RECLAIM_SCRIPT asks the kernel to reclaim memory from the cgroup of each
+# given pid (cgroup v2 memory.reclaim), as if the host were under pressure.
+RECLAIM_SCRIPT = """sudo sh -s -- {pids} <<'EOF'
+{cgroup_dir}
+for pid in "$@"; do
+  cgroup_dir $pid
+  if [ -f $dir/memory.reclaim ]; then
+    echo {amount} > $dir/memory.reclaim || true
+  else
+    echo "no memory.reclaim for $pid" >&2
+  fi
+done
+EOF"""
+
+
+def reclaim_containers(machine: Machine, containers: Container, amount: int):
+    """Applies memory pressure to each running container's cgroup.
+
+    :param machine: the machine running the containers.
+    :param containers: the running containers.
+    :param amount: the bytes to try to reclaim from each container.
+    """
+    pids = [str(pid) for _, pid in containers.get_pids()]
+    _, stderr = machine.run(RECLAIM_SCRIPT.format(
+        cgroup_dir=CGROUP_DIR_FUNC, pids=" ".join(pids), amount=amount))
+    if stderr:
+        logging.warning("Memory pressure not applied: %s", stderr.strip())
+
+
+# KSM_PATH is where the kernel exposes same-page merging counters.
+KSM_PATH = "/sys/kernel/mm/ksm"
+
+
+def read_ksm(machine: Machine) -> dict:
+    """Reads the kernel same-page merging counters in one round trip.
+
+    :param machine: A machine.
+    :return: a dict of counter names (e.g. pages_sharing) to values, plus
+        "page_size" in bytes. Empty if KSM is not available.
+    """
+    stdout, _ = machine.run("echo page_size:$(getconf PAGESIZE); grep -s . %s/*" % KSM_PATH)
+    result = {}
+    for line in stdout.splitlines():
+        key, _, value = line.rpartition(":")
+        if value.strip().lstrip("-").isdigit():
+            result[key.rsplit("/", 1)[-1]] = int(value)
+    return result if len(result) > 1 else {}
+
+
+class StreamedOutput(str):
+    """Output collected from a container stream.
+
+    The string holds only the lines that were kept; series maps each progress
+    metric name to a list of (seconds since the first line, value) samples and
+    elapsed is the time in seconds taken to start and drain the stream.
+    """
+    series = None
+    elapsed = None
+
+
+def parse_stream(lines: types.GeneratorType, progress: dict = None,
+                 keep: str = None) -> StreamedOutput:
+    """Consumes a container stream, sampling progress metrics as lines arrive.
+
+    :param lines: (timestamp, line) tuples, as yielded by Container.stream.
+    :param progress: map of metric names to functions taking a single line and
+        returning a value, or None if the line carries no sample.
+    :param keep: a regular expression; only matching lines are kept for the
+        final metric functions. All lines are kept if None.
+    :return: the kept output, with the progress series attached.
     """
-    machine.run("sudo sync")
-    machine.run("sudo sysctl vm.drop_caches=3")
-    machine.run("sudo sysctl vm.drop_caches=3")
+    progress = progress or {}
+    keep = re.compile(keep) if keep is not None else None
+    series = {name: [] for name in progress}
+    kept = []
+    start = None
+    timer = Timer()
+    for timestamp, line in lines:
+        if start is None:
+            start = timestamp
+        for name, func in progress.items():
+            value = func(line)
+            if value is not None:
+                series[name].append((timestamp - start, value))
+        if keep is None or keep.search(line):
+            kept.append(line)
+    output = StreamedOutput("".join(kept))
+    output.series = series
+    output.elapsed = timer.elapsed()
+    return output
@@ -0,0 +1,104 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for benchmark helpers."""
+
+from benchmarks import helpers
+from harness.machine import MockMachine
+
+
+class PreparedMachine(MockMachine):
+    """Mock machine answering the drop caches script."""
+
+    def __init__(self):
+        super().__init__()
+        self.commands = []
+
+    def run(self, cmd: str) -> (str, str):
+        self.commands.append(cmd)
+        return "elapsed_ns: 250000000\n" + self.read("proc/meminfo"), ""
+
+
+def test_parse_meminfo():
+    """Test parse_meminfo."""
+    fields = helpers.parse_meminfo(MockMachine().read("proc/meminfo"))
+    assert fields["MemTotal"] == 7652344
+    assert fields["MemAvailable"] == 7152008
+
+
+def test_drop_caches():
+    """Test the drop is a single command and reports its time and meminfo."""
+    machine = PreparedMachine()
+    elapsed, meminfo = helpers.drop_caches(machine)
+    assert len(machine.commands) == 1
+    assert elapsed == 0.25
+    assert meminfo.startswith("MemTotal:")
+
+
+SAMPLE_CONTAINER_MEMORY = """container redis
+usage 10485760
+stat anon 6291456
+stat file 2097152
+process 100 redis-server
+Rss:                5000 kB
+Pss:                4000 kB
+Private_Clean:      1000 kB
+Private_Dirty:      2000 kB
+process 90 containerd-shim
+Rss:                3000 kB
+Pss:                1000 kB
+Private_Clean:         0 kB
+Private_Dirty:       500 kB
+"""
+
+
+class Containers:
+    """Stands in for running containers."""
+
+    def get_pids(self):
+        """Returns one container."""
+        yield "redis", 100
+
+
+class AccountingMachine(MockMachine):
+    """Mock machine answering the container memory script."""
+
+    def run(self, cmd: str) -> (str, str):
+        assert "redis:100" in cmd
+        return SAMPLE_CONTAINER_MEMORY, ""
+
+
+def test_container_memory():
+    """Test processes are summed and the cgroup is split into user and kernel."""
+    usage = helpers.container_memory(AccountingMachine(), Containers())
+    assert usage == {"redis": {
+        "rss": 8000 * 1024,
+        "pss": 5000 * 1024,
+        "uss": 3500 * 1024,
+        "cgroup": 10485760,
+        "user": 8388608,
+        "kernel": 2097152,
+    }}
+
+
+class KSMMachine(MockMachine):
+    """Mock machine answering the KSM counters."""
+
+    def run(self, cmd: str) -> (str, str):
+        return ("page_size:4096\n/sys/kernel/mm/ksm/pages_sharing:1200\n"
+                "/sys/kernel/mm/ksm/run:1\n"), ""
+
+
+def test_read_ksm():
+    """Test read_ksm."""
+    assert helpers.read_ksm(KSMMachine()) == {"page_size": 4096, "pages_sharing": 1200, "run": 1}
+    assert helpers.read_ksm(MockMachine()) == {}
@@ -91,25 +91,28 @@ def http_app(server: Machine,
                 connections=connections, path=path)
 
 
-@benchmark(metrics=[transfer_rate, latency], machines=2)
+@benchmark(metrics=[transfer_rate, latency], machines=2, throughput=[transfer_rate])
 def httpd(*args, **kwargs) -> str:
     """Apache2 benchmark."""
     return http(*args, workload="httpd", port=80, **kwargs)
 
 
-@benchmark(metrics=[transfer_rate, latency, requests_per_second], machines=2)
+@benchmark(metrics=[transfer_rate, latency, requests_per_second], machines=2,
+           throughput=[transfer_rate, requests_per_second])
 def nginx(*args, **kwargs) -> str:
     """Nginx benchmark."""
     return http(*args, workload="nginx", port=80, **kwargs)
 
 
-@benchmark(metrics=[transfer_rate, latency, requests_per_second], machines=2)
+@benchmark(metrics=[transfer_rate, latency, requests_per_second], machines=2,
+           throughput=[transfer_rate, requests_per_second])
 def node(*args, **kwargs) -> str:
     """Node benchmark."""
     return http_app(*args, workload="node_template", path='', port=8080, **kwargs)
 
 
-@benchmark(metrics=[transfer_rate, latency, requests_per_second], machines=2)
+@benchmark(metrics=[transfer_rate, latency, requests_per_second], machines=2,
+           throughput=[transfer_rate, requests_per_second])
 def ruby(*args, **kwargs) -> str:
     """Ruby benchmark."""
     return http_app(*args, workload="ruby_template", path='', port=9292, **kwargs)
@@ -15,14 +15,18 @@
 from benchmarks import benchmark
 import benchmarks.helpers as helpers
 from harness.machine import Machine
-from workloads.ffmpeg import run_time
+from workloads.ffmpeg import fps, mean_fps, run_time
 
 
-@benchmark(metrics=[run_time], machines=1)
-def ffmpeg(machine: Machine, **kwargs) -> float:
+@benchmark(metrics=[run_time, mean_fps], machines=1)
+def ffmpeg(machine: Machine, input_file: str = "video.mp4", **kwargs) -> helpers.StreamedOutput:
     """Runs a video transcoding workload and times it.
 
+    Progress is read from the container log as it is written, sampling the
+    transcoding rate over time.
+
     :param machine: a machine object.
+    :param input_file: the video to transcode, in the image's /media.
     """
     # Load before timing.
     image = machine.pull("ffmpeg")
@@ -30,7 +34,8 @@ def ffmpeg(machine: Machine, **kwargs) -> float:
     # Drop caches.
     helpers.drop_caches(machine)
 
-    # Time startup + transcoding.
-    with helpers.Timer() as timer:
-        machine.container(image, **kwargs).run()
-        return timer.elapsed()
+    # Time startup + transcoding. ffmpeg reports progress on stderr; only
+    # the final size summary is kept.
+    container = machine.container(image, stderr=True, **kwargs)
+    return helpers.parse_stream(container.stream(input=input_file), progress={"fps": fps},
+                                keep=r"^video:")
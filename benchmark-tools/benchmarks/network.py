@@ -50,7 +50,7 @@ def iperf(client: Machine,
         return res
 
 
-@benchmark(metrics=[bandwidth], machines=2)
+@benchmark(metrics=[bandwidth], machines=2, throughput=[bandwidth])
 def upload(client: Machine, server: Machine, **kwargs) -> str:
     """Measure upload performance.
 
@@ -63,7 +63,7 @@ def upload(client: Machine, server: Machine, **kwargs) -> str:
     return iperf(client, server, client_kwargs=kwargs)
 
 
-@benchmark(metrics=[bandwidth], machines=2)
+@benchmark(metrics=[bandwidth], machines=2, throughput=[bandwidth])
 def download(client: Machine, server: Machine, **kwargs) -> str:
     """Measure download performance.
 
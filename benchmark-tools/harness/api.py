@@ -0,0 +1,191 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Programmatic interface to run benchmarks in process.
+
+perf.py is a command line front end to the same functions. Other runners
+(e.g. experiments/) use a Session to run many benchmark points against one
+machine pool, without starting perf.py for each point:
+
+    with Session(env="examples/localhost.yaml") as session:
+        results = session.run("sysbench.cpu", threads=4)
+        print(results.median("cpu_events_per_second"))
+"""
+
+import pkgutil
+import pydoc
+import re
+import statistics
+
+from benchmarks import is_benchmark
+import harness.machine_producers.mock_producer as mp
+import harness.machine_producers.replay_producer as rp
+import harness.machine_producers.vm_pool_producer as vp
+import harness.machine_producers.yaml_producer as yp
+from harness.benchmark_driver import BenchmarkDriver
+from harness.machine_producers.machine_producer import MachineProducer
+from harness.result_store import ResultStore
+
+
+def find_benchmarks(regex: str) -> list:
+    """Finds all available benchmarks.
+
+    :param regex: A pattern that the benchmark names must match.
+    :return: a (short_name, module, function) tuple for each match.
+    """
+    benchmarks = pydoc.locate("benchmarks")
+    pkgs = pkgutil.walk_packages(benchmarks.__path__, benchmarks.__name__ + '.')
+    found = []
+    for _, name, _ in pkgs:
+        mod = pydoc.locate(name)
+        funcs = [getattr(mod, x) for x in dir(mod)
+                 if is_benchmark(getattr(mod, x))]
+        for func in funcs:
+            # Use the short_name with the benchmarks. prefix stripped.
+            short_name = mod.__name__[len("benchmarks."):] + "." + func.__name__
+            # Add to the list if a pattern is provided.
+            if re.compile(regex).match(short_name):
+                found.append((short_name, mod, func))
+    return found
+
+
+def make_producer(env: str = None, mock: bool = False, replay: str = None,
+                  record: str = None, replay_latency: bool = False) -> MachineProducer:
+    """Returns the machine producer for exactly one of env, mock and replay.
+
+    :param env: a yaml file with machines, or with a pool of guests.
+    :param mock: whether to mock the machines.
+    :param replay: an archive to replay machine outputs from.
+    :param record: an archive to record all machine outputs to; the producer
+        then has a save() method.
+    :param replay_latency: whether replayed calls take as long as they were
+        recorded to, so that host-timed metrics replay too.
+    :raises ValueError: if not exactly one of env, mock and replay is set.
+    """
+    sources = len([source for source in (mock, env, replay) if source])
+    if sources > 1:
+        raise ValueError("more than one of --mock, --env and --replay are set: which one is it?")
+    if replay:
+        producer = rp.ReplayMachineProducer(replay, latency=replay_latency)
+    elif mock:
+        producer = mp.MockMachineProducer()
+    elif env:
+        producer = vp.pool_producer(env) or yp.YamlMachineProducer(env)
+    else:
+        raise ValueError("no enviroment provided: use --mock, --env or --replay.")
+    if record:
+        producer = rp.RecordingMachineProducer(producer, record)
+    return producer
+
+
+def store_iterations(store: ResultStore, name: str, driver: BenchmarkDriver, kwargs: dict,
+                     source: str = "perf.py"):
+    """Adds every iteration of a finished driver to a result store.
+
+    :param store: the result store.
+    :param name: the short name of the benchmark.
+    :param driver: the joined driver.
+    :param kwargs: the arguments of the benchmark. The runtime is stored as
+        the platform and the others as parameters.
+    :param source: the runner, as stored.
+    """
+    parameters = {key: value for key, value in kwargs.items()
+                  if key not in ("method", "metric", "runtime")}
+    for iteration in driver.iterations:
+        store.add(name, parameters, iteration["results"],
+                  platform=kwargs.get("runtime", ""),
+                  host=",".join(iteration["hosts"]), source=source,
+                  telemetry=iteration.get("telemetry", ()))
+
+
+class Results(dict):
+    """The results of a benchmark point: metric names to lists of values, one
+    per iteration.
+
+    :param results: the metric names and values.
+    :param telemetry: the host telemetry of each iteration, a list of one
+        Telemetry per machine, if sampled.
+    """
+
+    def __init__(self, results=(), telemetry: list = ()):
+        super().__init__(results)
+        self.telemetry = list(telemetry)
+
+    def median(self, metric: str) -> float:
+        """Returns the median of a metric.
+
+        :raises KeyError: if the benchmark did not report the metric.
+        """
+        return statistics.median(self[metric])
+
+
+class Session:
+    """Runs benchmarks in process against one machine producer.
+
+    :param producer: the producer to lease machines from. If not given, one
+        is made from env, mock, replay and record as in make_producer.
+    :param runs: the number of iterations of each point.
+    :param sampler: optional per-machine sampler factory, see BenchmarkDriver.
+    :param store: optional result store path; every iteration is added.
+    :param runtime: the default runtime, as perf.py's --runtime.
+    """
+
+    # pylint: disable-msg=too-many-arguments
+    def __init__(self, producer: MachineProducer = None, runs: int = 1, sampler=None,
+                 store: str = None, runtime: str = "runc", **sources):
+        self.producer = producer or make_producer(**sources)
+        self._runtime = runtime
+        self._runs = runs
+        self._sampler = sampler
+        self._store = ResultStore(store) if store else None
+        self._methods = {}
+
+    def method(self, name: str):
+        """Returns the benchmark function with the given short name.
+
+        :raises KeyError: if there is no such benchmark.
+        """
+        if not self._methods:
+            self._methods = {short_name: func for short_name, _, func in find_benchmarks(".*")}
+        return self._methods[name]
+
+    def run(self, name: str, **kwargs) -> Results:
+        """Runs a benchmark point.
+
+        :param name: the benchmark's short name, e.g. "sysbench.cpu".
+        :param kwargs: the arguments of the benchmark, as perf.py flags.
+        :return: the results of all iterations.
+        :raises RuntimeError: if no iteration completed.
+        """
+        kwargs.setdefault("runtime", self._runtime)
+        driver = BenchmarkDriver(self.producer, self.method(name), runs=self._runs,
+                                 sampler=self._sampler, **kwargs)
+        driver.start()
+        driver.join()
+        if not driver.iterations:
+            raise RuntimeError("%s failed: no iteration completed" % name)
+        if self._store:
+            store_iterations(self._store, name, driver, kwargs, source="session")
+        return Results(driver.all(), telemetry=[iteration["telemetry"]
+                                                for iteration in driver.iterations])
+
+    def close(self):
+        """Saves any recording and closes the producer."""
+        if hasattr(self.producer, "save"):
+            self.producer.save()
+        self.producer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
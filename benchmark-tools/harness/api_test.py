@@ -0,0 +1,79 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the programmatic interface."""
+
+import pytest
+
+from harness.api import Session, find_benchmarks, make_producer
+from harness.result_store import ResultStore
+from harness.telemetry import Telemetry
+
+
+class FixedSampler:
+    """Sampler returning two samples of a machine."""
+
+    def __init__(self, machine):
+        self._name = str(machine)
+
+    def start(self):
+        """Starts nothing."""
+
+    def stop(self) -> Telemetry:
+        """Returns the samples."""
+        return Telemetry(self._name, [
+            {"time": 0, "cpu": {"user": 0}, "pressure": {}, "interrupts": 0},
+            {"time": 1, "cpu": {"user": 100}, "pressure": {}, "interrupts": 100}])
+
+
+def test_find_benchmarks():
+    """Test benchmarks are found by pattern."""
+    names = [short_name for short_name, _, _ in find_benchmarks("sysbench\\.")]
+    assert "sysbench.cpu" in names
+    assert "syscall.syscall" not in names
+
+
+def test_make_producer_sources():
+    """Test exactly one machine source is required."""
+    with pytest.raises(ValueError):
+        make_producer()
+    with pytest.raises(ValueError):
+        make_producer(env="machines.yaml", mock=True)
+
+
+def test_session_run(tmp_path):
+    """Test a session returns typed results and stores every iteration."""
+    path = str(tmp_path / "results.db")
+    with Session(mock=True, runs=2, store=path) as session:
+        results = session.run("sysbench.cpu", threads=2, accounting=False)
+    assert results["cpu_events_per_second"] == [9093.38, 9093.38]
+    assert results.median("cpu_events_per_second") == 9093.38
+    _, rows = ResultStore(path).query(group_by=["benchmark", "platform", "threads"],
+                                      stats=["count"], metric="cpu_events_per_second")
+    assert rows == [("sysbench.cpu", "runc", "2", 2)]
+
+
+def test_session_telemetry(tmp_path):
+    """Test the telemetry of each iteration is returned and stored."""
+    path = str(tmp_path / "results.db")
+    with Session(mock=True, runs=2, sampler=FixedSampler, store=path) as session:
+        results = session.run("sysbench.cpu", accounting=False)
+    assert [len(machines) for machines in results.telemetry] == [1, 1]
+    assert results["host_anomalies"] == [0, 0]
+    series = results.telemetry[0][0].series()
+    assert ResultStore(path).telemetry(1) == {results.telemetry[0][0].name: series}
+
+
+def test_session_unknown_benchmark():
+    """Test an unknown benchmark is refused."""
+    with pytest.raises(KeyError):
+        Session(mock=True).run("sysbench.nothing")
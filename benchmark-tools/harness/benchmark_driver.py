@@ -14,6 +14,7 @@
 
 import types
 import copy
+import logging
 import threading
 import statistics
 
@@ -28,8 +29,20 @@ class BenchmarkDriver:
                  producer: MachineProducer,
                  method: types.FunctionType,
                  runs: int = 1,
+                 sampler: types.FunctionType = None,
                  **kwargs):
+        """Creates a driver.
 
+        :param producer: the producer to lease machines from.
+        :param method: the benchmark method.
+        :param runs: the number of iterations.
+        :param sampler: optional factory taking a machine and returning an
+            object with start() and stop() methods (e.g. HostSampler). One is
+            started for each leased machine during each iteration; stop()
+            returns an object with a flags() method listing any anomalous
+            host conditions.
+        :param kwargs: the arguments for the benchmark method.
+        """
         self._producer = producer
         self._method = method
         self._kwargs = copy.deepcopy(kwargs)
@@ -37,6 +50,10 @@ class BenchmarkDriver:
         self.lock = threading.RLock()
         self._runs = runs
         self._metric_results = {}
+        self._sampler = sampler
+        # The hosts, metrics and telemetry (one object per machine, if
+        # sampled) of each iteration, in completion order.
+        self.iterations = []
 
     def start(self):
         """Starts a benchmark thread."""
@@ -53,17 +70,43 @@ class BenchmarkDriver:
     def _run_method(self):
         machines = self._producer.get_machines(benchmark_machines(self._method))
         try:
-            result = self._method(*machines, **self._kwargs)
-            for name, res in result:
-                with self.lock:
-                    if name in self._metric_results:
-                        self._metric_results[name].append(res)
-                    else:
-                        self._metric_results[name] = [res]
+            # Leased machines may hold containers leaked by a crashed run; those
+            # of live runs, possibly sharing the daemon, are left alone.
+            for machine in machines:
+                machine.reap()
+            samplers = [self._sampler(machine) for machine in machines] if self._sampler else []
+            for sampler in samplers:
+                sampler.start()
+            iteration = {}
+            try:
+                result = self._method(*machines, **self._kwargs)
+                for name, res in result:
+                    iteration[name] = res
+                    self._add_result(name, res)
+            finally:
+                telemetry = [sampler.stop() for sampler in samplers]
+            if samplers:
+                flags = [flag for machine in telemetry for flag in machine.flags()]
+                for flag in flags:
+                    logging.warning("Anomalous host conditions in %s: %s",
+                                    self._method.__name__, flag)
+                iteration["host_anomalies"] = len(flags)
+                self._add_result("host_anomalies", len(flags))
+            with self.lock:
+                self.iterations.append({"hosts": [str(machine) for machine in machines],
+                                        "results": iteration, "telemetry": telemetry})
         finally:
             # Always release.
             self._producer.release_machines(machines)
 
+    def _add_result(self, name: str, res):
+        """Records the result of a metric for one iteration."""
+        with self.lock:
+            if name in self._metric_results:
+                self._metric_results[name].append(res)
+            else:
+                self._metric_results[name] = [res]
+
     def median(self):
         """Returns the median result, after join is finished."""
         for key, value in self._metric_results.items():
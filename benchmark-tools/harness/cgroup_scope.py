@@ -0,0 +1,194 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Resource accounting of all containers a benchmark starts on a machine.
+
+The containers are started under a common parent cgroup. The parent's
+counters include every container, and its runtime helpers (e.g. the runsc
+sentry and gofer), from start to stop, even once the containers are removed.
+"""
+
+import contextlib
+import time
+import types
+import uuid
+
+from harness.container import Container
+from harness.machine import Machine
+
+# USAGE_SCRIPT prints the counters of a parent cgroup, for cgroup v2 or v1.
+# On cgroup v1, block I/O of containers that were already removed is lost.
+USAGE_SCRIPT = """sudo sh -s <<'EOF'
+cgroup={cgroup}
+if [ -f /sys/fs/cgroup/$cgroup/cpu.stat ]; then
+  sed 's/^/cpu /' /sys/fs/cgroup/$cgroup/cpu.stat
+  cat /sys/fs/cgroup/$cgroup/io.stat 2>/dev/null | tr ' ' '\\n' | grep = | sed 's/=/ /; s/^/io /'
+elif [ -d /sys/fs/cgroup/cpuacct/$cgroup ]; then
+  echo "cpu usage_usec $(($(cat /sys/fs/cgroup/cpuacct/$cgroup/cpuacct.usage) / 1000))"
+  sed 's/^/cpu /' /sys/fs/cgroup/cpu/$cgroup/cpu.stat 2>/dev/null
+  awk '$2 == "Read" {{print "io rbytes", $3}} $2 == "Write" {{print "io wbytes", $3}}' \\
+    /sys/fs/cgroup/blkio/$cgroup/blkio.throttle.io_service_bytes_recursive 2>/dev/null
+  awk '$2 == "Read" {{print "io rios", $3}} $2 == "Write" {{print "io wios", $3}}' \\
+    /sys/fs/cgroup/blkio/$cgroup/blkio.throttle.io_serviced_recursive 2>/dev/null
+fi
+EOF"""
+
+# RELEASE_SCRIPT removes the parent cgroup from every hierarchy.
+RELEASE_SCRIPT = "sudo rmdir /sys/fs/cgroup/{cgroup} /sys/fs/cgroup/*/{cgroup} 2>/dev/null; true"
+
+
+def parse_usage(data: str) -> dict:
+    """Parses the output of USAGE_SCRIPT.
+
+    :param data: the output.
+    :return: a dict of "cpu_seconds", "user_seconds", "system_seconds",
+        "throttled_periods", "throttled_seconds", "read_bytes",
+        "write_bytes", "read_ios" and "write_ios". Counters the machine does
+        not report are left out.
+    """
+    raw = {}
+    for line in data.splitlines():
+        fields = line.split()
+        if len(fields) == 3 and fields[2].isdigit():
+            key = (fields[0], fields[1])
+            # io.stat has a line per device.
+            raw[key] = raw.get(key, 0) + int(fields[2])
+    names = {
+        ("cpu", "usage_usec"): ("cpu_seconds", 1e-6),
+        ("cpu", "user_usec"): ("user_seconds", 1e-6),
+        ("cpu", "system_usec"): ("system_seconds", 1e-6),
+        ("cpu", "nr_throttled"): ("throttled_periods", 1),
+        ("cpu", "throttled_usec"): ("throttled_seconds", 1e-6),
+        ("cpu", "throttled_time"): ("throttled_seconds", 1e-9),
+        ("io", "rbytes"): ("read_bytes", 1),
+        ("io", "wbytes"): ("write_bytes", 1),
+        ("io", "rios"): ("read_ios", 1),
+        ("io", "wios"): ("write_ios", 1),
+    }
+    return {name: raw[key] * scale for key, (name, scale) in names.items() if key in raw}
+
+
+class ScopedContainer(Container):
+    """Container recording the network use of detached containers on teardown,
+    and the startup time of every run."""
+
+    def __init__(self, container: Container, scope):
+        self._container = container
+        self._scope = scope
+
+    def run(self, **env):
+        output = self._container.run(**env)
+        self._scope.add_startup(self._container.startup())
+        return output
+
+    def stream(self, **env) -> types.GeneratorType:
+        yield from self._container.stream(**env)
+        self._scope.add_startup(self._container.startup())
+
+    @contextlib.contextmanager
+    def detach(self, **env):
+        with self._container.detach(**env):
+            try:
+                yield self
+            finally:
+                for key, value in self._container.network().items():
+                    self._scope.network[key] = self._scope.network.get(key, 0) + value
+                self._scope.add_startup(self._container.startup())
+
+    def address(self) -> (str, int):
+        return self._container.address()
+
+    def get_names(self) -> types.GeneratorType:
+        return self._container.get_names()
+
+    def get_pids(self) -> types.GeneratorType:
+        return self._container.get_pids()
+
+    def network(self) -> dict:
+        return self._container.network()
+
+    def startup(self) -> float:
+        return self._container.startup()
+
+    def boot_phases(self) -> dict:
+        return self._container.boot_phases()
+
+
+class ScopedMachine:
+    """Machine proxy starting all containers under the scope's cgroup."""
+
+    def __init__(self, machine: Machine, scope):
+        self._machine = machine
+        self._scope = scope
+
+    def container(self, image: str, **kwargs) -> Container:
+        """Returns a container in the scope's cgroup."""
+        kwargs.setdefault("cgroup_parent", self._scope.name)
+        if self._scope.started is None:
+            self._scope.started = time.time()
+        return ScopedContainer(self._machine.container(image, **kwargs), self._scope)
+
+    def __getattr__(self, name):
+        return getattr(self._machine, name)
+
+    def __str__(self):
+        return str(self._machine)
+
+
+class CgroupScope:
+    """A parent cgroup for the containers of one benchmark run. Usage:
+
+    scope = CgroupScope(machine)
+    # start containers with scope.machine.
+    usage = scope.usage()
+    scope.close()
+    """
+
+    def __init__(self, machine: Machine):
+        self.name = "benchmarks_%s.slice" % uuid.uuid4().hex[:12]
+        self.host = machine
+        self.machine = ScopedMachine(machine, self)
+        # The time the first container was created, so that image pulls
+        # before it are not counted as the run.
+        self.started = None
+        # Network counters of detached containers, summed on teardown.
+        self.network = {}
+        # Startup times of the runs whose runtime reports them.
+        self.startups = []
+
+    def add_startup(self, seconds: float):
+        """Records the startup time of a run, if known."""
+        if seconds is not None:
+            self.startups.append(seconds)
+
+    def usage(self) -> dict:
+        """Returns the resources used by the containers so far.
+
+        :return: the counters from parse_usage, plus "rx_bytes" and
+            "tx_bytes" of detached containers, "startup_seconds" and
+            "startups", the total startup time and number of runs that report
+            it, and "elapsed", the seconds since the first container was
+            created.
+        """
+        stdout, _ = self.host.run(USAGE_SCRIPT.format(cgroup=self.name))
+        usage = parse_usage(stdout)
+        usage.update(self.network)
+        if self.startups:
+            usage["startup_seconds"] = sum(self.startups)
+            usage["startups"] = len(self.startups)
+        if self.started is not None:
+            usage["elapsed"] = time.time() - self.started
+        return usage
+
+    def close(self):
+        """Removes the cgroup."""
+        self.host.run(RELEASE_SCRIPT.format(cgroup=self.name))
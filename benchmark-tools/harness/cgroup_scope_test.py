@@ -0,0 +1,125 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for cgroup resource accounting."""
+
+from benchmarks import benchmark
+from harness.cgroup_scope import parse_usage
+from harness.container import MockContainer
+from harness.machine import MockMachine
+
+SAMPLE_V2_USAGE = """cpu usage_usec 4000000
+cpu user_usec 3000000
+cpu system_usec 1000000
+cpu nr_periods 0
+cpu nr_throttled 2
+cpu throttled_usec 500000
+io rbytes 1024
+io wbytes 2048
+io rios 1
+io wios 2
+io rbytes 1024
+"""
+
+SAMPLE_V1_USAGE = """cpu usage_usec 4000000
+cpu nr_periods 10
+cpu nr_throttled 2
+cpu throttled_time 500000000
+io rbytes 1024
+io wbytes 2048
+"""
+
+
+class AccountingMachine(MockMachine):
+    """Mock machine answering the usage script."""
+
+    def run(self, cmd: str) -> (str, str):
+        if "cpu.stat" in cmd:
+            return SAMPLE_V2_USAGE, ""
+        return "", ""
+
+
+class BootingContainer(MockContainer):
+    """Mock container of a runtime reporting its startup time."""
+
+    def __init__(self, workload: str, seconds: float):
+        super().__init__(workload)
+        self._seconds = seconds
+
+    def startup(self) -> float:
+        return self._seconds
+
+
+class BootingMachine(AccountingMachine):
+    """Mock machine whose containers take 1, 2, ... seconds to start."""
+
+    def __init__(self):
+        self.started = 0
+
+    def container(self, image: str, **kwargs):
+        self.started += 1
+        return BootingContainer(image, float(self.started))
+
+
+def test_parse_usage_v2():
+    """Test cgroup v2 counters, summed over devices."""
+    assert parse_usage(SAMPLE_V2_USAGE) == {
+        "cpu_seconds": 4.0,
+        "user_seconds": 3.0,
+        "system_seconds": 1.0,
+        "throttled_periods": 2,
+        "throttled_seconds": 0.5,
+        "read_bytes": 2048,
+        "write_bytes": 2048,
+        "read_ios": 1,
+        "write_ios": 2,
+    }
+
+
+def test_parse_usage_v1():
+    """Test cgroup v1 counters."""
+    usage = parse_usage(SAMPLE_V1_USAGE)
+    assert usage["cpu_seconds"] == 4.0
+    assert usage["throttled_seconds"] == 0.5
+    assert usage["read_bytes"] == 1024
+
+
+def test_benchmark_efficiency():
+    """Test usage and throughput per CPU-second are reported as metrics."""
+    def rate(value, **kwargs):
+        """Returns a rate."""
+        return 100.0
+
+    @benchmark(metrics=[rate], machines=1, throughput=[rate])
+    def run(machine, **kwargs):
+        return machine.container("true").run()
+
+    results = dict(run(AccountingMachine(), runtime="runc", accounting="true"))
+    assert results["rate"] == 100.0
+    assert results["cpu_seconds"] == 4.0
+    # No container ran for any measurable time.
+    assert 0 <= results["rate_per_cpu_second"] < 1.0
+    assert "rate_per_cpu_second" not in dict(
+        run(AccountingMachine(), runtime="runc"))
+
+
+def test_benchmark_startup():
+    """Test the mean startup time is reported by runtimes that know it."""
+    @benchmark(machines=1)
+    def run(machine, **kwargs):
+        for _ in range(3):
+            machine.container("true").run()
+
+    assert dict(run(BootingMachine(), runtime="firecracker",
+                    accounting="true"))["startup_seconds"] == 2.0
+    assert "startup_seconds" not in dict(run(AccountingMachine(), runtime="runc",
+                                             accounting="true"))
@@ -0,0 +1,229 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Statistical comparison of benchmark results against a baseline."""
+
+import csv
+import functools
+import math
+import os
+import random
+import re
+import shutil
+import statistics
+
+# HIGHER_IS_BETTER matches the metrics for which an increase is an
+# improvement; it is checked first, as rates may be of e.g. memory operations.
+HIGHER_IS_BETTER = (r"(_per_second|_per_cpu_second)$|"
+                    r"(^|_)(bandwidth|io_ops|rate|fps|saved|reclaimable)(_|$)")
+
+# LOWER_IS_BETTER matches the metrics for which a decrease is an improvement.
+# Its words are whole words of the metric names, e.g. memory_usage but not
+# memory_ops_per_second.
+LOWER_IS_BETTER = (r"(^|_)(latency|time|usage|seconds|ns|ms|memory|misses|switches|"
+                   r"anomalies|pss|uss)(_|$)")
+
+
+def is_lower_better(metric: str, lower_is_better: str = LOWER_IS_BETTER,
+                    higher_is_better: str = HIGHER_IS_BETTER) -> bool:
+    """Returns whether a decrease of the metric is an improvement.
+
+    :param metric: the metric name.
+    :param lower_is_better: regex of metric names for which lower is better.
+    :param higher_is_better: regex of metric names for which higher is
+        better, taking precedence.
+    """
+    if re.search(higher_is_better, metric):
+        return False
+    return re.search(lower_is_better, metric) is not None
+
+
+def read_results(path: str) -> dict:
+    """Reads the csv written by perf.py run.
+
+    Results are best written with --stat=all, so that every run is a sample.
+
+    :param path: the csv file.
+    :return: a dict of point keys (the tuple of all columns but the results,
+        ending with the metric name) to lists of samples.
+    """
+    with open(path, newline="") as results:
+        rows = list(csv.reader(results))
+    if not rows:
+        return {}
+    columns = len(rows[0]) - 1
+    points = {}
+    for row in rows[1:]:
+        if len(row) > columns:
+            points.setdefault(tuple(row[:columns]), []).extend(float(v) for v in row[columns:])
+    return points
+
+
+@functools.lru_cache(maxsize=None)
+def _u_counts(n_1: int, n_2: int) -> tuple:
+    """Returns the number of orderings giving each U statistic, for U = 0..n_1 * n_2."""
+    if n_1 == 0 or n_2 == 0:
+        return (1,)
+    counts = [0] * (n_1 * n_2 + 1)
+    # The largest value comes from the first sample (adding n_2 to U) or not.
+    for u_value, count in enumerate(_u_counts(n_1 - 1, n_2)):
+        counts[u_value + n_2] += count
+    for u_value, count in enumerate(_u_counts(n_1, n_2 - 1)):
+        counts[u_value] += count
+    return tuple(counts)
+
+
+def mann_whitney(first: list, second: list) -> (float, float):
+    """Two-sided Mann-Whitney U test.
+
+    The p-value is exact for small samples without ties, and uses the normal
+    approximation with tie correction otherwise.
+
+    :return: U of the first sample and the p-value.
+    """
+    n_1, n_2 = len(first), len(second)
+    ranked = sorted([(value, 0) for value in first] + [(value, 1) for value in second])
+    ranks = [0.0] * len(ranked)
+    ties = []
+    index = 0
+    while index < len(ranked):
+        end = index
+        while end + 1 < len(ranked) and ranked[end + 1][0] == ranked[index][0]:
+            end += 1
+        for tied in range(index, end + 1):
+            ranks[tied] = (index + end) / 2.0 + 1
+        ties.append(end - index + 1)
+        index = end + 1
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 0)
+    u_stat = rank_sum - n_1 * (n_1 + 1) / 2.0
+    mean = n_1 * n_2 / 2.0
+    if all(count == 1 for count in ties) and n_1 * n_2 <= 2500:
+        counts = _u_counts(n_1, n_2)
+        extreme = min(u_stat, n_1 * n_2 - u_stat)
+        tail = sum(counts[:int(math.floor(extreme)) + 1]) / float(sum(counts))
+        return u_stat, min(1.0, 2 * tail)
+    total = n_1 + n_2
+    variance = n_1 * n_2 / 12.0 * (
+        total + 1 - sum(count ** 3 - count for count in ties) / float(total * (total - 1)))
+    if variance <= 0:
+        return u_stat, 1.0
+    z_score = (abs(u_stat - mean) - 0.5) / math.sqrt(variance)
+    return u_stat, min(1.0, math.erfc(max(z_score, 0) / math.sqrt(2)))
+
+
+def bootstrap_ratio(baseline: list, current: list, alpha: float = 0.05,
+                    resamples: int = 2000) -> (float, float):
+    """Returns the bootstrap confidence interval of median(current) / median(baseline)."""
+    rng = random.Random(0)
+    ratios = []
+    for _ in range(resamples):
+        base = statistics.median([rng.choice(baseline) for _ in baseline])
+        if base:
+            ratios.append(statistics.median([rng.choice(current) for _ in current]) / base)
+    if not ratios:
+        return float("nan"), float("nan")
+    ratios.sort()
+    return (ratios[int(alpha / 2 * (len(ratios) - 1))],
+            ratios[int((1 - alpha / 2) * (len(ratios) - 1))])
+
+
+# pylint: disable-msg=too-many-locals
+def compare(baseline: dict, current: dict, alpha: float = 0.05, threshold: float = 0.05,
+            lower_is_better: str = LOWER_IS_BETTER,
+            higher_is_better: str = HIGHER_IS_BETTER) -> list:
+    """Compares results point by point.
+
+    A point regresses when the Mann-Whitney test is significant at alpha and
+    the median moved by more than threshold (a fraction) in the bad
+    direction.
+
+    :param baseline: results from read_results.
+    :param current: results from read_results.
+    :param alpha: the significance level.
+    :param threshold: the smallest relative change that counts.
+    :param lower_is_better: regex of metric names for which lower is better.
+    :param higher_is_better: regex of metric names for which higher is
+        better, taking precedence over lower_is_better.
+    :return: a list of dicts, one per point, with "point", "baseline" and
+        "current" medians, "ratio" of the medians, its confidence interval
+        "ratio_low" and "ratio_high", "p_value", "effect" (rank-biserial
+        correlation, positive when current is larger) and "verdict": one of
+        regression, improvement, unchanged, insufficient (too few samples to
+        reach alpha), missing or new.
+    """
+    comparisons = []
+    for point in sorted(set(baseline) | set(current)):
+        if point not in current or point not in baseline:
+            comparisons.append({"point": point,
+                                "verdict": "missing" if point not in current else "new"})
+            continue
+        base, cur = baseline[point], current[point]
+        base_median, cur_median = statistics.median(base), statistics.median(cur)
+        ratio = cur_median / base_median if base_median else float("nan")
+        low, high = bootstrap_ratio(base, cur, alpha)
+        u_stat, p_value = mann_whitney(cur, base)
+        effect = 2 * u_stat / (len(cur) * len(base)) - 1
+        # The smallest p-value the test can give for these sample sizes.
+        best_p = 2.0 * math.factorial(len(base)) * math.factorial(len(cur)) / math.factorial(
+            len(base) + len(cur))
+        lower = is_lower_better(point[-1], lower_is_better, higher_is_better)
+        worse = (ratio > 1 + threshold) if lower else (ratio < 1 - threshold)
+        better = (ratio < 1 - threshold) if lower else (ratio > 1 + threshold)
+        if best_p > alpha:
+            verdict = "insufficient"
+        elif p_value < alpha and worse:
+            verdict = "regression"
+        elif p_value < alpha and better:
+            verdict = "improvement"
+        else:
+            verdict = "unchanged"
+        comparisons.append({
+            "point": point,
+            "baseline": base_median,
+            "current": cur_median,
+            "ratio": ratio,
+            "ratio_low": low,
+            "ratio_high": high,
+            "p_value": p_value,
+            "effect": effect,
+            "verdict": verdict,
+        })
+    return comparisons
+
+
+class BaselineStore:
+    """A directory of named baseline result files."""
+
+    def __init__(self, path: str):
+        self._path = os.path.expanduser(path)
+
+    def path(self, name: str) -> str:
+        """Returns the file of the named baseline."""
+        return os.path.join(self._path, name + ".csv")
+
+    def save(self, name: str, results: str):
+        """Stores a results file as the named baseline."""
+        os.makedirs(self._path, exist_ok=True)
+        shutil.copyfile(results, self.path(name))
+
+    def names(self) -> list:
+        """Returns the stored baseline names."""
+        if not os.path.isdir(self._path):
+            return []
+        return sorted(name[:-len(".csv")] for name in os.listdir(self._path)
+                      if name.endswith(".csv"))
+
+    def load(self, name: str) -> dict:
+        """Returns the named baseline, or the results file at name."""
+        if os.path.exists(self.path(name)):
+            return read_results(self.path(name))
+        return read_results(name)
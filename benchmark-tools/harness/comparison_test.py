@@ -0,0 +1,100 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for baseline comparison."""
+
+import pytest
+
+from harness.comparison import (BaselineStore, compare, is_lower_better, mann_whitney,
+                                read_results)
+
+RESULTS = """runtime,method,metric,result
+runc,sysbench.cpu,cpu_events_per_second,100,101,99,100,102
+runc,sysbench.mutex,mutex_latency,10,11,10.5,9.5,10
+"""
+
+
+def test_mann_whitney_exact():
+    """Test the exact p-value of fully separated samples."""
+    u_stat, p_value = mann_whitney([1, 2, 3], [4, 5, 6])
+    assert u_stat == 0
+    # Only 2 of the 20 orderings are as extreme.
+    assert p_value == pytest.approx(0.1)
+
+
+def test_mann_whitney_ties():
+    """Test identical samples are not significant."""
+    _, p_value = mann_whitney([1, 1, 1, 1], [1, 1, 1, 1])
+    assert p_value == 1.0
+
+
+def test_mann_whitney_approximate():
+    """Test the normal approximation of large shifted samples."""
+    _, p_value = mann_whitney(list(range(100)), [value + 50 for value in range(100)])
+    assert p_value < 1e-6
+
+
+def test_compare_verdicts():
+    """Test regressions respect the metric direction."""
+    baseline = {("cpu", "events_per_second"): [100, 101, 99, 100, 102],
+                ("mutex", "latency"): [10, 11, 10.5, 9.5, 10]}
+    current = {("cpu", "events_per_second"): [80, 81, 79, 80, 82],
+               ("mutex", "latency"): [8, 8.5, 8.2, 7.9, 8]}
+    verdicts = {c["point"]: c["verdict"] for c in compare(baseline, current)}
+    assert verdicts[("cpu", "events_per_second")] == "regression"
+    assert verdicts[("mutex", "latency")] == "improvement"
+
+
+def test_compare_unchanged_and_missing():
+    """Test small changes and missing points."""
+    baseline = {("cpu", "events_per_second"): [100, 101, 99, 100, 102],
+                ("old", "metric"): [1, 2, 3, 4, 5]}
+    current = {("cpu", "events_per_second"): [101, 100, 102, 99, 100]}
+    verdicts = {c["point"]: c["verdict"] for c in compare(baseline, current)}
+    assert verdicts[("cpu", "events_per_second")] == "unchanged"
+    assert verdicts[("old", "metric")] == "missing"
+
+
+def test_compare_insufficient():
+    """Test too few samples are reported rather than passed."""
+    comparisons = compare({("a", "b"): [1, 2]}, {("a", "b"): [5, 6]})
+    assert comparisons[0]["verdict"] == "insufficient"
+
+
+def test_baseline_store(tmp_path):
+    """Test a stored baseline reads back as samples."""
+    results = tmp_path / "results.csv"
+    results.write_text(RESULTS)
+    store = BaselineStore(str(tmp_path / "store"))
+    store.save("nightly", str(results))
+    assert store.names() == ["nightly"]
+    points = store.load("nightly")
+    assert points[("runc", "sysbench.cpu", "cpu_events_per_second")] == [100, 101, 99, 100, 102]
+    assert store.load(str(results)) == points
+
+
+def test_metric_direction():
+    """Test the metric directions match whole words, rates first."""
+    for metric in ["latency", "probe_latency", "run_time", "startup_time_ms", "syscall_time_ns",
+                   "memory_usage", "marginal_memory", "pss_p50", "total_p99_ms"]:
+        assert is_lower_better(metric), metric
+    for metric in ["memory_ops_per_second", "cpu_events_per_second", "bandwidth", "io_ops",
+                   "reclaimable_memory", "ksm_saved", "mean_fps", "transfer_rate",
+                   "timeouts_per_cpu_second", "max_containers"]:
+        assert not is_lower_better(metric), metric
+
+
+def test_compare_memory_rates():
+    """Test fewer memory operations per second is a regression."""
+    baseline = {("memory", "memory_ops_per_second"): [100, 101, 99, 100, 102]}
+    current = {("memory", "memory_ops_per_second"): [80, 81, 79, 80, 82]}
+    assert compare(baseline, current)[0]["verdict"] == "regression"
@@ -12,13 +12,95 @@
 # limitations under the License.
 """Container definitions."""
 
+import codecs
+import concurrent.futures
 import contextlib
 import types
 import logging
+import os
 import pydoc
+import socket
+import time
 import docker
 import docker.errors
 
+# HARNESS_LABEL marks every container started by the harness, so that
+# containers leaked by a crashed run can be found and removed later. Its value
+# is OWNER, the harness process ("host:pid") that started the container.
+HARNESS_LABEL = "benchmark-tools"
+OWNER = "%s:%d" % (socket.gethostname(), os.getpid())
+
+
+def is_orphan(owner: str) -> bool:
+    """Returns whether the harness process owning a container is gone.
+
+    Containers of processes on other hosts are never orphans, as their
+    processes cannot be checked; those of older harnesses, labelled "true",
+    always are.
+
+    :param owner: the HARNESS_LABEL value of the container.
+    """
+    host, _, pid = owner.rpartition(":")
+    if not host or not pid.isdigit():
+        return owner == "true"
+    if host != socket.gethostname():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        # Alive, as another user.
+        pass
+    return False
+
+
+def remove_containers(containers: list):
+    """Force removes containers in parallel.
+
+    Containers that are already gone are skipped; other failures are logged
+    once every container has been attempted.
+
+    :param containers: docker container objects.
+    """
+    def remove(container):
+        try:
+            container.remove(force=True)
+        except docker.errors.NotFound:
+            pass
+        except docker.errors.APIError as exc:
+            # A container started with auto-remove may already be going.
+            if exc.status_code != 409:
+                raise
+
+    if not containers:
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(containers), 16)) as pool:
+        futures = {pool.submit(remove, container): container for container in containers}
+        for future in concurrent.futures.as_completed(futures):
+            if future.exception() is not None:
+                logging.error("Failed to remove container %s: %s",
+                              futures[future].id, future.exception())
+
+
+def reap_containers(client: docker.DockerClient) -> int:
+    """Removes the containers left behind by harness processes that are gone.
+
+    Containers of live processes, including concurrent runs of this one on
+    the same daemon, are left alone.
+
+    :param client: A docker client from docker py lib.
+    :return: the number of orphaned containers found.
+    """
+    orphans = [container for container in
+               client.containers.list(all=True, filters={"label": HARNESS_LABEL})
+               if is_orphan((container.labels or {}).get(HARNESS_LABEL, ""))]
+    if orphans:
+        logging.warning("Reaping %d orphaned containers: %s",
+                        len(orphans), ", ".join(orphan.name for orphan in orphans))
+        remove_containers(orphans)
+    return len(orphans)
+
 
 class Container:
     """Abstract container. Must be a context manager. Usage:
@@ -34,6 +116,15 @@ class Container:
         """Run the container asynchronously."""
         raise NotImplementedError
 
+    def stream(self, **env) -> types.GeneratorType:
+        """Run the container, yielding (timestamp, line) as output arrives.
+
+        Lines keep their terminator; a carriage return also ends a line, so
+        that progress output which rewrites the same terminal line (e.g.
+        ffmpeg) is yielded update by update.
+        """
+        raise NotImplementedError
+
     def address(self) -> (str, int):
         """Return the bound address for the container."""
         raise NotImplementedError
@@ -42,6 +133,24 @@ class Container:
         """Return names of all containers."""
         raise NotImplementedError
 
+    def get_pids(self) -> types.GeneratorType:
+        """Return (name, pid) of the init process of all running containers."""
+        raise NotImplementedError
+
+    def network(self) -> dict:
+        """Return "rx_bytes" and "tx_bytes" summed over all running containers."""
+        raise NotImplementedError
+
+    def startup(self) -> float:
+        """Return the seconds the last run took until its workload started, if
+        the runtime knows (e.g. a microVM's boot or restore)."""
+        return None
+
+    def boot_phases(self) -> dict:
+        """Return the seconds each phase of the last run's start took, by
+        phase name, if the runtime knows (e.g. a microVM's kernel boot)."""
+        return {}
+
 
 #pylint: disable-msg=too-many-instance-attributes
 class DockerContainer(Container):
@@ -76,6 +185,7 @@ class DockerContainer(Container):
         self._runtime = runtime
         self._port = port
         self._kwargs = kwargs
+        self._kwargs["labels"] = dict(kwargs.get("labels") or {}, **{HARNESS_LABEL: OWNER})
         if port != 0:
             self._ports = {'%d/tcp' % port: None}
         else:
@@ -121,6 +231,20 @@ class DockerContainer(Container):
         for container in self._containers:
             yield container.name
 
+    def get_pids(self) -> types.GeneratorType:
+        for container in self._containers:
+            container.reload()
+            yield container.name, container.attrs["State"]["Pid"]
+
+    def network(self) -> dict:
+        totals = {"rx_bytes": 0, "tx_bytes": 0}
+        for container in self._containers:
+            stats = container.stats(stream=False)
+            for interface in (stats.get("networks") or {}).values():
+                for key in totals:
+                    totals[key] += interface.get(key, 0)
+        return totals
+
     def run(self, **env):
         env = ["%s=%s" % (key, value) for (key, value) in env.items()]
         return self._client.containers.run(self._image,
@@ -131,14 +255,48 @@ class DockerContainer(Container):
                                            privileged=True,
                                            **self._kwargs).decode("utf-8")
 
-    def _clean_containers(self):
-        """Kills all containers."""
-        for container in self._containers:
+    def stream(self, **env) -> types.GeneratorType:
+        env = ["%s=%s" % (key, value) for (key, value) in env.items()]
+        kwargs = dict(self._kwargs)
+        stdout = kwargs.pop("stdout", True)
+        stderr = kwargs.pop("stderr", False)
+        container = self._client.containers.run(self._image,
+                                                detach=True,
+                                                runtime=self._runtime,
+                                                ports=self._ports,
+                                                environment=env,
+                                                privileged=True,
+                                                **kwargs)
+        logging.info("Streaming container %s -> %s", self._image, container.id)
+        try:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            pending = ""
+            for chunk in container.logs(stdout=stdout, stderr=stderr, stream=True, follow=True):
+                now = time.time()
+                pending += decoder.decode(chunk)
+                lines = pending.splitlines(keepends=True)
+                pending = ""
+                if lines and not lines[-1].endswith(("\n", "\r")):
+                    pending = lines.pop()
+                for line in lines:
+                    yield now, line
+            pending += decoder.decode(b"", final=True)
+            if pending:
+                yield time.time(), pending
+            container.wait()
+        finally:
+            # Not started with auto-remove, so the logs cannot disappear
+            # before they are read; this also stops an abandoned stream.
             try:
-                container.kill()
+                container.remove(force=True)
             except docker.errors.NotFound:
                 pass
 
+    def _clean_containers(self):
+        """Removes all containers."""
+        remove_containers(self._containers)
+        self._containers = []
+
 
 class MockContainer(Container):
     """Mock of Container."""
@@ -157,12 +315,22 @@ class MockContainer(Container):
             return mod.sample(**env)
         return "" # No output.
 
+    def stream(self, **env) -> types.GeneratorType:
+        for line in self.run(**env).splitlines(keepends=True):
+            yield time.time(), line
+
     def address(self) -> (str, int):
         return ("example.com", 80)
 
     def get_names(self) -> types.GeneratorType:
         yield "mock"
 
+    def get_pids(self) -> types.GeneratorType:
+        yield "mock", 1
+
+    def network(self) -> dict:
+        return {}
+
     @contextlib.contextmanager
     def detach(self, **env):
         yield self
@@ -0,0 +1,105 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for container lifecycle handling."""
+
+import subprocess
+import threading
+
+import docker.errors
+
+from harness.container import DockerContainer, HARNESS_LABEL, OWNER, reap_containers
+
+
+class FakeContainer:
+    """Stands in for a docker container."""
+
+    def __init__(self, name, labels, barrier=None, error=None):
+        self.id = self.name = name
+        self.labels = labels
+        self.attrs = {"Id": name, "State": {"Running": True}}
+        self.barrier = barrier
+        self.error = error
+        self.removed = False
+
+    def remove(self, force=False):
+        """Removes the container, waiting for its peers if given a barrier."""
+        assert force
+        if self.barrier is not None:
+            self.barrier.wait(5)
+        if self.error is not None:
+            raise self.error
+        self.removed = True
+
+
+class FakeContainers:
+    """Stands in for the docker containers collection."""
+
+    def __init__(self, barrier=None):
+        self.barrier = barrier
+        self.started = []
+
+    def run(self, image, labels=None, **kwargs):
+        """Starts a container."""
+        container = FakeContainer("%s-%d" % (image, len(self.started)), labels, self.barrier)
+        self.started.append(container)
+        return container
+
+    def list(self, all=False, filters=None):
+        """Lists containers matching a label filter."""
+        #pylint: disable-msg=redefined-builtin
+        assert all
+        return [c for c in self.started if filters["label"] in (c.labels or {})]
+
+
+class FakeClient:
+    """Stands in for a docker client."""
+
+    def __init__(self, barrier=None):
+        self.containers = FakeContainers(barrier)
+
+
+def test_detach_labels_and_removes_in_parallel():
+    """Test containers are labelled and all removed concurrently."""
+    # Each removal blocks until all three run at once.
+    client = FakeClient(threading.Barrier(3))
+    with DockerContainer(client, "host", "sleep", count=3, labels={"a": "b"}).detach():
+        pass
+    for container in client.containers.started:
+        assert container.labels == {"a": "b", HARNESS_LABEL: OWNER}
+        assert container.removed
+
+
+def test_clean_tolerates_failures():
+    """Test a failing removal does not stop the others."""
+    client = FakeClient()
+    containers = DockerContainer(client, "host", "sleep", count=3)
+    with containers.detach():
+        client.containers.started[0].error = docker.errors.NotFound("gone")
+        client.containers.started[1].error = docker.errors.APIError("broken")
+    assert client.containers.started[2].removed
+
+
+def test_reap_containers():
+    """Test only the containers of harness processes that are gone are reaped."""
+    gone = subprocess.Popen(["true"])
+    gone.wait()
+    host = OWNER.rpartition(":")[0]
+    client = FakeClient()
+    client.containers.started = [
+        FakeContainer("leaked", {HARNESS_LABEL: "%s:%d" % (host, gone.pid)}),
+        FakeContainer("legacy", {HARNESS_LABEL: "true"}),
+        FakeContainer("live", {HARNESS_LABEL: OWNER}),
+        FakeContainer("remote", {HARNESS_LABEL: "elsewhere:%d" % gone.pid}),
+        FakeContainer("other", {})]
+    assert reap_containers(client) == 2
+    assert [c.name for c in client.containers.started if c.removed] == ["leaked", "legacy"]
@@ -0,0 +1,89 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""CPU lists and CPU utilization of machines.
+
+Only the standard library is used, so that runners outside the harness (e.g.
+experiments/) can parse CPU lists and check that CPUs are idle with the same
+functions.
+"""
+
+# IDLE_THRESHOLD is the largest fraction of time a CPU may be busy and still
+# count as idle.
+IDLE_THRESHOLD = 0.1
+
+
+def parse_cpus(cpus: str) -> list:
+    """Returns the sorted CPUs (or nodes) of a list such as "0-3,8"."""
+    parsed = set()
+    for item in cpus.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if "-" in item:
+            first, last = item.split("-", 1)
+            parsed.update(range(int(first), int(last) + 1))
+        else:
+            parsed.add(int(item))
+    return sorted(parsed)
+
+
+def format_cpus(cpus: list) -> str:
+    """Returns the shortest list of CPUs (or nodes), such as "0-3,8"."""
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(first) if first == last else "%d-%d" % (first, last)
+                    for first, last in ranges)
+
+
+def cpu_times(stat: str) -> dict:
+    """Returns the (busy, total) jiffies of each CPU in /proc/stat."""
+    times = {}
+    for line in stat.splitlines():
+        fields = line.split()
+        if not fields or not fields[0].startswith("cpu") or fields[0] == "cpu":
+            continue
+        values = [int(value) for value in fields[1:]]
+        # idle and iowait are the fourth and fifth fields.
+        idle = sum(values[3:5])
+        times[int(fields[0][len("cpu"):])] = (sum(values) - idle, sum(values))
+    return times
+
+
+def busy_cpus(machine, cpus: list, interval: float = 1.0,
+              threshold: float = IDLE_THRESHOLD) -> dict:
+    """Returns the CPUs that are busy on a machine.
+
+    :param machine: the machine; anything with run(cmd) -> (stdout, stderr)
+        and sleep(seconds).
+    :param cpus: the CPUs to check.
+    :param interval: the seconds to measure over.
+    :param threshold: the largest busy fraction of an idle CPU.
+    :return: a dict of busy CPUs to the fraction of time they were busy.
+        CPUs the machine does not report are taken as idle.
+    """
+    before, _ = machine.run("cat /proc/stat")
+    machine.sleep(interval)
+    after, _ = machine.run("cat /proc/stat")
+    before, after = cpu_times(before), cpu_times(after)
+    busy = {}
+    for cpu in cpus:
+        if cpu not in before or cpu not in after:
+            continue
+        total = after[cpu][1] - before[cpu][1]
+        if total > 0 and (after[cpu][0] - before[cpu][0]) / total > threshold:
+            busy[cpu] = (after[cpu][0] - before[cpu][0]) / total
+    return busy
@@ -0,0 +1,779 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Firecracker microVMs as a container runtime.
+
+Containers with runtime "firecracker" run their image in a microVM instead
+of a docker container, so that every benchmark can compare it with runc and
+runsc. Each microVM is launched and configured through the Firecracker API
+on its unix socket. The workload's root filesystem is the image's, exported
+once to an ext4 file with an init script that runs the image's command and
+powers off. The run's environment, working directory and command are passed
+on a second, small drive that the init script sources.
+
+With snapshot="full" or "diff", a microVM is booted once per configuration
+up to the point where it reads its command, and snapshotted. Each run then
+restores the snapshot, with the guest memory mapped from the memory file,
+and swaps in a fresh root filesystem and the run's drive, instead of
+booting. Diff snapshots only write the pages the guest touched. Snapshots
+need Firecracker 0.24 or later, and are cached in FIRECRACKER_SNAPSHOT_DIR.
+
+The microVMs run on the local machine. The binary and guest kernel default
+to FIRECRACKER_BIN and FIRECRACKER_KERNEL in the environment.
+"""
+
+import contextlib
+import functools
+import hashlib
+import http.client
+import json
+import logging
+import os
+import re
+import shlex
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import types
+import uuid
+
+from harness.container import Container
+from harness.cpus import parse_cpus
+
+# FIRECRACKER is the runtime name.
+FIRECRACKER = "firecracker"
+
+# BINARY and KERNEL are the default Firecracker binary and guest kernel.
+BINARY = os.environ.get("FIRECRACKER_BIN", "firecracker")
+KERNEL = os.environ.get("FIRECRACKER_KERNEL", "~/.benchmark-tools/firecracker/vmlinux")
+
+# ROOTFS_DIR caches the root filesystems exported from images.
+ROOTFS_DIR = os.environ.get("FIRECRACKER_ROOTFS_DIR", "~/.benchmark-tools/firecracker/rootfs")
+
+# SNAPSHOT_DIR caches the snapshots of booted microVMs.
+SNAPSHOT_DIR = os.environ.get("FIRECRACKER_SNAPSHOT_DIR",
+                              "~/.benchmark-tools/firecracker/snapshots")
+
+# SNAPSHOT_TYPES are the kinds of snapshot, by the snapshot argument.
+SNAPSHOT_TYPES = {"full": "Full", "diff": "Diff"}
+
+# INIT is the path of the init script in the root filesystems.
+INIT = "/sbin/benchmark-init"
+
+# BOOT_ARGS are the guest kernel arguments. Firecracker adds the root device.
+BOOT_ARGS = "console=ttyS0 reboot=k panic=1 pci=off quiet loglevel=1 init=" + INIT
+
+# SNAPSHOT_ARG is the kernel argument of microVMs booted to be snapshotted.
+SNAPSHOT_ARG = "benchmark.snapshot=1"
+
+# INIT_MARK is printed by the init script as it starts, followed by the guest's
+# uptime. READY marks a microVM booted to be snapshotted. START and END delimit
+# the workload's output on the serial console. END is followed by the
+# command's exit status.
+INIT_MARK = "=== benchmark-tools init"
+READY = "=== benchmark-tools ready ==="
+START = "=== benchmark-tools start ==="
+END = "=== benchmark-tools end"
+
+# INIT_SCRIPT mounts the pseudo filesystems, runs the command described on the
+# second drive, with its tmpfs mounts and links to its further drives, and
+# reboots, which stops Firecracker. Booted to be snapshotted,
+# it waits for the drive to be swapped for the run's, bypassing the page cache.
+INIT_SCRIPT = """#!/bin/sh
+export PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
+mount -t proc proc /proc
+echo "{init} $(cut -d' ' -f1 /proc/uptime)"
+mount -t sysfs sysfs /sys
+mount -t devtmpfs devtmpfs /dev 2>/dev/null
+mount -t tmpfs tmpfs /tmp
+mount -t tmpfs tmpfs /run 2>/dev/null
+if grep -q {snapshot_arg} /proc/cmdline; then
+  echo "{ready}"
+  until blockdev --flushbufs /dev/vdb 2>/dev/null || echo 3 > /proc/sys/vm/drop_caches
+        head -c 6 /dev/vdb | grep -q export; do
+    sleep 0.01
+  done
+fi
+. /dev/vdb
+for dir in $BENCHMARK_TMPFS; do
+  mkdir -p "$dir" && mount -t tmpfs tmpfs "$dir"
+done
+for link in $BENCHMARK_DEVICES; do
+  mkdir -p "$(dirname "${{link%%=*}}")" && ln -sf "${{link#*=}}" "${{link%%=*}}"
+done
+cd "${{BENCHMARK_WORKDIR:-/}}"
+echo "{start}"
+if [ -n "$BENCHMARK_STDERR" ]; then
+  sh -c "$BENCHMARK_COMMAND" 2>&1
+else
+  sh -c "$BENCHMARK_COMMAND" 2>/dev/null
+fi
+echo "{end} $?"
+sync
+echo 1 > /proc/sys/kernel/sysrq
+echo b > /proc/sysrq-trigger
+""".format(init=INIT_MARK, snapshot_arg=SNAPSHOT_ARG, ready=READY, start=START, end=END)
+
+# JOIN_CGROUP_SCRIPT moves a process to a cgroup, for cgroup v2 or v1, so that
+# microVMs are accounted like containers started with the same cgroup parent.
+JOIN_CGROUP_SCRIPT = """sudo sh -s <<'EOF'
+for root in /sys/fs/cgroup /sys/fs/cgroup/cpu /sys/fs/cgroup/cpuacct /sys/fs/cgroup/blkio; do
+  [ -f $root/cgroup.procs ] || continue
+  mkdir -p $root/{cgroup} && echo {pid} > $root/{cgroup}/cgroup.procs
+done
+EOF"""
+
+# SECTOR is the size that drive files are padded to, and ENV_DRIVE_SIZE the
+# least size of the drive describing a run, so that snapshots restore with
+# a drive of the same size.
+SECTOR = 4096
+ENV_DRIVE_SIZE = 16 * SECTOR
+
+# _SNAPSHOT_LOCK serializes the creation of snapshots.
+_SNAPSHOT_LOCK = threading.Lock()
+
+
+class FirecrackerError(Exception):
+    """An error returned by the Firecracker API."""
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a unix socket."""
+
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class FirecrackerClient:
+    """Client of the Firecracker API on a unix socket.
+
+    :param path: the API socket.
+    :param timeout: the seconds to wait for each request.
+    """
+
+    def __init__(self, path: str, timeout: float = 10.0):
+        self.path = path
+        self._timeout = timeout
+
+    def request(self, method: str, resource: str, body: dict = None) -> dict:
+        """Sends a request.
+
+        :return: the decoded response, or an empty dict if there is none.
+        :raises FirecrackerError: if the request is not successful.
+        """
+        connection = _UnixHTTPConnection(self.path, self._timeout)
+        try:
+            headers = {"Accept": "application/json"}
+            data = None
+            if body is not None:
+                data = json.dumps(body)
+                headers["Content-Type"] = "application/json"
+            connection.request(method, resource, body=data, headers=headers)
+            response = connection.getresponse()
+            payload = response.read().decode("utf-8")
+        finally:
+            connection.close()
+        result = json.loads(payload) if payload.strip() else {}
+        if response.status >= 300:
+            raise FirecrackerError("%s %s: %d %s" % (
+                method, resource, response.status,
+                result.get("fault_message", payload) if isinstance(result, dict) else payload))
+        return result
+
+    def put(self, resource: str, body: dict) -> dict:
+        """Sends a PUT request."""
+        return self.request("PUT", resource, body)
+
+    def patch(self, resource: str, body: dict) -> dict:
+        """Sends a PATCH request."""
+        return self.request("PATCH", resource, body)
+
+    def get(self, resource: str) -> dict:
+        """Sends a GET request."""
+        return self.request("GET", resource)
+
+
+def _accepts(path: str) -> bool:
+    """Returns whether a unix socket accepts connections."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+            return True
+        except OSError:
+            return False
+
+
+@functools.lru_cache()
+def firecracker_version(binary: str = BINARY) -> tuple:
+    """Returns the version of a Firecracker binary, e.g. (0, 21, 1)."""
+    output = subprocess.run([os.path.expanduser(binary), "--version"], stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, check=False).stdout.decode("utf-8")
+    match = re.search(r"v?(\d+)\.(\d+)\.(\d+)", output)
+    if not match:
+        raise FirecrackerError("unknown version of %s: %s" % (binary, output.strip()))
+    return tuple(int(part) for part in match.groups())
+
+
+def machine_config(vcpus: int, mem_mib: int, version: tuple,
+                   track_dirty_pages: bool = False) -> dict:
+    """Returns the machine configuration for a Firecracker version."""
+    config = {"vcpu_count": vcpus, "mem_size_mib": mem_mib}
+    # Hyperthreading was renamed SMT in 1.0, and was required before.
+    config["smt" if version >= (1, 0) else "ht_enabled"] = False
+    if track_dirty_pages:
+        config["track_dirty_pages"] = True
+    return config
+
+
+def snapshot_load(snapshot_path: str, mem_path: str, diff: bool, version: tuple) -> dict:
+    """Returns the request loading a snapshot, paused, for a Firecracker version."""
+    load = {"snapshot_path": snapshot_path, "enable_diff_snapshots": diff}
+    if version >= (1, 1):
+        load["mem_backend"] = {"backend_type": "File", "backend_path": mem_path}
+    else:
+        load["mem_file_path"] = mem_path
+    return load
+
+
+def write_drive(path: str, data: str, size: int = 0):
+    """Writes a drive file, padded with newlines to whole sectors and at
+    least size bytes."""
+    data = data.encode("utf-8")
+    data += b"\n" * max(-len(data) % SECTOR, size - len(data))
+    with open(path, "wb") as drive:
+        drive.write(data)
+
+
+def env_script(env: dict) -> str:
+    """Returns a shell script exporting the given variables."""
+    return "".join("export %s=%s\n" % (key, shlex.quote(str(value)))
+                   for key, value in env.items())
+
+
+def build_rootfs(client, image: str, directory: str = ROOTFS_DIR,
+                 headroom_mib: int = 1024) -> str:
+    """Exports an image to an ext4 root filesystem with the init script.
+
+    Filesystems are cached by image id, so each image is exported once.
+
+    :param client: a docker client.
+    :param image: the image.
+    :param directory: the cache directory.
+    :param headroom_mib: the free space of the filesystem, for the workload.
+    :return: the path of the filesystem.
+    """
+    directory = os.path.expanduser(directory)
+    image_id = client.images.get(image).id.split(":")[-1][:12]
+    # The filesystems of an older init script are not reused.
+    init_id = hashlib.sha256(INIT_SCRIPT.encode("utf-8")).hexdigest()[:8]
+    path = os.path.join(directory, "%s-%s.ext4" % (image_id, init_id))
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    logging.info("Exporting %s to %s...", image, path)
+    container = client.containers.create(image)
+    tree = tempfile.mkdtemp(dir=directory)
+    try:
+        untar = subprocess.Popen(["tar", "-x", "-C", tree, "--exclude=dev/*"],
+                                 stdin=subprocess.PIPE)
+        for chunk in container.export():
+            untar.stdin.write(chunk)
+        untar.stdin.close()
+        untar.wait()
+        with open(os.path.join(tree, INIT.lstrip("/")), "w") as init:
+            init.write(INIT_SCRIPT)
+        os.chmod(os.path.join(tree, INIT.lstrip("/")), 0o755)
+        used = int(subprocess.run(["du", "-sm", tree], stdout=subprocess.PIPE,
+                                  check=True).stdout.split()[0])
+        tmp = path + ".tmp"
+        subprocess.run(["mkfs.ext4", "-q", "-F", "-d", tree, tmp,
+                        "%dM" % (used * 5 // 4 + headroom_mib)], check=True)
+        os.replace(tmp, path)
+    finally:
+        container.remove(force=True)
+        shutil.rmtree(tree, ignore_errors=True)
+    return path
+
+
+#pylint: disable-msg=too-many-instance-attributes
+class MicroVM:
+    """A Firecracker microVM, configured through its API socket.
+
+    :param kernel: the guest kernel.
+    :param rootfs: the root filesystem, which the microVM writes to.
+    :param drives: further (drive id, path, read only) drives.
+    :param vcpus: the number of vCPUs.
+    :param mem_mib: the guest memory.
+    :param boot_args: the guest kernel arguments.
+    :param tap: the host tap device of the guest's eth0, if any.
+    :param binary: the Firecracker binary.
+    :param cpuset: the host CPUs to run the microVM on, e.g. "2-3".
+    :param mems: the host NUMA nodes to allocate guest memory from.
+    :param cgroup: the cgroup to run the microVM in, if any.
+    :param track_dirty_pages: whether to track dirty pages, for diff snapshots.
+    """
+
+    #pylint: disable-msg=too-many-arguments
+    def __init__(self, kernel: str, rootfs: str, drives: list = (), vcpus: int = 2,
+                 mem_mib: int = 1024, boot_args: str = BOOT_ARGS, tap: str = "",
+                 binary: str = BINARY, cpuset: str = "", mems: str = "",
+                 cgroup: str = "", track_dirty_pages: bool = False):
+        self.name = "firecracker-%s" % uuid.uuid4().hex[:12]
+        self.kernel = os.path.expanduser(kernel)
+        self.rootfs = rootfs
+        self.drives = list(drives)
+        self.vcpus = int(vcpus)
+        self.mem_mib = int(mem_mib)
+        self.boot_args = boot_args
+        self.tap = tap
+        self.binary = os.path.expanduser(binary)
+        self.cpuset = cpuset
+        self.mems = mems
+        self.cgroup = cgroup
+        self.track_dirty_pages = track_dirty_pages
+        self.workdir = tempfile.mkdtemp(prefix=self.name + "-")
+        self.client = FirecrackerClient(os.path.join(self.workdir, "api.socket"))
+        self.process = None
+        # The host times at which the microVM was launched, its API socket
+        # appeared, it was configured (or its snapshot loaded) and it was
+        # started (or resumed).
+        self.timestamps = {}
+
+    def launch(self, timeout: float = 5.0):
+        """Starts the Firecracker process and waits for its API socket."""
+        self.timestamps = {"launch": time.time()}
+        cmd = [self.binary, "--api-sock", self.client.path]
+        if self.mems:
+            cmd = ["numactl", "--membind=" + self.mems] + \
+                  (["--physcpubind=" + self.cpuset] if self.cpuset else []) + cmd
+        elif self.cpuset:
+            cmd = ["taskset", "-c", self.cpuset] + cmd
+        # The serial console is the process's output.
+        self.process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT)
+        if self.cgroup:
+            subprocess.run(JOIN_CGROUP_SCRIPT.format(cgroup=self.cgroup, pid=self.process.pid),
+                           shell=True, stdout=subprocess.DEVNULL, check=False)
+        deadline = time.time() + timeout
+        # The socket exists before it is listened on.
+        while not _accepts(self.client.path):
+            if self.process.poll() is not None or time.time() > deadline:
+                output = self.process.stdout.read().decode("utf-8", "replace") \
+                    if self.process.poll() is not None else ""
+                self.stop()
+                raise FirecrackerError("%s did not start: %s" % (self.binary, output.strip()))
+            time.sleep(0.01)
+        self.timestamps["api"] = time.time()
+
+    def configure(self):
+        """Configures the boot source, drives, machine and network."""
+        self.client.put("/boot-source", {"kernel_image_path": self.kernel,
+                                         "boot_args": self.boot_args})
+        self.client.put("/drives/rootfs", {"drive_id": "rootfs", "path_on_host": self.rootfs,
+                                           "is_root_device": True, "is_read_only": False})
+        for drive_id, path, read_only in self.drives:
+            self.client.put("/drives/" + drive_id, {"drive_id": drive_id, "path_on_host": path,
+                                                    "is_root_device": False,
+                                                    "is_read_only": read_only})
+        self.client.put("/machine-config",
+                        machine_config(self.vcpus, self.mem_mib, firecracker_version(self.binary),
+                                       self.track_dirty_pages))
+        if self.tap:
+            self.client.put("/network-interfaces/eth0", {"iface_id": "eth0",
+                                                         "guest_mac": "AA:FC:00:00:00:01",
+                                                         "host_dev_name": self.tap})
+
+    def start(self):
+        """Launches, configures and boots the microVM."""
+        self.launch()
+        try:
+            self.configure()
+            self.timestamps["configured"] = time.time()
+            self.client.put("/actions", {"action_type": "InstanceStart"})
+            self.timestamps["started"] = time.time()
+        except Exception:
+            self.stop(timeout=0)
+            raise
+
+    def pause(self):
+        """Pauses the vCPUs."""
+        self.client.patch("/vm", {"state": "Paused"})
+
+    def resume(self):
+        """Resumes the vCPUs."""
+        self.client.patch("/vm", {"state": "Resumed"})
+
+    def snapshot(self, snapshot_path: str, mem_path: str, diff: bool = False):
+        """Snapshots the paused microVM to the given files."""
+        self.client.put("/snapshot/create", {"snapshot_type": "Diff" if diff else "Full",
+                                             "snapshot_path": snapshot_path,
+                                             "mem_file_path": mem_path})
+
+    def restore(self, snapshot):
+        """Launches the microVM from a snapshot, with its own drives, and resumes it.
+
+        :param snapshot: the Snapshot.
+        """
+        self.launch()
+        try:
+            self.client.put("/snapshot/load", snapshot_load(
+                snapshot.vmstate, snapshot.memory, snapshot.diff,
+                firecracker_version(self.binary)))
+            # The snapshot's drives are replaced by this microVM's.
+            self.client.patch("/drives/rootfs", {"drive_id": "rootfs",
+                                                 "path_on_host": self.rootfs})
+            for drive_id, path, _ in self.drives:
+                self.client.patch("/drives/" + drive_id, {"drive_id": drive_id,
+                                                          "path_on_host": path})
+            self.timestamps["configured"] = time.time()
+            self.resume()
+            self.timestamps["started"] = time.time()
+        except Exception:
+            self.stop(timeout=0)
+            raise
+
+    def console(self) -> types.GeneratorType:
+        """Yields (timestamp, line) of the serial console until the microVM stops."""
+        for line in iter(self.process.stdout.readline, b""):
+            yield time.time(), line.decode("utf-8", "replace").replace("\r\n", "\n")
+
+    def stop(self, timeout: float = 10.0):
+        """Waits for the microVM to stop, killing it after timeout, and cleans up."""
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process.stdout.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class Snapshot:
+    """A snapshot of a microVM booted up to reading its command, with the
+    root filesystem at that point.
+
+    :param directory: the directory of the snapshot files.
+    :param diff: whether the snapshot is a diff snapshot.
+    """
+
+    def __init__(self, directory: str, diff: bool = False):
+        self.directory = directory
+        self.diff = diff
+        self.vmstate = os.path.join(directory, "vmstate")
+        self.memory = os.path.join(directory, "memory")
+        self.rootfs = os.path.join(directory, "rootfs.ext4")
+
+    def exists(self) -> bool:
+        """Returns whether the snapshot was created."""
+        return os.path.isdir(self.directory)
+
+    def create(self, vm: MicroVM):
+        """Boots a microVM until it waits for its command, and snapshots it.
+
+        :param vm: the microVM, booted with SNAPSHOT_ARG.
+        """
+        version = firecracker_version(vm.binary)
+        if version < (0, 24):
+            raise FirecrackerError("snapshots need Firecracker 0.24 or later, not %s" %
+                                   ".".join(str(part) for part in version))
+        logging.info("Creating %s snapshot %s...", "diff" if self.diff else "full",
+                     self.directory)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(self.directory))
+        vm.start()
+        try:
+            for _, line in vm.console():
+                if line.strip() == READY:
+                    break
+            else:
+                raise FirecrackerError("%s stopped before it was ready" % vm.name)
+            vm.pause()
+            vm.snapshot(os.path.join(tmp, "vmstate"), os.path.join(tmp, "memory"), self.diff)
+            # Paused, the guest does not write to the root filesystem.
+            shutil.copyfile(vm.rootfs, os.path.join(tmp, "rootfs.ext4"))
+            os.rename(tmp, self.directory)
+        finally:
+            vm.stop(timeout=0)
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def boot_phases(timestamps: dict, marks: dict) -> dict:
+    """Returns the seconds each phase of a microVM's start took.
+
+    The phases are "vmm" (until the API socket appeared), "api" (the
+    configuration, or snapshot load, until the start or resume returned),
+    then for a boot "kernel" (until the init script ran) and "init" (until
+    the workload started), or for a restore "resume", and finally "workload"
+    (until its first output) and "total". "kernel_guest" is the kernel's boot
+    by the guest's clock.
+
+    :param timestamps: the MicroVM's timestamps.
+    :param marks: the host times of the console's "init", "start" and first
+        "output" lines, and the guest's "uptime" at init.
+    """
+    phases = {"vmm": timestamps["api"] - timestamps["launch"],
+              "api": timestamps["started"] - timestamps["api"]}
+    if "init" in marks:
+        phases["kernel"] = marks["init"] - timestamps["started"]
+        phases["kernel_guest"] = marks["uptime"]
+        phases["init"] = marks["start"] - marks["init"]
+    else:
+        phases["resume"] = marks["start"] - timestamps["started"]
+    phases["workload"] = marks["output"] - marks["start"]
+    phases["total"] = marks["output"] - timestamps["launch"]
+    return phases
+
+
+#pylint: disable-msg=too-many-instance-attributes
+class FirecrackerContainer(Container):
+    """Runs a container image in a Firecracker microVM.
+
+    Volumes of host files are attached as virtio-blk drives, linked from
+    their container path, and tmpfs mounts are mounted by the init script.
+    Other Docker-specific arguments (e.g. directory volumes) have no effect.
+    The cgroup parent and cpuset are those of the Firecracker process.
+
+    :param client: a docker client, to export and inspect the image.
+    :param image: the image.
+    :param count: the number of microVMs; only one is supported.
+    :param runtime: the runtime, "firecracker".
+    :param port: the guest port of address().
+    :param kernel: the guest kernel.
+    :param rootfs: a root filesystem to use instead of exporting the image.
+    :param vcpus: the number of vCPUs; by default those of the cpuset, or 2.
+    :param mem_mib: the guest memory.
+    :param tap: the host tap device of the guest's network, if any.
+    :param guest_ip: the guest address on the tap network.
+    :param host_ip: the host address on the tap network.
+    :param command: the command to run instead of the image's.
+    :param stderr: whether the output includes the command's stderr.
+    :param cpuset_cpus: the host CPUs of the microVM.
+    :param cpuset_mems: the host NUMA nodes of the guest memory.
+    :param cgroup_parent: the cgroup of the Firecracker process.
+    :param binary: the Firecracker binary.
+    :param snapshot: "full" or "diff" to restore each run from a snapshot
+        instead of booting.
+    :param volumes: docker volumes, of which host files become drives.
+    :param tmpfs: docker tmpfs mounts.
+    """
+
+    #pylint: disable-msg=too-many-arguments,too-many-locals,unused-argument
+    def __init__(self, client, image: str, count: int = 1, runtime: str = FIRECRACKER,
+                 port: int = 0, kernel: str = KERNEL, rootfs: str = "", vcpus: int = 0,
+                 mem_mib: int = 1024, tap: str = "", guest_ip: str = "172.16.0.2",
+                 host_ip: str = "172.16.0.1", command=None, stderr: bool = False,
+                 cpuset_cpus: str = "", cpuset_mems: str = "", cgroup_parent: str = "",
+                 binary: str = BINARY, snapshot: str = "", volumes: dict = None,
+                 tmpfs: dict = None, **kwargs):
+        assert int(count) == 1, "only one microVM per container is supported"
+        if snapshot and snapshot not in SNAPSHOT_TYPES:
+            raise ValueError("snapshot must be one of %s, not %s" % (
+                ", ".join(SNAPSHOT_TYPES), snapshot))
+        # The host files of volumes, in the order of their drives.
+        self._files = [(path, volume) for path, volume in (volumes or {}).items()
+                       if os.path.isfile(path)]
+        for path in volumes or {}:
+            if not os.path.isfile(path):
+                logging.warning("%s: volume %s is not a file, and not shared", image, path)
+        if self._files and snapshot:
+            raise ValueError("snapshots cannot restore volumes: run without snapshot")
+        self._tmpfs = list(tmpfs or {})
+        self._client = client
+        self._image = image
+        self._port = port
+        self._kernel = kernel
+        self._rootfs = rootfs
+        self._vcpus = int(vcpus) or (len(parse_cpus(cpuset_cpus)) if cpuset_cpus else 2)
+        self._mem_mib = int(mem_mib)
+        self._tap = tap
+        self._guest_ip = guest_ip
+        self._host_ip = host_ip
+        self._command = command
+        self._stderr = stderr
+        self._cpuset = cpuset_cpus
+        self._mems = cpuset_mems
+        self._cgroup = cgroup_parent
+        self._binary = binary
+        self._snapshot = snapshot
+        self._vm = None
+        self._startup = None
+        self._phases = {}
+        self._output = []
+
+    def _image_config(self) -> dict:
+        """Returns the image's docker configuration."""
+        if self._client is None:
+            return {}
+        return self._client.images.get(self._image).attrs.get("Config") or {}
+
+    def _vm_for(self, env: dict) -> (MicroVM, Snapshot):
+        """Returns a microVM set up to run the image with the given environment,
+        and the snapshot to restore it from, if any."""
+        config = self._image_config()
+        command = self._command
+        if command is None:
+            command = (config.get("Entrypoint") or []) + (config.get("Cmd") or [])
+        if not isinstance(command, str):
+            command = " ".join(shlex.quote(arg) for arg in command)
+        variables = dict(item.split("=", 1) for item in config.get("Env") or [])
+        variables.update(env)
+        variables["BENCHMARK_WORKDIR"] = config.get("WorkingDir") or "/"
+        variables["BENCHMARK_COMMAND"] = command
+        if self._stderr:
+            variables["BENCHMARK_STDERR"] = "1"
+        if self._tmpfs:
+            variables["BENCHMARK_TMPFS"] = " ".join(self._tmpfs)
+        if self._files:
+            # Drives after the root and env drives, /dev/vda and /dev/vdb.
+            variables["BENCHMARK_DEVICES"] = " ".join(
+                "%s=/dev/vd%s" % (volume["bind"], chr(ord("c") + index))
+                for index, (_, volume) in enumerate(self._files))
+        rootfs = self._rootfs or build_rootfs(self._client, self._image)
+        boot_args = BOOT_ARGS
+        if self._tap:
+            boot_args += " ip=%s::%s:255.255.255.0::eth0:off" % (self._guest_ip, self._host_ip)
+        snapshot = None
+        if self._snapshot:
+            boot_args += " " + SNAPSHOT_ARG
+            snapshot = self._snapshot_of(rootfs, boot_args)
+            # Restored microVMs continue from the snapshot's filesystem.
+            rootfs = snapshot.rootfs
+        vm = self._new_vm(rootfs, boot_args)
+        env_drive = os.path.join(vm.workdir, "env")
+        write_drive(env_drive, env_script(variables), ENV_DRIVE_SIZE)
+        vm.drives.append(("env", env_drive, True))
+        for index, (path, volume) in enumerate(self._files):
+            vm.drives.append(("volume%d" % index, path, volume.get("mode") == "ro"))
+        return vm, snapshot
+
+    def _new_vm(self, rootfs: str, boot_args: str) -> MicroVM:
+        """Returns a microVM with its own copy of the given root filesystem."""
+        vm = MicroVM(self._kernel, rootfs, vcpus=self._vcpus, mem_mib=self._mem_mib,
+                     boot_args=boot_args, tap=self._tap, binary=self._binary,
+                     cpuset=self._cpuset, mems=self._mems, cgroup=self._cgroup,
+                     track_dirty_pages=self._snapshot == "diff")
+        vm.rootfs = os.path.join(vm.workdir, "rootfs.ext4")
+        shutil.copyfile(rootfs, vm.rootfs)
+        return vm
+
+    def _snapshot_of(self, rootfs: str, boot_args: str) -> Snapshot:
+        """Returns the snapshot of the configuration, creating it if needed."""
+        key = json.dumps([os.path.abspath(rootfs), os.path.expanduser(self._kernel),
+                          self._vcpus, self._mem_mib, boot_args, self._tap,
+                          firecracker_version(self._binary), self._snapshot])
+        directory = os.path.join(os.path.expanduser(SNAPSHOT_DIR),
+                                 hashlib.sha256(key.encode("utf-8")).hexdigest()[:16])
+        snapshot = Snapshot(directory, diff=self._snapshot == "diff")
+        with _SNAPSHOT_LOCK:
+            if not snapshot.exists():
+                os.makedirs(os.path.dirname(directory), exist_ok=True)
+                vm = self._new_vm(rootfs, boot_args)
+                env_drive = os.path.join(vm.workdir, "env")
+                write_drive(env_drive, "", ENV_DRIVE_SIZE)
+                vm.drives.append(("env", env_drive, True))
+                snapshot.create(vm)
+        return snapshot
+
+    def stream(self, **env) -> types.GeneratorType:
+        vm, snapshot = self._vm_for(env)
+        self._vm = vm
+        self._startup = None
+        self._phases = {}
+        if snapshot is not None:
+            vm.restore(snapshot)
+        else:
+            vm.start()
+        marks = {}
+        status = None
+        try:
+            for timestamp, line in vm.console():
+                if "start" not in marks:
+                    if line.startswith(INIT_MARK):
+                        marks["init"] = timestamp
+                        marks["uptime"] = float(line[len(INIT_MARK):].strip() or 0)
+                    elif line.strip() == START:
+                        marks["start"] = timestamp
+                        self._startup = timestamp - vm.timestamps["launch"]
+                    continue
+                marks.setdefault("output", timestamp)
+                if line.startswith(END):
+                    status = line[len(END):].strip()
+                    break
+                yield timestamp, line
+        finally:
+            vm.stop()
+            self._vm = None
+        if status is None:
+            raise FirecrackerError("%s stopped before its workload finished" % vm.name)
+        self._phases = boot_phases(vm.timestamps, marks)
+        if status != "0":
+            logging.warning("%s: %s exited with status %s", vm.name, self._image, status)
+
+    def run(self, **env):
+        return "".join(line for _, line in self.stream(**env))
+
+    @contextlib.contextmanager
+    def detach(self, **env):
+        lines = self.stream(**env)
+        self._output = []
+        # Start the microVM, then read its output in the background.
+        thread = threading.Thread(target=lambda: self._output.extend(lines), daemon=True)
+        thread.start()
+        try:
+            deadline = time.time() + 60
+            while self._vm is None and thread.is_alive() and time.time() < deadline:
+                time.sleep(0.01)
+            yield self
+        finally:
+            if self._vm is not None and self._vm.process is not None:
+                self._vm.process.terminate()
+            thread.join()
+
+    def address(self) -> (str, int):
+        assert self._port != 0
+        return (self._guest_ip, self._port)
+
+    def startup(self) -> float:
+        return self._startup
+
+    def boot_phases(self) -> dict:
+        return self._phases
+
+    def get_names(self) -> types.GeneratorType:
+        if self._vm is not None:
+            yield self._vm.name
+
+    def get_pids(self) -> types.GeneratorType:
+        if self._vm is not None and self._vm.process is not None:
+            yield self._vm.name, self._vm.process.pid
+
+    def network(self) -> dict:
+        totals = {"rx_bytes": 0, "tx_bytes": 0}
+        if not self._tap:
+            return totals
+        # The host receives what the guest sends, and the other way round.
+        for key, host_key in (("rx_bytes", "tx_bytes"), ("tx_bytes", "rx_bytes")):
+            path = "/sys/class/net/%s/statistics/%s" % (self._tap, host_key)
+            if os.path.exists(path):
+                with open(path) as counter:
+                    totals[key] = int(counter.read())
+        return totals
+
@@ -0,0 +1,213 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the Firecracker runtime."""
+
+import os
+import stat
+import sys
+
+import pytest
+
+from harness import firecracker
+from harness.firecracker import FirecrackerContainer, FirecrackerError
+
+# FAKE_FIRECRACKER serves the API on its socket, recording the requests, and
+# on InstanceStart, or on resuming a snapshot, prints the env drive as the
+# workload's output. Booted to be snapshotted, it prints the ready marker.
+FAKE_FIRECRACKER = """#!{python}
+import http.server, json, os, socketserver, sys
+
+if sys.argv[1] == "--version":
+    print("Firecracker v{version}")
+    sys.exit(0)
+path = sys.argv[2]
+drives = {{}}
+boot_args = []
+
+def workload():
+    print("{start}\\r")
+    sys.stdout.write(open(drives["env"]).read().strip() + "\\r\\n")
+    print("{end} 0\\r")
+    sys.stdout.flush()
+    os._exit(0)
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_PATCH(self):
+        self.do_PUT()
+
+    def do_PUT(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with open(os.path.join(os.path.dirname(path), "..", "requests"), "a") as log:
+            log.write(json.dumps([self.path, body]) + "\\n")
+        if self.path.startswith("/drives/"):
+            drives[body["drive_id"]] = body["path_on_host"]
+        if self.path == "/boot-source":
+            boot_args.append(body["boot_args"])
+        if self.path == "/snapshot/create":
+            for name in ["snapshot_path", "mem_file_path"]:
+                open(body[name], "w").write(name)
+        if self.path == "/machine-config" and body["vcpu_count"] > 32:
+            self.send_response(400)
+            self.end_headers()
+            self.wfile.write(b'{{"fault_message": "too many vCPUs"}}')
+            return
+        self.send_response(204)
+        self.end_headers()
+        if self.path == "/actions":
+            print("booting\\r")
+            print("{init} 0.125\\r")
+            if "{snapshot_arg}" in boot_args[0]:
+                print("{ready}\\r", flush=True)
+            else:
+                workload()
+        if self.path == "/vm" and body["state"] == "Resumed":
+            workload()
+
+    def log_message(self, *args):
+        pass
+
+class Server(socketserver.UnixStreamServer):
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+Server(path, Handler).serve_forever()
+"""
+
+
+def fake_firecracker(tmpdir, version="0.21.1") -> str:
+    """Writes the fake binary and returns its path."""
+    path = os.path.join(str(tmpdir), "bin", "firecracker")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w") as binary:
+        binary.write(FAKE_FIRECRACKER.format(python=sys.executable, version=version,
+                                             init=firecracker.INIT_MARK,
+                                             start=firecracker.START, end=firecracker.END,
+                                             ready=firecracker.READY,
+                                             snapshot_arg=firecracker.SNAPSHOT_ARG))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+def container(tmpdir, version="0.21.1", **kwargs) -> FirecrackerContainer:
+    """Returns a container running on the fake binary."""
+    rootfs = tmpdir.join("rootfs.ext4")
+    rootfs.write("rootfs")
+    return FirecrackerContainer(None, "sysbench", rootfs=str(rootfs),
+                                kernel=str(tmpdir.join("vmlinux")),
+                                binary=fake_firecracker(tmpdir, version), **kwargs)
+
+
+def requests(tmpdir) -> list:
+    """Returns the API requests of the fake binary."""
+    # The fake binary logs next to the microVM's directory.
+    return tmpdir.join("requests").readlines()
+
+
+def test_run(tmpdir, monkeypatch):
+    """Test the microVM is configured and the workload's output returned."""
+    monkeypatch.setattr(firecracker.tempfile, "tempdir", str(tmpdir))
+    fake = container(tmpdir, command=["sysbench", "cpu", "run"], cpuset_cpus="0-2")
+    output = fake.run(threads="4 5")
+    assert output.splitlines()[-3:] == [
+        "export threads='4 5'",
+        "export BENCHMARK_WORKDIR=/",
+        "export BENCHMARK_COMMAND='sysbench cpu run'",
+    ]
+    log = "".join(requests(tmpdir))
+    for resource in ["/boot-source", "/drives/rootfs", "/drives/env", "/machine-config",
+                     "/actions"]:
+        assert '["%s"' % resource in log
+    # Three vCPUs for the cpuset, without hyperthreading on 0.x.
+    assert '"vcpu_count": 3' in log and '"ht_enabled": false' in log
+    assert "/network-interfaces" not in log
+    assert "/snapshot" not in log
+    # The boot's phases, from the API calls and the console.
+    phases = fake.boot_phases()
+    assert list(phases) == ["vmm", "api", "kernel", "kernel_guest", "init", "workload", "total"]
+    assert phases["kernel_guest"] == 0.125
+    assert all(seconds >= 0 for seconds in phases.values())
+    assert phases["total"] >= fake.startup()
+
+
+def test_smt(tmpdir, monkeypatch):
+    """Test machine configuration of Firecracker 1.0 and later."""
+    monkeypatch.setattr(firecracker.tempfile, "tempdir", str(tmpdir))
+    container(tmpdir, version="1.4.0", command="true", tap="tap0").run()
+    log = "".join(requests(tmpdir))
+    assert '"smt": false' in log and "ht_enabled" not in log
+    assert '"host_dev_name": "tap0"' in log and "ip=172.16.0.2::172.16.0.1:" in log
+
+
+def test_api_error(tmpdir, monkeypatch):
+    """Test API errors are raised with Firecracker's message."""
+    monkeypatch.setattr(firecracker.tempfile, "tempdir", str(tmpdir))
+    with pytest.raises(FirecrackerError, match="too many vCPUs"):
+        container(tmpdir, command="true", vcpus=64).run()
+
+
+def test_volumes(tmpdir, monkeypatch):
+    """Test file volumes become drives and tmpfs mounts are passed to init."""
+    monkeypatch.setattr(firecracker.tempfile, "tempdir", str(tmpdir))
+    raw = tmpdir.join("file.raw")
+    raw.write("")
+    output = container(tmpdir, command="true", tmpfs={"/scratch": ""},
+                       volumes={str(raw): {"bind": "/disk/file.raw", "mode": "rw"},
+                                str(tmpdir): {"bind": "/dir", "mode": "rw"}}).run()
+    assert "export BENCHMARK_TMPFS=/scratch" in output
+    assert "export BENCHMARK_DEVICES=/disk/file.raw=/dev/vdc" in output
+    drives = [line for line in requests(tmpdir) if line.startswith('["/drives/')]
+    assert [line.split('"')[1] for line in drives] == [
+        "/drives/rootfs", "/drives/env", "/drives/volume0"]
+    assert str(raw) in drives[-1] and '"is_read_only": false' in drives[-1]
+    with pytest.raises(ValueError, match="snapshots cannot restore volumes"):
+        FirecrackerContainer(None, "sysbench", snapshot="full",
+                             volumes={str(raw): {"bind": "/disk/file.raw"}})
+
+
+def test_write_drive(tmpdir):
+    """Test drives are padded to whole sectors."""
+    path = str(tmpdir.join("env"))
+    firecracker.write_drive(path, firecracker.env_script({"a": "b c"}))
+    data = open(path).read()
+    assert len(data) == firecracker.SECTOR
+    assert data.startswith("export a='b c'\n")
+
+
+def test_snapshot(tmpdir, monkeypatch):
+    """Test runs restore a snapshot created once, with their own drives."""
+    monkeypatch.setattr(firecracker.tempfile, "tempdir", str(tmpdir))
+    monkeypatch.setattr(firecracker, "SNAPSHOT_DIR", str(tmpdir.join("snapshots")))
+    fake = container(tmpdir, version="1.4.0", command="true", snapshot="diff")
+    assert fake.run(threads=1).splitlines()[0] == "export threads=1"
+    assert fake.run(threads=2).splitlines()[0] == "export threads=2"
+    assert fake.startup() > 0
+    assert list(fake.boot_phases()) == ["vmm", "api", "resume", "workload", "total"]
+    log = requests(tmpdir)
+    # One boot, snapshotted with dirty page tracking, and two restores.
+    assert sum('"InstanceStart"' in line for line in log) == 1
+    assert sum(line.startswith('["/snapshot/create"') for line in log) == 1
+    assert '"track_dirty_pages": true' in "".join(log)
+    loads = [line for line in log if line.startswith('["/snapshot/load"')]
+    assert len(loads) == 2 and all('"backend_type": "File"' in line for line in loads)
+    # The restored microVMs run on copies of the snapshot's filesystem.
+    rootfs = [line for line in log if line.startswith('["/drives/rootfs"')]
+    assert len(set(rootfs)) == 3
+
+
+def test_snapshot_version(tmpdir, monkeypatch):
+    """Test snapshots need Firecracker 0.24."""
+    monkeypatch.setattr(firecracker.tempfile, "tempdir", str(tmpdir))
+    monkeypatch.setattr(firecracker, "SNAPSHOT_DIR", str(tmpdir.join("snapshots")))
+    with pytest.raises(FirecrackerError, match="0.24 or later"):
+        container(tmpdir, command="true", snapshot="full").run()
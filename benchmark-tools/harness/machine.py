@@ -12,14 +12,19 @@
 # limitations under the License.
 """Machine abstraction. This is the primary API for benchmarks."""
 
+import asyncio
 import logging
+import os
+import signal
 import subprocess
 import re
 import time
+import typing
 import docker
 
 from harness import LOCAL_WORKLOADS_PATH, tunnel_dispatcher, ssh_connection
-from harness.container import Container, MockContainer, DockerContainer
+from harness.container import Container, MockContainer, DockerContainer, reap_containers
+from harness.firecracker import FIRECRACKER, FirecrackerContainer
 
 
 class Machine:
@@ -37,6 +42,36 @@ class Machine:
         """
         raise NotImplementedError
 
+    def run_stream(self, cmd: str) -> typing.AsyncIterator[str]:
+        """Runs a bash command and streams its output as it is produced.
+
+        Usage:
+
+        async for line in machine.run_stream("vmstat 1"):
+            ...
+
+        Stopping the iteration early terminates the command.
+
+        :param cmd: command to run as a string.
+        :return: an async iterator over lines of combined stdout and stderr.
+        """
+        raise NotImplementedError
+
+    async def run_many(self, cmds: list) -> list:
+        """Runs several bash commands concurrently. This is a coroutine; from
+        synchronous code, asyncio.run(machine.run_many(cmds)) blocks until all
+        commands have finished.
+
+        By default each command is run with run() on the event loop's default
+        executor, which bounds the number of commands in flight.
+
+        :param cmds: commands to run as strings.
+        :return: a (stdout, stderr) tuple for each command, in order.
+        """
+        loop = asyncio.get_running_loop()
+        return list(await asyncio.gather(
+            *[loop.run_in_executor(None, self.run, cmd) for cmd in cmds]))
+
     def read(self, path: str) -> str:
         """Reads the contents of some file. This will be mocked.
 
@@ -67,6 +102,13 @@ class Machine:
         """Sleeps the given amount of time."""
         raise NotImplementedError
 
+    def close(self):
+        """Releases any connections held by the machine. The machine remains
+        usable and reconnects on next use."""
+
+    def reap(self):
+        """Removes containers left behind on the machine by earlier runs."""
+
 
 class MockMachine(Machine):
     """A mocked machine."""
@@ -74,6 +116,11 @@ class MockMachine(Machine):
     def run(self, cmd: str) -> (str, str):
         return "", ""
 
+    async def run_stream(self, cmd: str) -> typing.AsyncIterator[str]:
+        stdout, stderr = self.run(cmd)
+        for line in (stdout + stderr).splitlines(keepends=True):
+            yield line
+
     def read(self, path: str) -> str:
         # Load the contents from the machine_mocks directory.
         return open("harness/machine_mocks/%s" % path, "r").read()
@@ -87,6 +134,9 @@ class MockMachine(Machine):
     def sleep(self, amount: float):
         pass
 
+    def __str__(self):
+        return "mock"
+
 
 def get_address(machine: Machine) -> str:
     """Return a machine's default address."""
@@ -99,16 +149,40 @@ class LocalMachine(Machine):
 
     def __init__(self, name):
         self._name = name
-        self._docker_client = docker.from_env()
+        self._docker_client = None
 
     def __str__(self):
         return self._name
 
     def run(self, cmd: str) -> (str, str):
-        process = subprocess.Popen(cmd.split(" "), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         stdout, stderr = process.communicate()
         return stdout.decode("utf-8"), stderr.decode("utf-8")
 
+    async def run_stream(self, cmd: str) -> typing.AsyncIterator[str]:
+        # Run in a new session so the whole process group can be killed.
+        process = await asyncio.create_subprocess_shell(
+            cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True)
+        try:
+            async for line in process.stdout:
+                yield line.decode("utf-8")
+        finally:
+            if process.returncode is None:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            await process.wait()
+
+    async def run_many(self, cmds: list) -> list:
+        async def run(cmd: str) -> (str, str):
+            process = await asyncio.create_subprocess_shell(
+                cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            stdout, stderr = await process.communicate()
+            return stdout.decode("utf-8"), stderr.decode("utf-8")
+        return list(await asyncio.gather(*[run(cmd) for cmd in cmds]))
+
     def read(self, path: str) -> str:
         # Read the exact path locally.
         return open(path, 'r').read()
@@ -124,8 +198,20 @@ class LocalMachine(Machine):
         return workload # Workload is the tag.
 
     def container(self, image: str, **kwargs) -> Container:
+        if kwargs.get("runtime") == FIRECRACKER:
+            # Run the image in a microVM on this machine.
+            return FirecrackerContainer(self._client(), image, **kwargs)
         # Return a local docker container directly.
-        return DockerContainer(self._docker_client, get_address(self), image, **kwargs)
+        return DockerContainer(self._client(), get_address(self), image, **kwargs)
+
+    def reap(self):
+        reap_containers(self._client())
+
+    def _client(self) -> docker.DockerClient:
+        """Returns the docker client, creating it on first use."""
+        if self._docker_client is None:
+            self._docker_client = docker.from_env()
+        return self._docker_client
 
     def sleep(self, amount: float):
         time.sleep(amount)
@@ -137,9 +223,9 @@ class RemoteMachine(Machine):
     def __init__(self, name, **kwargs):
         self._name = name
         self._ssh_connection = ssh_connection.SSHConnection(name, **kwargs)
-        self._tunnel = tunnel_dispatcher.Tunnel(name, **kwargs)
+        self._tunnel = tunnel_dispatcher.Tunnel(self._ssh_connection)
         self._tunnel.connect()
-        self._docker_client = self._tunnel.get_docker_client()
+        self._docker_client = None
 
     def __str__(self):
         return self._name
@@ -147,6 +233,22 @@ class RemoteMachine(Machine):
     def run(self, cmd: str) -> (str, str):
         return self._ssh_connection.run(cmd)
 
+    async def run_stream(self, cmd: str) -> typing.AsyncIterator[str]:
+        # paramiko is blocking, so each line is read on the default executor.
+        loop = asyncio.get_running_loop()
+        channel = await loop.run_in_executor(None, self._ssh_connection.exec_stream, cmd)
+        output = channel.makefile("rb")
+        try:
+            while True:
+                line = await loop.run_in_executor(None, output.readline)
+                if not line:
+                    return
+                # The pty translates newlines.
+                yield line.decode("utf-8").replace("\r\n", "\n")
+        finally:
+            # This also wakes up a readline still blocked in the executor.
+            channel.close()
+
     def read(self, path: str) -> str:
         # Just cat remotely.
         stdout, stderr = self._ssh_connection.run("cat '{}'".format(path))
@@ -160,12 +262,29 @@ class RemoteMachine(Machine):
         return workload # Workload is the tag.
 
     def container(self, image: str, **kwargs) -> Container:
+        if kwargs.get("runtime") == FIRECRACKER:
+            raise NotImplementedError("firecracker runs on local machines only")
         # Return a remote docker container.
-        return DockerContainer(self._docker_client, get_address(self), image, **kwargs)
+        return DockerContainer(self._client(), get_address(self), image, **kwargs)
+
+    def reap(self):
+        reap_containers(self._client())
 
     def sleep(self, amount: float):
         time.sleep(amount)
 
+    def close(self):
+        if self._docker_client is not None:
+            self._docker_client.close()
+            self._docker_client = None
+        self._ssh_connection.close()
+
+    def _client(self) -> docker.DockerClient:
+        """Returns the docker client, creating it if the machine was closed."""
+        if self._docker_client is None:
+            self._docker_client = self._tunnel.get_docker_client()
+        return self._docker_client
+
 
 class GCPMachine(MockMachine):
     """Remote machine backed by GCP VM. Created by GCPMachineProducer"""
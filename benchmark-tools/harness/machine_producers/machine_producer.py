@@ -22,3 +22,6 @@ class MachineProducer:
     def release_machines(self, machine_list):
         """Releases the given set of machines."""
         raise NotImplementedError
+
+    def close(self):
+        """Releases any resources held by the producer, such as booted guests."""
@@ -0,0 +1,65 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Producers recording or replaying machine outputs."""
+
+import harness.machine_producers.machine_producer as mp
+from harness.replay import Archive, RecordingMachine, ReplayMachine
+
+
+class RecordingMachineProducer(mp.MachineProducer):
+    """Wraps the machines of another producer to record their outputs.
+
+    The archive is only written by save().
+    """
+
+    def __init__(self, producer: mp.MachineProducer, path: str):
+        self._producer = producer
+        self.archive = Archive(path)
+
+    def get_machines(self, num_machines) -> list:
+        """Returns recording wrappers of the producer's machines."""
+        return [RecordingMachine(self.archive, slot, machine) for slot, machine in
+                enumerate(self._producer.get_machines(num_machines))]
+
+    def release_machines(self, machine_list):
+        """Releases the wrapped machines."""
+        self._producer.release_machines([machine.machine for machine in machine_list])
+
+    def save(self):
+        """Writes the recorded outputs."""
+        self.archive.save()
+
+    def close(self):
+        """Closes the wrapped producer."""
+        self._producer.close()
+
+
+class ReplayMachineProducer(mp.MachineProducer):
+    """Produces machines serving the outputs recorded in an archive.
+
+    :param path: the archive.
+    :param latency: whether calls take as long as they were recorded to, see
+        harness.replay.
+    """
+
+    def __init__(self, path: str, latency: bool = False):
+        self.archive = Archive(path)
+        self._latency = latency
+
+    def get_machines(self, num_machines) -> list:
+        """Returns the requested number of ReplayMachines."""
+        return [ReplayMachine(self.archive, slot, self._latency) for slot in range(num_machines)]
+
+    def release_machines(self, machine_list):
+        """No-op."""
+        return
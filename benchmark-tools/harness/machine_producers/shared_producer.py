@@ -0,0 +1,39 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Producer sharing machines between concurrent leases."""
+
+import harness.machine_producers.machine_producer as mp
+
+
+class SharedMachineProducer(mp.MachineProducer):
+    """Hands out the same machines to every lease.
+
+    Leases are not exclusive: runners using this producer must partition the
+    machines between concurrent benchmarks themselves (e.g. by CPU set).
+
+    :param machines: the machines to hand out, in order.
+    """
+
+    def __init__(self, machines: list):
+        self.machines = machines
+
+    def get_machines(self, num_machines) -> list:
+        if num_machines > len(self.machines):
+            raise ValueError(
+                "Insufficient Ammount of Machines. {ask} asked for and have {max_num} max.".format(
+                    ask=num_machines, max_num=len(self.machines)))
+        return self.machines[:num_machines]
+
+    def release_machines(self, machine_list):
+        """No-op: the machines stay shared."""
+        return
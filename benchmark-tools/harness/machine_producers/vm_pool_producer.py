@@ -0,0 +1,349 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Producer leasing pre-booted virtual machines from a pool.
+
+Each machine is a guest (a QEMU/KVM VM or a Firecracker microVM) running
+sshd and docker, reached as a RemoteMachine. Guests are booted in the
+background, ahead of the leases that need them, so that boots are off the
+benchmarks' critical path. After a lease a guest is reset and reused, or
+recycled: stopped and replaced by a fresh one.
+
+The pool grows with the number of machines waited for (the queue depth), up
+to max_size, and keeps min_idle guests booted ahead of demand. A pool is
+described in a yaml file by a single "pool" entry:
+
+pool:
+  type: qemu             # or firecracker
+  image: ~/guest.qcow2   # firecracker: rootfs and kernel
+  username: ubuntu
+  key_path: ~/.ssh/id_rsa
+  max_size: 4
+  min_idle: 1
+  max_uses: 1
+"""
+
+import concurrent.futures
+import itertools
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+import harness.machine_producers.machine_producer as mp
+from harness.machine import Machine, RemoteMachine
+from harness.machine_producers.yaml_producer import parse_yaml
+
+# RESET_SCRIPT removes the volumes a lease left behind, and checks the guest
+# is still usable.
+RESET_SCRIPT = "docker volume prune -f >/dev/null && sync && echo ok"
+
+
+class Guest:
+    """A booted virtual machine of a pool."""
+
+    machine = None
+
+    def reset(self) -> bool:
+        """Resets the guest for the next lease.
+
+        :return: whether the guest can be reused.
+        """
+        self.machine.reap()
+        stdout, _ = self.machine.run(RESET_SCRIPT)
+        return stdout.strip().endswith("ok")
+
+    def stop(self):
+        """Powers off the guest."""
+        raise NotImplementedError
+
+
+def _free_port() -> int:
+    """Returns a local TCP port that is free at the moment."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _connect(name: str, process: subprocess.Popen, timeout: float, **ssh) -> Machine:
+    """Returns the RemoteMachine of a booting guest, once sshd accepts connections."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return RemoteMachine(name, **ssh)
+        except Exception as error:  # pylint: disable-msg=broad-except
+            if process.poll() is not None:
+                raise RuntimeError("%s exited with %d" % (name, process.returncode))
+            if time.time() > deadline:
+                raise RuntimeError("%s did not accept SSH connections: %s" % (name, error))
+            time.sleep(1)
+
+
+class QemuGuest(Guest):
+    """A QEMU/KVM guest booted from a disk image, with SSH forwarded from a
+    local port. The image is opened with snapshot=on, so that guests share
+    it and never change it.
+
+    :param name: the machine name.
+    :param image: the disk image.
+    :param username: the SSH user.
+    :param key_path: the SSH key.
+    :param vcpus: the number of vCPUs.
+    :param memory: the guest memory, as QEMU's -m.
+    :param qemu: the QEMU binary.
+    :param timeout: the seconds to wait for the boot.
+    """
+
+    #pylint: disable-msg=too-many-arguments
+    def __init__(self, name: str, image: str, username: str, key_path: str, vcpus: int = 2,
+                 memory: str = "4G", qemu: str = "qemu-system-x86_64", timeout: float = 300,
+                 **kwargs):
+        port = _free_port()
+        self.process = subprocess.Popen(
+            [qemu, "-enable-kvm", "-cpu", "host", "-smp", str(vcpus), "-m", memory,
+             "-drive", "file=%s,if=virtio,snapshot=on" % os.path.expanduser(image),
+             "-netdev", "user,id=net0,hostfwd=tcp:127.0.0.1:%d-:22" % port,
+             "-device", "virtio-net-pci,netdev=net0", "-display", "none"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            self.machine = _connect(name, self.process, timeout, hostname="127.0.0.1", port=port,
+                                    username=username, key_path=os.path.expanduser(key_path),
+                                    **kwargs)
+        except Exception:
+            self.stop()
+            raise
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class FirecrackerGuest(Guest):
+    """A Firecracker microVM booted from a root filesystem with its own init,
+    reached on a tap device.
+
+    :param name: the machine name.
+    :param image: the root filesystem; each guest writes to its own copy.
+    :param kernel: the guest kernel.
+    :param tap: the host tap device of the guest.
+    :param guest_ip: the guest address on the tap network.
+    :param host_ip: the host address on the tap network.
+    :param username: the SSH user.
+    :param key_path: the SSH key.
+    :param vcpus: the number of vCPUs.
+    :param mem_mib: the guest memory.
+    :param timeout: the seconds to wait for the boot.
+    """
+
+    #pylint: disable-msg=too-many-arguments
+    def __init__(self, name: str, image: str, kernel: str, tap: str, guest_ip: str,
+                 host_ip: str, username: str, key_path: str, vcpus: int = 2,
+                 mem_mib: int = 1024, timeout: float = 300, **kwargs):
+        # Imported here, as only Firecracker pools need it.
+        from harness.firecracker import MicroVM
+        boot_args = "console=ttyS0 reboot=k panic=1 pci=off ip=%s::%s:255.255.255.0::eth0:off" % (
+            guest_ip, host_ip)
+        self.vm = MicroVM(kernel, "", vcpus=vcpus, mem_mib=mem_mib, boot_args=boot_args,
+                          tap=tap)
+        self.vm.rootfs = os.path.join(self.vm.workdir, "rootfs.ext4")
+        shutil.copyfile(os.path.expanduser(image), self.vm.rootfs)
+        self.vm.start()
+        # Drain the console, so that the guest never blocks on it.
+        threading.Thread(target=lambda: [None for _ in self.vm.console()], daemon=True).start()
+        try:
+            self.machine = _connect(name, self.vm.process, timeout, hostname=guest_ip,
+                                    username=username, key_path=os.path.expanduser(key_path),
+                                    **kwargs)
+        except Exception:
+            self.stop()
+            raise
+
+    def stop(self):
+        self.vm.process.terminate()
+        self.vm.stop()
+
+
+#pylint: disable-msg=too-many-instance-attributes
+class VMPoolMachineProducer(mp.MachineProducer):
+    """Leases machines from a pool of guests booted ahead of demand.
+
+    :param boot: returns a new booted Guest, given a unique name.
+    :param max_size: the most guests booted at once.
+    :param min_idle: the number of idle guests to keep booted ahead of demand.
+    :param max_uses: the number of leases a guest serves before it is
+        recycled; 1 gives every lease a fresh guest.
+    """
+
+    def __init__(self, boot, max_size: int = 1, min_idle: int = 0, max_uses: int = 1):
+        self._boot = boot
+        self.max_size = max(1, int(max_size))
+        self.min_idle = int(min_idle)
+        self.max_uses = max(1, int(max_uses))
+        self._names = itertools.count()
+        self._condition = threading.Condition()
+        self._idle = []
+        self._leased = {}
+        self._uses = {}
+        self._booting = 0
+        self._waiting = 0
+        self._errors = []
+        self._closed = False
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_size + 1)
+        with self._condition:
+            self._grow()
+
+    def size(self) -> int:
+        """Returns the number of guests booted or booting."""
+        with self._condition:
+            return len(self._idle) + len(self._leased) + self._booting
+
+    def get_machines(self, num_machines) -> list:
+        if num_machines > self.max_size:
+            raise ValueError(
+                "Insufficient Ammount of Machines. {ask} asked for and have {max_num} max.".format(
+                    ask=num_machines, max_num=self.max_size))
+        with self._condition:
+            self._waiting += num_machines
+            try:
+                self._grow()
+                while len(self._idle) < num_machines:
+                    if self._errors:
+                        raise RuntimeError("booting a guest failed: %s" % self._errors.pop(0))
+                    self._condition.wait(timeout=1)
+                guests = [self._idle.pop(0) for _ in range(num_machines)]
+            finally:
+                self._waiting -= num_machines
+            for guest in guests:
+                self._leased[guest.machine] = guest
+            # Boot the spares for the next leases.
+            self._grow()
+            return [guest.machine for guest in guests]
+
+    def release_machines(self, machine_list):
+        with self._condition:
+            guests = [self._leased.pop(machine) for machine in machine_list]
+            del machine_list[:]
+        for guest in guests:
+            self._uses[guest] = self._uses.get(guest, 0) + 1
+            if self._uses[guest] < self.max_uses and self._reset(guest):
+                with self._condition:
+                    self._idle.append(guest)
+                    self._condition.notify_all()
+            else:
+                self._uses.pop(guest)
+                guest.machine.close()
+                self._executor.submit(guest.stop)
+        with self._condition:
+            self._grow()
+
+    def close(self):
+        """Stops every guest, waiting for those still booting."""
+        with self._condition:
+            self._closed = True
+        self._executor.shutdown(wait=True)
+        with self._condition:
+            guests = self._idle + list(self._leased.values())
+            self._idle = []
+            self._leased = {}
+        for guest in guests:
+            guest.machine.close()
+            guest.stop()
+
+    def _reset(self, guest: Guest) -> bool:
+        try:
+            return guest.reset()
+        except Exception as error:  # pylint: disable-msg=broad-except
+            logging.warning("Recycling %s, which failed to reset: %s", guest.machine, error)
+            return False
+
+    def _grow(self):
+        """Boots guests for the machines waited for and the idle spares.
+
+        Called with the condition held.
+        """
+        if self._closed:
+            return
+        total = len(self._idle) + len(self._leased) + self._booting
+        wanted = min(self.max_size, len(self._leased) + self._waiting + self.min_idle)
+        for _ in range(wanted - total):
+            self._booting += 1
+            self._executor.submit(self._boot_one, "guest-%d" % next(self._names))
+
+    def _boot_one(self, name: str):
+        try:
+            guest = self._boot(name)
+        except Exception as error:  # pylint: disable-msg=broad-except
+            logging.error("Failed to boot %s: %s", name, error)
+            with self._condition:
+                self._booting -= 1
+                self._errors.append(error)
+                self._condition.notify_all()
+            return
+        with self._condition:
+            self._booting -= 1
+            closed = self._closed
+            if not closed:
+                self._idle.append(guest)
+                self._condition.notify_all()
+        if closed:
+            guest.stop()
+
+
+def pool_producer(path: str) -> VMPoolMachineProducer:
+    """Returns the pool described by a yaml file, or None if it describes machines.
+
+    :param path: path to a yaml file.
+    :raises ValueError: if the pool's type is unknown.
+    """
+    data = parse_yaml(path)
+    if not isinstance(data, dict) or not isinstance(data.get("pool"), dict) or len(data) != 1:
+        return None
+    config = dict(data["pool"])
+    kind = config.pop("type", "qemu")
+    sizes = {key: config.pop(key) for key in ("max_size", "min_idle", "max_uses") if key in config}
+    if kind == "qemu":
+        boot = lambda name: QemuGuest(name, **config)
+    elif kind == "firecracker":
+        # Each guest of the pool has its own tap device and address.
+        taps = list(config.pop("taps"))
+        sizes["max_size"] = min(int(sizes.get("max_size", len(taps))), len(taps))
+        free = list(taps)
+        lock = threading.Lock()
+
+        def boot(name):
+            with lock:
+                tap = free.pop(0)
+            try:
+                guest = FirecrackerGuest(name, tap=tap["tap"], guest_ip=tap["guest_ip"],
+                                         host_ip=tap["host_ip"], **config)
+            except Exception:
+                with lock:
+                    free.append(tap)
+                raise
+            stop = guest.stop
+
+            def stop_and_free():
+                stop()
+                with lock:
+                    free.append(tap)
+            guest.stop = stop_and_free
+            return guest
+    else:
+        raise ValueError("unknown pool type %s: use qemu or firecracker" % kind)
+    return VMPoolMachineProducer(boot, **sizes)
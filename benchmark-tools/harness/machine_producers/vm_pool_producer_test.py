@@ -0,0 +1,152 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the VM pool producer."""
+
+import threading
+import time
+
+import pytest
+
+from harness.machine import MockMachine
+from harness.machine_producers import vm_pool_producer as vp
+
+
+class FakeMachine(MockMachine):
+    """Mock machine of a fake guest, which resets fine unless broken."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.broken = False
+
+    def run(self, cmd: str) -> (str, str):
+        return ("" if self.broken else "ok\n"), ""
+
+
+class FakeGuest(vp.Guest):
+    """Guest booting instantly, recording the guests booted and stopped."""
+
+    booted = []
+    stopped = []
+
+    def __init__(self, name: str):
+        self.machine = FakeMachine(name)
+        FakeGuest.booted.append(name)
+
+    def stop(self):
+        FakeGuest.stopped.append(self.machine.name)
+
+
+@pytest.fixture(autouse=True)
+def fake_guests():
+    FakeGuest.booted = []
+    FakeGuest.stopped = []
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_fresh_guests():
+    """Test each lease gets a fresh guest by default."""
+    producer = vp.VMPoolMachineProducer(FakeGuest, max_size=2)
+    first = producer.get_machines(1)
+    names = [machine.name for machine in first]
+    producer.release_machines(first)
+    assert not first
+    second = producer.get_machines(1)
+    assert second[0].name not in names
+    wait_for(lambda: FakeGuest.stopped == names)
+    producer.close()
+    assert FakeGuest.stopped == names + [second[0].name]
+
+
+def test_reuse():
+    """Test guests serve max_uses leases, unless they fail to reset."""
+    producer = vp.VMPoolMachineProducer(FakeGuest, max_size=1, max_uses=3)
+    machines = [producer.get_machines(1)[0]]
+    for _ in range(3):
+        producer.release_machines(list(machines[-1:]))
+        machines.append(producer.get_machines(1)[0])
+    # Three leases of the first guest, then a new one.
+    assert [machine.name for machine in machines] == ["guest-0"] * 3 + ["guest-1"]
+    machines[-1].broken = True
+    producer.release_machines(machines[-1:])
+    assert producer.get_machines(1)[0].name == "guest-2"
+    producer.close()
+
+
+def test_min_idle():
+    """Test spare guests are booted ahead of leases."""
+    producer = vp.VMPoolMachineProducer(FakeGuest, max_size=3, min_idle=1)
+    wait_for(lambda: len(FakeGuest.booted) == 1)
+    producer.get_machines(1)
+    wait_for(lambda: len(FakeGuest.booted) == 2)
+    assert producer.size() == 2
+    producer.close()
+    assert sorted(FakeGuest.stopped) == ["guest-0", "guest-1"]
+
+
+def test_max_size():
+    """Test concurrent leases wait for guests, never exceeding max_size."""
+    producer = vp.VMPoolMachineProducer(FakeGuest, max_size=2)
+    sizes = []
+    leases = []
+
+    def lease():
+        machines = producer.get_machines(1)
+        sizes.append(producer.size())
+        leases.append(machines[0].name)
+        time.sleep(0.05)
+        producer.release_machines(machines)
+
+    threads = [threading.Thread(target=lease) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    producer.close()
+    assert len(leases) == 6 and max(sizes) <= 2
+    assert sorted(FakeGuest.stopped) == sorted(FakeGuest.booted)
+    with pytest.raises(ValueError):
+        producer.get_machines(3)
+
+
+def test_boot_error():
+    """Test boot failures are raised to the lease waiting for them."""
+    def boot(name):
+        raise RuntimeError("no kvm")
+
+    producer = vp.VMPoolMachineProducer(boot)
+    with pytest.raises(RuntimeError, match="no kvm"):
+        producer.get_machines(1)
+    producer.close()
+
+
+def test_pool_yaml(tmpdir, monkeypatch):
+    """Test pools are read from yaml files with a pool entry only."""
+    monkeypatch.setattr(vp, "QemuGuest", lambda name, **kwargs: FakeGuest(name))
+    pool = tmpdir.join("pool.yaml")
+    pool.write("pool:\n  image: guest.qcow2\n  username: ubuntu\n  key_path: key\n"
+               "  max_size: 3\n  max_uses: 2\n")
+    producer = vp.pool_producer(str(pool))
+    assert (producer.max_size, producer.max_uses) == (3, 2)
+    producer.close()
+    machines = tmpdir.join("machines.yaml")
+    machines.write("client: localhost\n")
+    assert vp.pool_producer(str(machines)) is None
+    pool.write("pool:\n  type: gvisor\n")
+    with pytest.raises(ValueError, match="unknown pool type"):
+        vp.pool_producer(str(pool))
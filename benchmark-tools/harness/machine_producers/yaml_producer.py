@@ -43,6 +43,8 @@ class YamlMachineProducer(mp.MachineProducer):
         with self.machine_condition:
             while machine_list:
                 machine = machine_list.pop()
+                # Drop connections while idle; machines reconnect on use.
+                machine.close()
                 self.machines.append(machine)
             self.machine_condition.notify()
 
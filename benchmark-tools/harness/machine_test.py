@@ -0,0 +1,128 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for Machine command execution."""
+
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from harness.machine import LocalMachine, MockMachine, RemoteMachine
+
+
+async def collect(stream) -> list:
+    """Returns all lines of an async iterator."""
+    return [line async for line in stream]
+
+
+def test_mock_run_stream():
+    """Test the mock stream is empty, like the mock run output."""
+    assert asyncio.run(collect(MockMachine().run_stream("vmstat 1"))) == []
+
+
+def test_mock_run_many():
+    """Test mock commands return one result per command."""
+    assert asyncio.run(MockMachine().run_many(["a", "b"])) == [("", ""), ("", "")]
+
+
+def test_local_run_quoted_arguments():
+    """Test commands are run by the shell, not split on spaces."""
+    stdout, stderr = LocalMachine("local").run("printf '%s|' 'a b' \"c  d\"")
+    assert stdout == "a b|c  d|"
+    assert stderr == ""
+
+
+def test_local_run_stream():
+    """Test lines arrive in order, with stderr merged into stdout."""
+    lines = asyncio.run(collect(LocalMachine("local").run_stream(
+        "echo one; echo two >&2; echo three")))
+    assert lines == ["one\n", "two\n", "three\n"]
+
+
+def test_local_run_stream_aclose():
+    """Test closing the stream early kills the command."""
+    async def first_line():
+        stream = LocalMachine("local").run_stream("echo $$; exec sleep 30")
+        pid = int(await stream.__anext__())
+        await stream.aclose()
+        return pid
+
+    pid = asyncio.run(first_line())
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+def test_local_run_many():
+    """Test commands run concurrently and results keep their order."""
+    start = time.time()
+    results = asyncio.run(LocalMachine("local").run_many(
+        ["sleep 0.5; echo a", "sleep 0.5; echo b >&2"]))
+    assert results == [("a\n", ""), ("", "b\n")]
+    assert time.time() - start < 1.0
+
+
+class BlockingChannel:
+    """Channel whose output never ends until it is closed."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def makefile(self, mode):
+        """Returns the channel output."""
+        assert mode == "rb"
+        return self
+
+    def readline(self):
+        """Returns one line, then blocks until closed."""
+        if not hasattr(self, "sent"):
+            self.sent = True
+            return b"first\r\n"
+        self.closed.wait(5)
+        return b""
+
+    def close(self):
+        """Closes the channel."""
+        self.closed.set()
+
+
+class StubConnection:
+    """Stands in for SSHConnection."""
+
+    def __init__(self):
+        self.channel = BlockingChannel()
+
+    def exec_stream(self, cmd):
+        """Returns the blocking channel."""
+        return self.channel
+
+
+def test_remote_run_stream_cancel():
+    """Test cancelling a consumer closes the channel and raises timeout."""
+    machine = RemoteMachine.__new__(RemoteMachine)
+    #pylint: disable-msg=protected-access
+    machine._ssh_connection = StubConnection()
+    lines = []
+
+    async def consume():
+        async for line in machine.run_stream("vmstat 1"):
+            lines.append(line)
+
+    async def main():
+        await asyncio.wait_for(consume(), 0.2)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(main())
+    assert lines == ["first\n"]
+    assert machine._ssh_connection.channel.closed.is_set()
@@ -0,0 +1,137 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Hardware performance counters of benchmark containers.
+
+perf stat counts events for the parent cgroup of a CgroupScope only, so the
+counts cover the workload and its runtime (e.g. the runsc sentry and gofer)
+but not the harness or other host activity. The workload images are not
+changed.
+"""
+
+import logging
+import re
+import uuid
+
+from harness.machine import Machine
+
+# DEFAULT_EVENTS are counted when counters are enabled with "default".
+DEFAULT_EVENTS = [
+    "cycles",
+    "instructions",
+    "cache-misses",
+    "dTLB-load-misses",
+    "iTLB-load-misses",
+    "context-switches",
+]
+
+# VM_EXIT_EVENT counts VM exits. It is added when the machine exposes it.
+VM_EXIT_EVENT = "kvm:kvm_exit"
+
+# START_SCRIPT creates the parent cgroup, so that perf can attach to it before
+# any container starts, and starts perf stat in the background, printing its
+# pid.
+START_SCRIPT = """sudo sh -s <<'EOF'
+cgroup={cgroup}
+events={events}
+if [ -d /sys/fs/cgroup/perf_event ]; then
+  mkdir -p /sys/fs/cgroup/perf_event/$cgroup
+else
+  mkdir -p /sys/fs/cgroup/$cgroup
+fi
+if perf list 2>/dev/null | grep -q '{vm_exit}'; then
+  events=$events,{vm_exit}
+fi
+cgroups=$(echo $events | sed "s/[^,]*/$cgroup/g")
+nohup perf stat -a -x, -o {output} -e $events -G $cgroups -- sleep 86400 >/dev/null 2>&1 &
+echo $!
+EOF"""
+
+# STOP_SCRIPT interrupts perf stat, which then writes its counts, and prints
+# them.
+STOP_SCRIPT = """sudo sh -s <<'EOF'
+kill -INT {pid}
+while kill -0 {pid} 2>/dev/null; do sleep 0.1; done
+cat {output}
+rm -f {output}
+EOF"""
+
+
+def metric_name(event: str) -> str:
+    """Returns the metric name for an event."""
+    return re.sub(r"\W", "_", event.split(":")[-1]).lower()
+
+
+def parse_perf_stat(data: str) -> dict:
+    """Parses perf stat -x, output.
+
+    :param data: the output.
+    :return: a dict of metric names to counts. Events that could not be
+        counted are left out.
+    """
+    counts = {}
+    for line in data.splitlines():
+        fields = line.split(",")
+        if len(fields) < 3 or line.startswith("#"):
+            continue
+        try:
+            value = float(fields[0])
+        except ValueError:
+            continue  # <not supported> or <not counted>.
+        name = metric_name(fields[2])
+        counts[name] = counts.get(name, 0) + value
+    return counts
+
+
+class PerfCounters:
+    """Counts performance events of the containers in a cgroup. Usage:
+
+    scope = CgroupScope(machine)
+    counters = PerfCounters(machine, scope.name, "default")
+    counters.start()
+    # start containers with scope.machine.
+    counts = counters.stop()
+    """
+
+    def __init__(self, machine: Machine, cgroup: str, events: str = "default"):
+        """Sets up counting.
+
+        :param machine: the machine to count on.
+        :param cgroup: the name of the parent cgroup of the containers.
+        :param events: comma separated perf events, or "default".
+        """
+        self._events = DEFAULT_EVENTS if events == "default" else events.split(",")
+        self._cgroup = cgroup
+        self._output = "/tmp/perf-counters-%s.csv" % uuid.uuid4().hex[:12]
+        self._pid = None
+        self._machine = machine
+
+    def start(self):
+        """Starts counting."""
+        stdout, _ = self._machine.run(START_SCRIPT.format(
+            cgroup=self._cgroup, events=",".join(self._events),
+            vm_exit=VM_EXIT_EVENT, output=self._output))
+        if not stdout.strip().isdigit():
+            logging.warning("perf stat could not be started on %s", self._machine)
+            return
+        self._pid = int(stdout)
+
+    def stop(self) -> dict:
+        """Stops counting.
+
+        :return: a dict of metric names to counts.
+        """
+        if self._pid is None:
+            return {}
+        stdout, _ = self._machine.run(STOP_SCRIPT.format(pid=self._pid, output=self._output))
+        self._pid = None
+        return parse_perf_stat(stdout)
@@ -0,0 +1,67 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for performance counters."""
+
+from benchmarks import benchmark
+from harness.machine import MockMachine
+from harness.perf_counters import parse_perf_stat
+
+SAMPLE_PERF_STAT = """# started on Mon Jan  6 10:00:00 2020
+
+2000000,,cycles,benchmarks_0.slice,1000,100.00,,
+3000000,,instructions,benchmarks_0.slice,1000,100.00,1.50,insn per cycle
+<not supported>,,dTLB-load-misses,benchmarks_0.slice,0,100.00,,
+12,,kvm:kvm_exit,benchmarks_0.slice,1000,100.00,,
+"""
+
+
+class CountingMockMachine(MockMachine):
+    """Mock machine answering the perf stat scripts."""
+
+    def __init__(self):
+        self.containers = []
+
+    def run(self, cmd: str) -> (str, str):
+        if "nohup perf stat" in cmd:
+            return "1234\n", ""
+        if "kill -INT 1234" in cmd:
+            return SAMPLE_PERF_STAT, ""
+        return "", ""
+
+    def container(self, image: str, **kwargs):
+        self.containers.append(kwargs)
+        return super().container(image, **kwargs)
+
+
+def test_parse_perf_stat():
+    """Test counts are named after their events and unsupported ones dropped."""
+    assert parse_perf_stat(SAMPLE_PERF_STAT) == {
+        "cycles": 2000000.0,
+        "instructions": 3000000.0,
+        "kvm_exit": 12.0,
+    }
+
+
+def test_benchmark_counters():
+    """Test counters are reported as extra metrics for cgroup-scoped containers."""
+    @benchmark(machines=1)
+    def run(machine, **kwargs):
+        return machine.container("true").run()
+
+    machine = CountingMockMachine()
+    results = dict(run(machine, runtime="runc", counters="default"))
+    assert results["cycles"] == 2000000.0
+    assert results["ipc"] == 1.5
+    assert machine.containers[0]["cgroup_parent"].startswith("benchmarks_")
+    # Without counters, nothing changes.
+    assert list(run(CountingMockMachine(), runtime="runc")) == [("default", "")]
@@ -0,0 +1,216 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""CPU and NUMA pinning of benchmark containers and runtime helpers.
+
+Containers are pinned with their cpuset cgroup. The workload images bind to
+NUMA node 0 with numactl unless their numa variable says otherwise, which
+pinned containers set so that the cpuset alone decides.
+
+Runtime helpers (dockerd, containerd and the shims, which start e.g. the
+runsc gofer) are pinned separately with taskset, for the duration of the
+run. The processes they start inherit the affinity. The helpers are shared
+by the concurrent runs on a machine, so they are pinned by the first run and
+restored by the last.
+"""
+
+import contextlib
+import logging
+import threading
+import types
+
+from harness.container import Container
+from harness.cpus import busy_cpus, format_cpus, parse_cpus
+
+# NUMA_ENV is the image variable holding numactl's options, and NUMA_ANY its
+# value for containers pinned by their cpuset.
+NUMA_ENV = "numa"
+NUMA_ANY = "--localalloc"
+
+# PIN_HELPERS_SCRIPT pins the runtime helpers, printing each pid and its
+# previous affinity.
+PIN_HELPERS_SCRIPT = """sudo sh -s <<'EOF'
+for pid in $(pgrep -x 'dockerd|containerd|containerd-shim'); do
+  echo "$pid $(taskset -pc $pid | sed 's/.*: //')"
+  taskset -a -pc {cpus} $pid > /dev/null
+done
+EOF"""
+
+# RESTORE_SCRIPT restores the affinity of a helper.
+RESTORE_SCRIPT = "sudo taskset -a -pc {cpus} {pid} > /dev/null 2>&1; true"
+
+
+# _HELPERS holds, by machine name, the helper cpuset of the runs pinning the
+# helpers, their number and the affinities to restore after the last.
+_HELPERS = {}
+_HELPERS_LOCK = threading.Lock()
+
+
+def pin_helpers(machine, cpus: str):
+    """Pins the runtime helpers of a machine, unless a concurrent run did.
+
+    :param machine: the machine.
+    :param cpus: the CPUs of the helpers.
+    :raises RuntimeError: if a concurrent run pinned them to other CPUs.
+    """
+    with _HELPERS_LOCK:
+        pinned = _HELPERS.get(str(machine))
+        if pinned is not None:
+            if pinned["cpus"] != cpus:
+                raise RuntimeError("The helpers of %s are pinned to CPUs %s by a concurrent run" % (
+                    machine, pinned["cpus"]))
+            pinned["runs"] += 1
+            return
+        stdout, _ = machine.run(PIN_HELPERS_SCRIPT.format(cpus=cpus))
+        restore = [line.split() for line in stdout.splitlines() if len(line.split()) == 2]
+        _HELPERS[str(machine)] = {"cpus": cpus, "runs": 1, "restore": restore}
+
+
+def restore_helpers(machine):
+    """Restores the affinity of the runtime helpers of a machine, after the
+    last of the runs that pinned them."""
+    with _HELPERS_LOCK:
+        pinned = _HELPERS[str(machine)]
+        pinned["runs"] -= 1
+        if pinned["runs"]:
+            return
+        del _HELPERS[str(machine)]
+        for pid, cpus in pinned["restore"]:
+            machine.run(RESTORE_SCRIPT.format(cpus=cpus, pid=pid))
+
+
+class PinnedContainer(Container):
+    """Container letting its cpuset decide the NUMA binding."""
+
+    def __init__(self, container: Container):
+        self._container = container
+
+    def run(self, **env):
+        env.setdefault(NUMA_ENV, NUMA_ANY)
+        return self._container.run(**env)
+
+    def stream(self, **env) -> types.GeneratorType:
+        env.setdefault(NUMA_ENV, NUMA_ANY)
+        return self._container.stream(**env)
+
+    @contextlib.contextmanager
+    def detach(self, **env):
+        env.setdefault(NUMA_ENV, NUMA_ANY)
+        with self._container.detach(**env):
+            yield self
+
+    def address(self) -> (str, int):
+        return self._container.address()
+
+    def get_names(self) -> types.GeneratorType:
+        return self._container.get_names()
+
+    def get_pids(self) -> types.GeneratorType:
+        return self._container.get_pids()
+
+    def network(self) -> dict:
+        return self._container.network()
+
+    def startup(self) -> float:
+        return self._container.startup()
+
+    def boot_phases(self) -> dict:
+        return self._container.boot_phases()
+
+
+class PinnedMachine:
+    """Machine proxy starting all containers on the pinning's CPUs and nodes."""
+
+    def __init__(self, machine, pinning):
+        self._machine = machine
+        self._pinning = pinning
+
+    def container(self, image: str, **kwargs) -> Container:
+        """Returns a pinned container."""
+        if self._pinning.cpuset:
+            kwargs.setdefault("cpuset_cpus", self._pinning.cpuset)
+        if self._pinning.mems:
+            kwargs.setdefault("cpuset_mems", self._pinning.mems)
+        return PinnedContainer(self._machine.container(image, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._machine, name)
+
+    def __str__(self):
+        return str(self._machine)
+
+
+class Pinning:
+    """The CPUs and NUMA nodes of a benchmark run. Usage:
+
+    pinning = Pinning(cpuset="2-3", mems="0", helper_cpuset="0", check_idle=True)
+    with pinning.applied(machines) as pinned:
+        # start containers with the pinned machines.
+
+    :param cpuset: the CPUs to run containers on, e.g. "2-3".
+    :param mems: the NUMA nodes to allocate container memory from.
+    :param helper_cpuset: the CPUs to run the runtime helpers on.
+    :param check_idle: whether to check, before the run, that the CPUs of
+        the cpuset and helper cpuset are idle.
+    :raises ValueError: if a CPU list is malformed.
+    """
+
+    def __init__(self, cpuset: str = "", mems: str = "", helper_cpuset: str = "",
+                 check_idle: bool = False):
+        if isinstance(check_idle, str):
+            check_idle = check_idle.lower() not in ("false", "0", "no", "")
+        # Normalize the lists, which also checks them.
+        self.cpuset = format_cpus(parse_cpus(str(cpuset)))
+        self.mems = format_cpus(parse_cpus(str(mems)))
+        self.helper_cpuset = format_cpus(parse_cpus(str(helper_cpuset)))
+        self.check_idle = check_idle
+
+    def __bool__(self):
+        return bool(self.cpuset or self.mems or self.helper_cpuset or self.check_idle)
+
+    def check(self, machine):
+        """Checks that the pinned CPUs are idle.
+
+        :raises RuntimeError: if any is busy.
+        """
+        cpus = parse_cpus(self.cpuset) + parse_cpus(self.helper_cpuset)
+        busy = busy_cpus(machine, cpus)
+        if busy:
+            raise RuntimeError("CPUs are not idle on %s: %s" % (machine, ", ".join(
+                "%d (%d%% busy)" % (cpu, fraction * 100) for cpu, fraction in sorted(busy.items()))))
+
+    @contextlib.contextmanager
+    def applied(self, machines: list):
+        """Checks the CPUs and pins the helpers of the given machines.
+
+        :return: a context yielding the machines that start pinned
+            containers, and restoring the helpers on exit unless concurrent
+            runs still use them.
+        """
+        pinned = []
+        try:
+            for machine in machines:
+                if self.check_idle:
+                    self.check(machine)
+                if self.helper_cpuset:
+                    pin_helpers(machine, self.helper_cpuset)
+                    pinned.append(machine)
+            if self.cpuset or self.mems:
+                logging.info("Pinned containers to CPUs %s, nodes %s and helpers to CPUs %s",
+                             self.cpuset or "any", self.mems or "any",
+                             self.helper_cpuset or "any")
+                yield [PinnedMachine(machine, self) for machine in machines]
+            else:
+                yield machines
+        finally:
+            for machine in pinned:
+                restore_helpers(machine)
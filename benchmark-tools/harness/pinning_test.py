@@ -0,0 +1,122 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for CPU and NUMA pinning."""
+
+import pytest
+
+from benchmarks import benchmark
+from harness.cpus import busy_cpus, format_cpus, parse_cpus
+from harness.machine import MockMachine
+from harness.pinning import Pinning
+
+STAT_BEFORE = """cpu  300 0 300 1400 0 0 0 0 0 0
+cpu0 100 0 100 800 0 0 0 0 0 0
+cpu1 200 0 200 600 0 0 0 0 0 0
+intr 1234
+"""
+
+STAT_AFTER = """cpu  400 0 400 1600 0 0 0 0 0 0
+cpu0 100 0 100 900 0 0 0 0 0 0
+cpu1 300 0 300 700 0 0 0 0 0 0
+intr 1240
+"""
+
+
+class PinningMachine(MockMachine):
+    """Mock machine recording commands and container arguments."""
+
+    def __init__(self):
+        self.commands = []
+        self.containers = []
+        self._stats = [STAT_BEFORE, STAT_AFTER]
+
+    def run(self, cmd: str) -> (str, str):
+        self.commands.append(cmd)
+        if cmd == "cat /proc/stat":
+            return self._stats.pop(0), ""
+        if "pgrep" in cmd:
+            return "42 0-7\n", ""
+        return "", ""
+
+    def container(self, image: str, **kwargs):
+        self.containers.append(kwargs)
+        return super().container(image, **kwargs)
+
+
+def test_cpu_lists():
+    """Test CPU lists are parsed and formatted as ranges."""
+    assert parse_cpus("0-3,8, 10-11") == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_cpus("") == []
+    assert format_cpus([8, 0, 1, 2, 3, 10, 11]) == "0-3,8,10-11"
+    with pytest.raises(ValueError):
+        parse_cpus("a-b")
+
+
+def test_busy_cpus():
+    """Test CPU utilization from two /proc/stat samples."""
+    # cpu0 was busy 0 of 100 jiffies, cpu1 200 of 300.
+    busy = busy_cpus(PinningMachine(), [0, 1, 2])
+    assert list(busy) == [1]
+    assert busy[1] == pytest.approx(2 / 3.0)
+
+
+def test_check_idle():
+    """Test a run on busy CPUs fails before starting any container."""
+    machine = PinningMachine()
+    pinning = Pinning(cpuset="1", check_idle="true")
+    with pytest.raises(RuntimeError, match="1 \\(66% busy\\)"):
+        with pinning.applied([machine]):
+            pass
+    assert not machine.containers
+
+
+def test_benchmark_pinning():
+    """Test containers and helpers are pinned for the run only."""
+    @benchmark(machines=1)
+    def run(machine, **kwargs):
+        return machine.container("true").run()
+
+    machine = PinningMachine()
+    list(run(machine, runtime="runc", accounting="false", cpuset="2,3",
+             mems="0", helper_cpuset="0-1"))
+    assert machine.containers == [{"cpuset_cpus": "2-3", "cpuset_mems": "0"}]
+    pins = [cmd for cmd in machine.commands if "pgrep" in cmd]
+    assert len(pins) == 1 and "taskset -a -pc 0-1" in pins[0]
+    # The helper's affinity is restored after the run.
+    assert "taskset -a -pc 0-7 42" in machine.commands[-1]
+
+
+def test_benchmark_unpinned():
+    """Test nothing is pinned by default."""
+    @benchmark(machines=1)
+    def run(machine, **kwargs):
+        return machine.container("true").run()
+
+    machine = PinningMachine()
+    list(run(machine, runtime="runc", accounting="false"))
+    assert machine.containers == [{}]
+    assert not machine.commands
+
+
+def test_concurrent_helper_pinning():
+    """Test overlapping runs pin the helpers once, and restore them once."""
+    machine = PinningMachine()
+    first, second = Pinning(helper_cpuset="0-1"), Pinning(helper_cpuset="0,1")
+    with first.applied([machine]):
+        with second.applied([machine]):
+            with pytest.raises(RuntimeError, match="pinned to CPUs 0-1 by a concurrent run"):
+                with Pinning(helper_cpuset="2").applied([machine]):
+                    pass
+        assert not [cmd for cmd in machine.commands if "taskset -a -pc 0-7" in cmd]
+    assert len([cmd for cmd in machine.commands if "pgrep" in cmd]) == 1
+    assert machine.commands[-1].startswith("sudo taskset -a -pc 0-7 42")
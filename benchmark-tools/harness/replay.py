@@ -0,0 +1,365 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Record and replay of machine and container outputs.
+
+A RecordingMachine wraps a real machine and stores every result it returns
+in an Archive. A ReplayMachine serves those results back from the archive,
+without any latency, so that parsers and metrics can be re-evaluated over
+recorded runs.
+
+Metrics timed on the benchmark host rather than reported by the machines
+(the startup_time_ms of startup.startup, the run_time of media.ffmpeg and the
+probe_latency of density.curve) then replay as about 0. With latency, a
+ReplayMachine also takes as long as each recorded call took (and container
+streams deliver their lines at their recorded offsets), so that those
+metrics replay too, as slowly as they were recorded. Metrics reported by the
+machines or containers (e.g. startup_seconds and boot phases) replay either
+way.
+
+The archive is a zip file. Each distinct result is stored once, compressed
+and named by its digest; index.json maps every call to the digests of the
+results it returned, in order, and timing.json to the seconds each took.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import types
+import typing
+import zipfile
+
+from harness.container import Container
+from harness.machine import Machine
+
+# INDEX is the name of the archive member mapping calls to results.
+INDEX = "index.json"
+
+# TIMING is the name of the archive member mapping calls to the seconds each
+# result took, in the order of INDEX.
+TIMING = "timing.json"
+
+# VOLATILE matches the names the harness generates afresh for every run (the
+# cgroups of harness.cgroup_scope and the files of harness.perf_counters),
+# which are masked in keys so that replayed calls match recorded ones.
+VOLATILE = re.compile(r"(benchmarks_|perf-counters-)[0-9a-f]{12}")
+
+
+def _key(*args) -> str:
+    """Returns the index key for a call."""
+    return VOLATILE.sub(r"\1*", json.dumps(args, sort_keys=True, default=str))
+
+
+class Archive:
+    """An indexed store of call results.
+
+    Each call key holds the list of results it returned, and the seconds
+    each took. Replay walks through the list, wrapping around, so repeated
+    calls are served in the recorded order.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._index = {}
+        self._seconds = {}
+        self._blobs = {}
+        self._cursors = {}
+        if os.path.exists(path):
+            with zipfile.ZipFile(path) as archive:
+                self._index = json.loads(archive.read(INDEX))
+                # Archives recorded before timings were take no time.
+                timing = (json.loads(archive.read(TIMING))
+                          if TIMING in archive.namelist() else {})
+                for digest in set(d for digests in self._index.values() for d in digests):
+                    self._blobs[digest] = archive.read(digest)
+            for key, digests in self._index.items():
+                seconds = timing.get(key, [])
+                self._seconds[key] = seconds + [0.0] * (len(digests) - len(seconds))
+
+    def __len__(self):
+        return sum(len(digests) for digests in self._index.values())
+
+    def record(self, key: str, value, seconds: float = 0.0):
+        """Appends a result for the given key, and the seconds it took."""
+        blob = json.dumps(value).encode("utf-8")
+        digest = hashlib.sha256(blob).hexdigest()
+        with self._lock:
+            self._blobs[digest] = blob
+            self._index.setdefault(key, []).append(digest)
+            self._seconds.setdefault(key, []).append(seconds)
+
+    def replay(self, key: str):
+        """Returns the next recorded result for the given key.
+
+        :raises KeyError: if the call was never recorded.
+        """
+        return self.replay_timed(key)[0]
+
+    def replay_timed(self, key: str) -> tuple:
+        """Returns the next recorded result for the given key, and the
+        seconds it took.
+
+        :raises KeyError: if the call was never recorded.
+        """
+        with self._lock:
+            digests = self._index[key]
+            cursor = self._cursors.get(key, 0) % len(digests)
+            self._cursors[key] = cursor + 1
+            seconds = self._seconds[key][cursor]
+        return json.loads(self._blobs[digests[cursor]]), seconds
+
+    def save(self):
+        """Writes the archive, replacing any previous file atomically."""
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self._path))
+            handle, tmp = tempfile.mkstemp(dir=directory, suffix=".zip")
+            with os.fdopen(handle, "wb") as tmp_file:
+                with zipfile.ZipFile(tmp_file, "w", zipfile.ZIP_DEFLATED) as archive:
+                    archive.writestr(INDEX, json.dumps(self._index, sort_keys=True))
+                    archive.writestr(TIMING, json.dumps(self._seconds, sort_keys=True))
+                    for digest, blob in self._blobs.items():
+                        archive.writestr(digest, blob)
+            os.replace(tmp, self._path)
+        logging.info("Saved %d results to %s", len(self), self._path)
+
+
+class RecordingContainer(Container):
+    """Container recording the outputs of a real container."""
+
+    def __init__(self, archive: Archive, key: list, container: Container):
+        self._archive = archive
+        self._key = key
+        self._container = container
+
+    def _record(self, value, *args, start: float = None):
+        seconds = time.time() - start if start is not None else 0.0
+        self._archive.record(_key(*self._key, *args), value, seconds)
+        return value
+
+    def run(self, **env):
+        start = time.time()
+        return self._record(self._container.run(**env), "run", env, start=start)
+
+    def stream(self, **env) -> types.GeneratorType:
+        lines = []
+        start = time.time()
+        try:
+            for timestamp, line in self._container.stream(**env):
+                lines.append((timestamp - start, line))
+                yield timestamp, line
+        finally:
+            self._record(lines, "stream", env, start=start)
+
+    @contextlib.contextmanager
+    def detach(self, **env):
+        start = time.time()
+        with self._container.detach(**env):
+            self._record(None, "detach", env, start=start)
+            try:
+                yield self
+            finally:
+                start = time.time()
+        self._record(None, "remove", env, start=start)
+
+    def address(self) -> (str, int):
+        return tuple(self._record(list(self._container.address()), "address"))
+
+    def get_names(self) -> types.GeneratorType:
+        yield from self._record(list(self._container.get_names()), "get_names")
+
+    def get_pids(self) -> types.GeneratorType:
+        yield from (tuple(pid) for pid in
+                    self._record([list(pid) for pid in self._container.get_pids()], "get_pids"))
+
+    def network(self) -> dict:
+        return self._record(self._container.network(), "network")
+
+    def startup(self) -> float:
+        return self._record(self._container.startup(), "startup")
+
+    def boot_phases(self) -> dict:
+        return self._record(self._container.boot_phases(), "boot_phases")
+
+
+class RecordingMachine(Machine):
+    """Machine recording the outputs of a real machine.
+
+    :param archive: the archive to record to.
+    :param slot: the position of the machine in its lease, which is what
+        distinguishes machines on replay.
+    :param machine: the machine to record.
+    """
+
+    def __init__(self, archive: Archive, slot: int, machine: Machine):
+        self._archive = archive
+        self._slot = slot
+        self.machine = machine
+
+    def _record(self, value, *args, start: float = None):
+        seconds = time.time() - start if start is not None else 0.0
+        self._archive.record(_key(self._slot, *args), value, seconds)
+        return value
+
+    def run(self, cmd: str) -> (str, str):
+        start = time.time()
+        return tuple(self._record(list(self.machine.run(cmd)), "run", cmd, start=start))
+
+    async def run_stream(self, cmd: str) -> typing.AsyncIterator[str]:
+        lines = []
+        start = time.time()
+        try:
+            async for line in self.machine.run_stream(cmd):
+                lines.append(line)
+                yield line
+        finally:
+            self._record(lines, "run_stream", cmd, start=start)
+
+    def read(self, path: str) -> str:
+        start = time.time()
+        return self._record(self.machine.read(path), "read", path, start=start)
+
+    def pull(self, workload: str) -> str:
+        start = time.time()
+        return self._record(self.machine.pull(workload), "pull", workload, start=start)
+
+    def container(self, image: str, **kwargs) -> Container:
+        return RecordingContainer(self._archive, [self._slot, "container", image, kwargs],
+                                  self.machine.container(image, **kwargs))
+
+    def sleep(self, amount: float):
+        self.machine.sleep(amount)
+
+    def close(self):
+        self.machine.close()
+
+    def reap(self):
+        self.machine.reap()
+
+    def __str__(self):
+        return str(self.machine)
+
+
+class ReplayContainer(Container):
+    """Container serving recorded outputs, taking the recorded time if latency is set."""
+
+    def __init__(self, archive: Archive, key: list, latency: bool = False):
+        self._archive = archive
+        self._key = key
+        self._latency = latency
+
+    def _replay(self, *args):
+        value, seconds = self._archive.replay_timed(_key(*self._key, *args))
+        if self._latency:
+            time.sleep(seconds)
+        return value
+
+    def _wait(self, *args):
+        """Takes the recorded time of a call without a result, if any."""
+        if self._latency:
+            with contextlib.suppress(KeyError):
+                self._replay(*args)
+
+    def run(self, **env):
+        return self._replay("run", env)
+
+    def stream(self, **env) -> types.GeneratorType:
+        start = time.time()
+        lines, seconds = self._archive.replay_timed(_key(*self._key, "stream", env))
+        for offset, line in lines:
+            if self._latency:
+                time.sleep(max(0.0, start + offset - time.time()))
+            yield start + offset, line
+        if self._latency:
+            time.sleep(max(0.0, start + seconds - time.time()))
+
+    @contextlib.contextmanager
+    def detach(self, **env):
+        self._wait("detach", env)
+        try:
+            yield self
+        finally:
+            self._wait("remove", env)
+
+    def address(self) -> (str, int):
+        return tuple(self._replay("address"))
+
+    def get_names(self) -> types.GeneratorType:
+        yield from self._replay("get_names")
+
+    def get_pids(self) -> types.GeneratorType:
+        yield from (tuple(pid) for pid in self._replay("get_pids"))
+
+    def network(self) -> dict:
+        return self._replay("network")
+
+    def startup(self) -> float:
+        try:
+            return self._replay("startup")
+        except KeyError:
+            # Recorded before startup times were.
+            return None
+
+    def boot_phases(self) -> dict:
+        try:
+            return self._replay("boot_phases")
+        except KeyError:
+            # Recorded before boot phases were.
+            return {}
+
+
+class ReplayMachine(Machine):
+    """Machine serving the outputs recorded by a RecordingMachine.
+
+    :param archive: the archive to replay.
+    :param slot: the position of the machine in its lease.
+    :param latency: whether calls take as long as they were recorded to.
+    """
+
+    def __init__(self, archive: Archive, slot: int, latency: bool = False):
+        self._archive = archive
+        self._slot = slot
+        self._latency = latency
+
+    def _replay(self, *args):
+        value, seconds = self._archive.replay_timed(_key(self._slot, *args))
+        if self._latency:
+            time.sleep(seconds)
+        return value
+
+    def run(self, cmd: str) -> (str, str):
+        return tuple(self._replay("run", cmd))
+
+    async def run_stream(self, cmd: str) -> typing.AsyncIterator[str]:
+        # Streams (e.g. of telemetry) run until cancelled: they take no time.
+        for line in self._archive.replay(_key(self._slot, "run_stream", cmd)):
+            yield line
+
+    def read(self, path: str) -> str:
+        return self._replay("read", path)
+
+    def pull(self, workload: str) -> str:
+        return self._replay("pull", workload)
+
+    def container(self, image: str, **kwargs) -> Container:
+        return ReplayContainer(self._archive, [self._slot, "container", image, kwargs],
+                               self._latency)
+
+    def sleep(self, amount: float):
+        if self._latency:
+            time.sleep(amount)
@@ -0,0 +1,92 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for record and replay."""
+
+import zipfile
+
+import pytest
+
+from benchmarks import helpers, sysbench
+from harness.machine import MockMachine
+from harness.replay import INDEX, TIMING, Archive, RecordingMachine, ReplayMachine, _key
+
+
+def test_replay_benchmark(tmp_path):
+    """Test a replayed benchmark reports the recorded results."""
+    path = str(tmp_path / "archive.zip")
+    archive = Archive(path)
+    recorded = list(sysbench.cpu(RecordingMachine(archive, 0, MockMachine()), runtime="runc"))
+    archive.save()
+
+    replayed = list(sysbench.cpu(ReplayMachine(Archive(path), 0), runtime="runc"))
+    assert replayed == recorded
+
+
+def test_replay_order(tmp_path):
+    """Test repeated calls are served in recorded order, then wrap around."""
+    path = str(tmp_path / "archive.zip")
+    archive = Archive(path)
+    archive.record("key", "a")
+    archive.record("key", "b")
+    archive.record("key", "a")
+    archive.save()
+
+    archive = Archive(path)
+    assert [archive.replay("key") for _ in range(4)] == ["a", "b", "a", "a"]
+    with pytest.raises(KeyError):
+        archive.replay("other")
+    # Identical results are stored once.
+    assert len(set(zipfile.ZipFile(path).namelist()) - {INDEX, TIMING}) == 2
+
+
+def test_replay_stream(tmp_path):
+    """Test container streams keep their lines and relative timing."""
+    path = str(tmp_path / "archive.zip")
+    archive = Archive(path)
+    machine = RecordingMachine(archive, 0, MockMachine())
+    recorded = list(machine.container("absl").stream())
+    archive.save()
+
+    replayed = list(ReplayMachine(Archive(path), 0).container("absl").stream())
+    assert [line for _, line in replayed] == [line for _, line in recorded]
+    assert replayed[-1][0] >= replayed[0][0]
+
+
+def test_replay_latency(tmp_path):
+    """Test host-timed metrics replay with latency, and as about 0 without."""
+    path = str(tmp_path / "archive.zip")
+    archive = Archive(path)
+    archive.record(_key(0, "container", "true", {}, "run", {}), "", seconds=0.2)
+    archive.record(_key(0, "container", "absl", {}, "stream", {}), [[0.1, "a\n"]], seconds=0.3)
+    archive.save()
+
+    for latency, minimum, maximum in ((False, 0.0, 0.1), (True, 0.5, 1.0)):
+        machine = ReplayMachine(Archive(path), 0, latency=latency)
+        timer = helpers.Timer()
+        machine.container("true").run()
+        assert helpers.parse_stream(machine.container("absl").stream()) == "a\n"
+        assert minimum <= timer.elapsed() < maximum
+
+
+def test_record_timing(tmp_path):
+    """Test recorded calls keep the time they took, and old archives none."""
+    path = str(tmp_path / "archive.zip")
+    archive = Archive(path)
+    archive.record("key", "a", seconds=1.5)
+    archive.save()
+    assert Archive(path).replay_timed("key") == ("a", 1.5)
+    with zipfile.ZipFile(path) as original, zipfile.ZipFile(str(tmp_path / "old.zip"), "w") as old:
+        for name in original.namelist():
+            if name != TIMING:
+                old.writestr(name, original.read(name))
+    assert Archive(str(tmp_path / "old.zip")).replay_timed("key") == ("a", 0.0)
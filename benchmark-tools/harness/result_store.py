@@ -0,0 +1,298 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A queryable store of benchmark results.
+
+Results are kept in an SQLite database, one row per run with the benchmark,
+platform (the runtime or e.g. native), host and time, and the run's
+parameters and metric values in their own tables. All are indexed, so
+filtered aggregations over months of runs do not scan unrelated results.
+
+Only the standard library is used, so that runners outside the harness (e.g.
+experiments/) can write to the same store.
+"""
+
+import contextlib
+import csv
+import math
+import os
+import sqlite3
+import statistics
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    benchmark TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    host TEXT NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_benchmark ON runs (benchmark, platform, time);
+CREATE INDEX IF NOT EXISTS runs_host ON runs (host, time);
+CREATE INDEX IF NOT EXISTS runs_time ON runs (time);
+CREATE TABLE IF NOT EXISTS parameters (
+    run INTEGER NOT NULL REFERENCES runs (id),
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (run, name)
+);
+CREATE INDEX IF NOT EXISTS parameters_value ON parameters (name, value, run);
+CREATE TABLE IF NOT EXISTS results (
+    run INTEGER NOT NULL REFERENCES runs (id),
+    metric TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (run, metric)
+);
+CREATE INDEX IF NOT EXISTS results_metric ON results (metric, run);
+CREATE TABLE IF NOT EXISTS telemetry (
+    run INTEGER NOT NULL REFERENCES runs (id),
+    machine TEXT NOT NULL,
+    series TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS telemetry_run ON telemetry (run);
+"""
+
+# COLUMNS are the run columns that can be filtered and grouped by. Any other
+# name is taken as a parameter.
+COLUMNS = ["benchmark", "platform", "host", "source", "metric"]
+
+
+class _Values:
+    """SQLite aggregate collecting values for a statistics function."""
+
+    function = None
+
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        """Adds a value."""
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        """Returns the statistic of all values."""
+        try:
+            return type(self).function(self.values)
+        except (statistics.StatisticsError, IndexError):
+            return None
+
+
+def _percentile(fraction: float):
+    """Returns a nearest-rank percentile function."""
+    def percentile(values):
+        values = sorted(values)
+        return values[max(0, math.ceil(fraction * len(values)) - 1)]
+    return percentile
+
+
+# STATS maps statistic names to SQL aggregates, or to functions registered as
+# aggregates.
+STATS = {
+    "count": "COUNT",
+    "mean": "AVG",
+    "min": "MIN",
+    "max": "MAX",
+    "sum": "SUM",
+    "median": statistics.median,
+    "stdev": statistics.stdev,
+    "p10": _percentile(0.1),
+    "p90": _percentile(0.9),
+    "p99": _percentile(0.99),
+}
+
+
+class ResultStore:
+    """An SQLite store of benchmark results. Usage:
+
+    store = ResultStore("results.db")
+    store.add("sysbench.cpu", {"threads": 1}, {"events_per_second": 9093.38},
+              platform="runsc", host="bench-1")
+    columns, rows = store.query(benchmark="sysbench.cpu", group_by=["platform", "threads"])
+    """
+
+    def __init__(self, path: str):
+        self._path = os.path.expanduser(path)
+        directory = os.path.dirname(os.path.abspath(self._path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            # Readers do not block writers, so that concurrent runners can
+            # share one store.
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Yields a connection, committing on success.
+
+        Each operation uses its own connection, so that a store can be used
+        from any thread.
+        """
+        connection = sqlite3.connect(self._path, timeout=60)
+        for name, function in STATS.items():
+            if callable(function):
+                aggregate = type(name, (_Values,), {"function": staticmethod(function)})
+                connection.create_aggregate(name, 1, aggregate)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    # pylint: disable-msg=too-many-arguments
+    def add(self, benchmark: str, parameters: dict, results: dict,
+            platform: str = "", host: str = "", source: str = "",
+            timestamp: float = None, telemetry: list = ()) -> int:
+        """Adds the results of one run.
+
+        :param benchmark: the benchmark name.
+        :param parameters: a dict of parameter names to values.
+        :param results: a dict of metric names to numeric values.
+        :param platform: the platform, e.g. the container runtime.
+        :param host: the machine the run used.
+        :param source: the runner that produced the results.
+        :param timestamp: the time of the run; now by default.
+        :param telemetry: the host telemetry of the run, one Telemetry per
+            machine; their series are stored.
+        :return: the run id.
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO runs (time, benchmark, platform, host, source) VALUES (?, ?, ?, ?, ?)",
+                (time.time() if timestamp is None else timestamp,
+                 benchmark, platform, host, source))
+            run = cursor.lastrowid
+            connection.executemany(
+                "INSERT INTO parameters (run, name, value) VALUES (?, ?, ?)",
+                [(run, name, str(value)) for name, value in parameters.items()])
+            connection.executemany(
+                "INSERT INTO results (run, metric, value) VALUES (?, ?, ?)",
+                [(run, metric, float(value)) for metric, value in results.items()
+                 if value is not None])
+            connection.executemany(
+                "INSERT INTO telemetry (run, machine, series, seconds, value) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(run, machine.name, name, seconds, float(value)) for machine in telemetry
+                 for name, values in machine.series().items() for seconds, value in values])
+        return run
+
+    def telemetry(self, run: int) -> dict:
+        """Returns the host telemetry of a run.
+
+        :param run: the run id.
+        :return: a dict of machine names to dicts of series names to lists of
+            (seconds, value), as Telemetry.series.
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT machine, series, seconds, value FROM telemetry WHERE run = ? "
+                "ORDER BY rowid", (run,)).fetchall()
+        machines = {}
+        for machine, name, seconds, value in rows:
+            machines.setdefault(machine, {}).setdefault(name, []).append((seconds, value))
+        return machines
+
+    # pylint: disable-msg=too-many-locals
+    def query(self, group_by: list = ("benchmark", "platform", "metric"),
+              stats: list = ("count", "median"), since: float = None,
+              until: float = None, **filters) -> (list, list):
+        """Aggregates results.
+
+        :param group_by: columns (benchmark, platform, host, source, metric)
+            or parameter names to group by.
+        :param stats: statistics of each group, from STATS.
+        :param since: only runs at or after this time.
+        :param until: only runs before this time.
+        :param filters: columns or parameters to filter on. Values are
+            strings, or lists of strings of which any may match.
+        :return: the column names, and the rows.
+        """
+        joins, join_args, where, args = [], [], [], []
+
+        def column(name):
+            if name == "metric":
+                return "results.metric"
+            if name in COLUMNS:
+                return "runs." + name
+            alias = "p%d" % len(joins)
+            joins.append("LEFT JOIN parameters AS %s ON %s.run = runs.id AND %s.name = ?"
+                         % (alias, alias, alias))
+            join_args.append(name)
+            return alias + ".value"
+
+        selected = [column(name) for name in group_by]
+        for name, value in filters.items():
+            values = [value] if isinstance(value, str) else list(value)
+            where.append("%s IN (%s)" % (column(name), ", ".join("?" * len(values))))
+            args.extend(str(value) for value in values)
+        if since is not None:
+            where.append("runs.time >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("runs.time < ?")
+            args.append(until)
+        unknown = [stat for stat in stats if stat not in STATS]
+        if unknown:
+            raise ValueError("unknown statistics: %s" % ", ".join(unknown))
+        aggregates = ["%s(results.value)" % (name if callable(STATS[name]) else STATS[name])
+                      for name in stats]
+        sql = "SELECT %s FROM runs JOIN results ON results.run = runs.id %s" % (
+            ", ".join(selected + aggregates), " ".join(joins))
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if selected:
+            sql += " GROUP BY %s ORDER BY %s" % (", ".join(selected), ", ".join(selected))
+        with self._connect() as connection:
+            rows = connection.execute(sql, join_args + args).fetchall()
+        return list(group_by) + list(stats), rows
+
+    # pylint: disable-msg=too-many-arguments
+    def import_csv(self, path: str, benchmark: str, platform: str = "", host: str = "",
+                   source: str = "csv", metrics: int = 1) -> int:
+        """Adds results from a csv file with a header row.
+
+        Files written by perf.py run have a metric column, and every column
+        after it is the value of one run (several with --stat=all). In other
+        files, e.g. those of experiments/, the last columns are metrics and
+        the others parameters. Runs are timestamped with the file's
+        modification time.
+
+        :param metrics: the number of trailing metric columns, for files
+            without a metric column.
+        :return: the number of runs added.
+        """
+        with open(path, newline="") as results:
+            rows = list(csv.reader(results))
+        if not rows:
+            return 0
+        header, rows = rows[0], rows[1:]
+        timestamp = os.path.getmtime(path)
+        added = 0
+        for row in rows:
+            if "metric" in header:
+                index = header.index("metric")
+                parameters = dict(zip(header[:index], row[:index]))
+                for value in row[index + 1:]:
+                    self.add(benchmark, parameters, {row[index]: value}, platform, host,
+                             source, timestamp)
+                    added += 1
+            else:
+                split = len(header) - metrics
+                self.add(benchmark, dict(zip(header[:split], row[:split])),
+                         dict(zip(header[split:], row[split:])), platform, host, source,
+                         timestamp)
+                added += 1
+        return added
@@ -0,0 +1,84 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the result store."""
+
+import pytest
+
+from harness.result_store import ResultStore
+from harness.telemetry import Telemetry
+
+
+@pytest.fixture(name="store")
+def fixture_store(tmp_path):
+    """Returns a store of sysbench results on two runtimes."""
+    store = ResultStore(str(tmp_path / "results.db"))
+    for runtime, threads, value, timestamp in [("runc", 1, 100, 10), ("runc", 1, 110, 20),
+                                               ("runc", 2, 200, 30), ("runsc", 1, 50, 40),
+                                               ("runsc", 2, 90, 50)]:
+        store.add("sysbench.cpu", {"threads": threads}, {"events_per_second": value},
+                  platform=runtime, host="bench-1", timestamp=timestamp)
+    return store
+
+
+def test_query_groups(store):
+    """Test the default grouping by benchmark, platform and metric."""
+    columns, rows = store.query()
+    assert columns == ["benchmark", "platform", "metric", "count", "median"]
+    assert rows == [("sysbench.cpu", "runc", "events_per_second", 3, 110),
+                    ("sysbench.cpu", "runsc", "events_per_second", 2, 70)]
+
+
+def test_query_parameters(store):
+    """Test grouping and filtering by parameters."""
+    _, rows = store.query(group_by=["platform", "threads"], stats=["mean", "p90"],
+                          platform="runc")
+    assert rows == [("runc", "1", 105, 110), ("runc", "2", 200, 200)]
+    _, rows = store.query(group_by=["platform"], stats=["count"], threads=["2"])
+    assert rows == [("runc", 1), ("runsc", 1)]
+
+
+def test_query_time(store):
+    """Test filtering by time."""
+    _, rows = store.query(group_by=[], stats=["count", "min"], since=20, until=50)
+    assert rows == [(3, 50)]
+
+
+def test_query_unknown_stat(store):
+    """Test an unknown statistic is refused."""
+    with pytest.raises(ValueError):
+        store.query(stats=["mode"])
+
+
+def test_import_csv(tmp_path):
+    """Test csv files of perf.py and experiments/ are imported."""
+    store = ResultStore(str(tmp_path / "results.db"))
+    perf = tmp_path / "perf.csv"
+    perf.write_text("runtime,metric,result\nrunsc,cpu_events_per_second,1,2,3\n")
+    experiments = tmp_path / "sysbench_cpu.csv"
+    experiments.write_text("num_threads,max_time,events_per_second\n1,0,9000.5\n")
+    assert store.import_csv(str(perf), "sysbench.cpu") == 3
+    assert store.import_csv(str(experiments), "sysbench_cpu", platform="native") == 1
+    _, rows = store.query(group_by=["benchmark", "runtime", "num_threads"],
+                          stats=["count", "sum"])
+    assert rows == [("sysbench.cpu", "runsc", None, 3, 6), ("sysbench_cpu", None, "1", 1, 9000.5)]
+
+
+def test_telemetry(tmp_path):
+    """Test the telemetry series of a run are stored with it."""
+    store = ResultStore(str(tmp_path / "results.db"))
+    telemetry = Telemetry("bench-1", [
+        {"time": 0, "cpu": {"user": 0}, "pressure": {}, "interrupts": 0},
+        {"time": 2, "cpu": {"user": 100}, "pressure": {}, "interrupts": 500}])
+    run = store.add("sysbench.cpu", {}, {"events_per_second": 100}, telemetry=[telemetry])
+    assert store.telemetry(run) == {"bench-1": telemetry.series()}
+    assert store.telemetry(store.add("sysbench.cpu", {}, {"events_per_second": 100})) == {}
@@ -13,9 +13,10 @@
 """SSHConnection handles the details of SSH connections."""
 
 import os
+import threading
 import warnings
 
-from paramiko import SSHClient, AutoAddPolicy, RSAKey
+from paramiko import SSHClient, AutoAddPolicy, RSAKey, Transport, Channel
 from harness import LOCAL_WORKLOADS_PATH, REMOTE_WORKLOADS_PATH
 
 # Get rid of paramiko Cryptography Warnings.
@@ -36,7 +37,11 @@ def send_one_file(client: SSHClient, path: str, remote_dir: str):
 
 
 class SSHConnection:
-    """SSH connection to a remote machine."""
+    """SSH connection to a remote machine.
+
+    A single authenticated transport is kept open and shared by all commands,
+    file transfers and forwarded channels (e.g. the docker socket).
+    """
 
     def __init__(self, name: str, hostname: str, key_path: str, username: str, **kwargs):
         """Sets up a paramiko ssh connection to the given hostname."""
@@ -50,15 +55,34 @@ class SSHConnection:
         # that begin with '----BEGIN RSAKEY----'.
         # https://stackoverflow.com/questions/53600581/ssh-key-generated-by-ssh-keygen-is-not-recognized-by-paramiko
         self.rsa_key = self._rsa()
+        self._ssh_client = None
+        self._lock = threading.Lock()
         self.run("true")# Validate.
 
     def _client(self) -> SSHClient:
-        client = SSHClient()
-        client.set_missing_host_key_policy(AutoAddPolicy())
-        client.connect(hostname=self._hostname, port=22,
-                       username=self._username, pkey=self.rsa_key,
-                       allow_agent=False, look_for_keys=False)
-        return client
+        """Returns the connected client, reconnecting if the transport died."""
+        with self._lock:
+            if self._ssh_client is None or not self._ssh_client.get_transport() \
+               or not self._ssh_client.get_transport().is_active():
+                client = SSHClient()
+                client.set_missing_host_key_policy(AutoAddPolicy())
+                # Guests may forward SSH from another port (see vm_pool_producer).
+                client.connect(hostname=self._hostname, port=int(self._kwargs.get("port", 22)),
+                               username=self._username, pkey=self.rsa_key,
+                               allow_agent=False, look_for_keys=False)
+                self._ssh_client = client
+            return self._ssh_client
+
+    def transport(self) -> Transport:
+        """Returns the shared paramiko transport."""
+        return self._client().get_transport()
+
+    def close(self):
+        """Closes the shared connection."""
+        with self._lock:
+            if self._ssh_client is not None:
+                self._ssh_client.close()
+                self._ssh_client = None
 
     def _rsa(self):
         password = self._kwargs["key_password"] if "key_password" in self._kwargs else None
@@ -71,24 +95,37 @@ class SSHConnection:
         :param cmd: The shell command to run.
         :return: The contents of stdout and stderr.
         """
-        with self._client() as client:
-            _, stdout, stderr = client.exec_command(command=cmd)
-            stdout.channel.recv_exit_status()
-            stdout = stdout.read().decode("utf-8")
-            stderr = stderr.read().decode("utf-8")
+        _, stdout, stderr = self._client().exec_command(command=cmd)
+        stdout.channel.recv_exit_status()
+        stdout = stdout.read().decode("utf-8")
+        stderr = stderr.read().decode("utf-8")
         return stdout, stderr
 
+    def exec_stream(self, cmd: str) -> Channel:
+        """Starts a command via ssh without waiting for it to finish.
+
+        The command runs on a pty, so stderr is merged into stdout and closing
+        the channel hangs up the command (sshd sends it SIGHUP).
+
+        :param cmd: The shell command to run.
+        :return: The channel carrying the command's output.
+        """
+        channel = self.transport().open_session()
+        channel.get_pty()
+        channel.exec_command(cmd)
+        return channel
+
     def send_workload(self, name: str) -> str:
         """Sends a workload to the remote machine.
 
         :param name: The workload name.
         :return: The remote path.
         """
-        with self._client() as client:
-            for dirpath, _, filenames in os.walk(LOCAL_WORKLOADS_PATH.format(name)):
-                for filename in filenames:
-                    send_one_file(
-                        client,
-                        os.path.join(dirpath, filename),
-                        REMOTE_WORKLOADS_PATH.format(name))
+        client = self._client()
+        for dirpath, _, filenames in os.walk(LOCAL_WORKLOADS_PATH.format(name)):
+            for filename in filenames:
+                send_one_file(
+                    client,
+                    os.path.join(dirpath, filename),
+                    REMOTE_WORKLOADS_PATH.format(name))
         return REMOTE_WORKLOADS_PATH.format(name)
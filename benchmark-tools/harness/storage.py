@@ -0,0 +1,118 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Storage backends for the files of I/O benchmarks.
+
+Each backend is provisioned on the machine for one benchmark run, and gives
+the arguments of the containers using it and the path of their file:
+
+  bind:    a directory of the host's filesystem, bind mounted.
+  tmpfs:   a tmpfs mounted in the container.
+  overlay: the container's own root filesystem (e.g. overlay2, or the
+           microVM's root drive).
+  loop:    an ext4 image file on the host, loop mounted and bind mounted.
+  raw:     a preallocated raw file on the host, used as the file itself. A
+           microVM gets it as a virtio-blk drive. As the only file, it is
+           for single-file, single-job I/O.
+"""
+
+import contextlib
+import os
+import uuid
+
+from harness.firecracker import FIRECRACKER
+from harness.machine import Machine
+
+# BACKENDS are the storage backends.
+BACKENDS = ["bind", "tmpfs", "overlay", "loop", "raw"]
+
+# MOUNT is the directory of the file in containers; OVERLAY_DIR is the one
+# of overlay files, which is not a mount in the images or microVMs.
+MOUNT = "/disk"
+OVERLAY_DIR = "/var/tmp"
+
+# LOOP_HEADROOM is the space of loop images beyond the file, for ext4.
+LOOP_HEADROOM = 64 * 1024 * 1024
+
+
+def default_backend(runtime: str = "") -> str:
+    """Returns the backend of I/O benchmarks not given one: bind, or overlay
+    for microVMs, which share no directories with the host."""
+    return "overlay" if runtime == FIRECRACKER else "bind"
+
+
+def _mkdtemp(machine: Machine, directory: str) -> str:
+    """Returns a new directory on the machine, in the given directory."""
+    path = os.path.join(directory, "storage-%s" % uuid.uuid4().hex[:12])
+    machine.run("mkdir -p {path}".format(path=path))
+    return path
+
+
+#pylint: disable-msg=too-many-arguments
+@contextlib.contextmanager
+def provision(machine: Machine, backend: str, filename: str, size: int,
+              directory: str = "", runtime: str = "") -> (dict, str):
+    """Provisions a storage backend, and removes it on exit.
+
+    :param machine: the machine of the containers.
+    :param backend: one of BACKENDS.
+    :param filename: the file's name.
+    :param size: the file's size in bytes, for the loop and raw backends.
+    :param directory: the host directory of the bind, loop and raw backends;
+        by default the working directory.
+    :param runtime: the containers' runtime.
+    :return: the container arguments and the path of the file in containers.
+    :raises ValueError: if the backend is unknown, or needs a directory
+        shared with a microVM.
+    """
+    if backend not in BACKENDS:
+        raise ValueError("unknown storage backend %s: use one of %s" % (
+            backend, ", ".join(BACKENDS)))
+    if runtime == FIRECRACKER and backend in ("bind", "loop"):
+        raise ValueError("microVMs share no directories with the host: use the tmpfs, "
+                         "overlay or raw storage backend")
+    if backend == "tmpfs":
+        yield {"tmpfs": {MOUNT: ""}}, os.path.join(MOUNT, filename)
+        return
+    if backend == "overlay":
+        yield {}, os.path.join(OVERLAY_DIR, filename)
+        return
+    if not directory:
+        stdout, _ = machine.run("pwd")
+        directory = stdout.rstrip()
+    path = os.path.join(MOUNT, filename)
+    if backend == "bind":
+        try:
+            yield {"volumes": {directory: {"bind": MOUNT, "mode": "rw"}}}, path
+        finally:
+            machine.run("rm -f {path}".format(path=os.path.join(directory, filename)))
+        return
+    tmp = _mkdtemp(machine, directory)
+    try:
+        if backend == "loop":
+            image = os.path.join(tmp, "disk.img")
+            mount = os.path.join(tmp, "mnt")
+            machine.run(("truncate -s {size} {image} && mkfs.ext4 -q -F {image} && "
+                         "mkdir {mount} && sudo mount -o loop {image} {mount} && "
+                         "sudo chmod 777 {mount}").format(
+                             size=int(size) + LOOP_HEADROOM, image=image, mount=mount))
+            try:
+                yield {"volumes": {mount: {"bind": MOUNT, "mode": "rw"}}}, path
+            finally:
+                machine.run("sudo umount {mount}".format(mount=mount))
+        else:
+            raw = os.path.join(tmp, filename)
+            machine.run("fallocate -l {size} {raw} || truncate -s {size} {raw}".format(
+                size=int(size), raw=raw))
+            yield {"volumes": {raw: {"bind": path, "mode": "rw"}}}, path
+    finally:
+        machine.run("rm -rf {tmp}".format(tmp=tmp))
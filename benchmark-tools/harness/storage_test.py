@@ -0,0 +1,88 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for storage backends."""
+
+import pytest
+
+from harness.machine import MockMachine
+from harness.storage import default_backend, provision
+
+
+class StorageMachine(MockMachine):
+    """Mock machine recording commands, in /work."""
+
+    def __init__(self):
+        self.commands = []
+
+    def run(self, cmd: str) -> (str, str):
+        self.commands.append(cmd)
+        return ("/work\n" if cmd == "pwd" else ""), ""
+
+
+def test_mounts():
+    """Test the tmpfs and overlay backends need nothing on the host."""
+    machine = StorageMachine()
+    with provision(machine, "tmpfs", "file.dat", 1024) as (volumes, path):
+        assert volumes == {"tmpfs": {"/disk": ""}} and path == "/disk/file.dat"
+    with provision(machine, "overlay", "file.dat", 1024) as (volumes, path):
+        assert volumes == {} and path == "/var/tmp/file.dat"
+    assert not machine.commands
+
+
+def test_bind():
+    """Test the bind backend mounts the working directory, and cleans up."""
+    machine = StorageMachine()
+    with provision(machine, "bind", "file.dat", 1024) as (volumes, path):
+        assert volumes == {"volumes": {"/work": {"bind": "/disk", "mode": "rw"}}}
+        assert path == "/disk/file.dat"
+    assert machine.commands[-1] == "rm -f /work/file.dat"
+
+
+def test_loop():
+    """Test the loop backend mounts an image, and unmounts it on errors."""
+    machine = StorageMachine()
+    with pytest.raises(RuntimeError):
+        with provision(machine, "loop", "file.dat", 1024, directory="/data") as (volumes, _):
+            (mount,) = volumes["volumes"]
+            assert mount.startswith("/data/storage-") and mount.endswith("/mnt")
+            raise RuntimeError("fio failed")
+    assert "mount -o loop" in machine.commands[1]
+    assert machine.commands[-2] == "sudo umount " + mount
+    assert machine.commands[-1].startswith("rm -rf /data/storage-")
+
+
+def test_raw():
+    """Test the raw backend binds a preallocated file as the file."""
+    machine = StorageMachine()
+    with provision(machine, "raw", "file.dat", 1024, runtime="firecracker") as (volumes, path):
+        ((raw, volume),) = volumes["volumes"].items()
+        assert raw.endswith("/file.dat") and volume["bind"] == path == "/disk/file.dat"
+    assert "fallocate -l 1024 " + raw in machine.commands[2]
+
+
+def test_invalid():
+    """Test unknown backends, and directories for microVMs, are refused."""
+    with pytest.raises(ValueError, match="unknown storage backend"):
+        with provision(StorageMachine(), "nfs", "file.dat", 1024):
+            pass
+    with pytest.raises(ValueError, match="microVMs share no directories"):
+        with provision(StorageMachine(), "bind", "file.dat", 1024, runtime="firecracker"):
+            pass
+
+
+def test_default_backend():
+    """Test microVMs default to a backend they can use."""
+    assert default_backend() == default_backend("runc") == "bind"
+    with provision(StorageMachine(), default_backend("firecracker"), "file.dat", 1024,
+                   runtime="firecracker") as (volumes, _):
+        assert volumes == {}
@@ -0,0 +1,211 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Host telemetry sampled while benchmarks run."""
+
+import asyncio
+import logging
+import threading
+
+from harness.machine import Machine
+
+# TELEMETRY_SCRIPT prints a sample of host counters every interval, until it is
+# killed. Each sample starts with a "sample <nanoseconds>" line, followed by:
+#   cpu: the aggregate /proc/stat line (jiffies).
+#   /proc/pressure/<resource>:<some|full> avg10=... : pressure stall info.
+#   interrupts <total>: all interrupts from /proc/interrupts.
+#   <vmstat counter> <value>: selected /proc/vmstat counters.
+#   cpufreq <kHz>: the mean current frequency of all cpus.
+TELEMETRY_SCRIPT = r"""while true; do
+echo sample $(date +%s%N)
+head -1 /proc/stat
+grep -H . /proc/pressure/* 2>/dev/null
+awk 'NR > 1 {for (i = 2; i <= NF && $i ~ /^[0-9]+$/; i++) s += $i} END {print "interrupts", s}' /proc/interrupts
+grep -E '^(pgmajfault|pswpin|pswpout|allocstall_normal|oom_kill) ' /proc/vmstat
+cat /sys/devices/system/cpu/cpu*/cpufreq/scaling_cur_freq 2>/dev/null | awk '{s += $1; n++} END {if (n) print "cpufreq", s / n}'
+sleep {interval}
+done"""
+
+# CPU_FIELDS are the columns of the /proc/stat cpu line.
+CPU_FIELDS = ["user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal"]
+
+# THRESHOLDS are the default limits beyond which an iteration is flagged:
+#   steal: percent of cpu time stolen by the hypervisor.
+#   irq: percent of cpu time spent in interrupt handlers.
+#   memory_pressure: /proc/pressure/memory "some" avg10.
+#   io_pressure: /proc/pressure/io "full" avg10.
+#   swapping: pages swapped in or out per second.
+#   throttling: percent the mean cpu frequency fell below its peak.
+#   oom_kill: OOM kills during the iteration.
+THRESHOLDS = {
+    "steal": 5.0,
+    "irq": 20.0,
+    "memory_pressure": 10.0,
+    "io_pressure": 10.0,
+    "swapping": 0.0,
+    "throttling": 30.0,
+    "oom_kill": 0,
+}
+
+
+def parse_sample(lines: list) -> dict:
+    """Parses the lines of one TELEMETRY_SCRIPT sample.
+
+    :param lines: the lines of the sample, including the "sample" line.
+    :return: a dict of "time" (seconds), "cpu" (dict of jiffies), "pressure"
+        (dict of e.g. "memory_some" to avg10), "interrupts", "cpufreq" (kHz)
+        and the vmstat counters.
+    """
+    sample = {"cpu": {}, "pressure": {}}
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0] == "sample":
+            sample["time"] = int(fields[1]) / 1e9
+        elif fields[0] == "cpu":
+            sample["cpu"] = dict(zip(CPU_FIELDS, (int(value) for value in fields[1:])))
+        elif fields[0].startswith("/proc/pressure/"):
+            resource, kind = fields[0][len("/proc/pressure/"):].split(":")
+            avg10 = dict(field.split("=") for field in fields[1:])["avg10"]
+            sample["pressure"]["%s_%s" % (resource, kind)] = float(avg10)
+        elif len(fields) == 2:
+            sample[fields[0]] = float(fields[1])
+    return sample
+
+
+class Telemetry:
+    """Host samples of one machine over one benchmark iteration."""
+
+    def __init__(self, name: str, samples: list):
+        self.name = name
+        self.samples = samples
+
+    def series(self) -> dict:
+        """Returns the derived time series.
+
+        :return: a dict of series names to lists of (seconds since the first
+            sample, value). Rates and cpu percentages cover the interval
+            ending at each sample.
+        """
+        series = {}
+
+        def add(name, offset, value):
+            series.setdefault(name, []).append((offset, value))
+
+        start = self.samples[0]["time"] if self.samples else 0
+        for previous, sample in zip(self.samples, self.samples[1:]):
+            offset = sample["time"] - start
+            elapsed = sample["time"] - previous["time"]
+            cpu = {key: sample["cpu"].get(key, 0) - previous["cpu"].get(key, 0)
+                   for key in CPU_FIELDS}
+            total = sum(cpu.values())
+            if total:
+                add("steal", offset, 100.0 * cpu["steal"] / total)
+                add("irq", offset, 100.0 * (cpu["irq"] + cpu["softirq"]) / total)
+                add("iowait", offset, 100.0 * cpu["iowait"] / total)
+            for key, value in sample["pressure"].items():
+                add("pressure_" + key, offset, value)
+            for key in ("interrupts", "pgmajfault", "allocstall_normal"):
+                if key in sample and key in previous and elapsed:
+                    add(key, offset, (sample[key] - previous[key]) / elapsed)
+            if "pswpin" in sample and "pswpin" in previous and elapsed:
+                add("swapping", offset, (sample["pswpin"] + sample["pswpout"] -
+                                         previous["pswpin"] - previous["pswpout"]) / elapsed)
+            if "cpufreq" in sample:
+                add("cpufreq", offset, sample["cpufreq"])
+        return series
+
+    def flags(self, thresholds: dict = None) -> list:
+        """Returns descriptions of the host conditions beyond the thresholds."""
+        thresholds = dict(THRESHOLDS, **(thresholds or {}))
+        series = self.series()
+        peaks = {name: max(value for _, value in values) for name, values in series.items()}
+        flags = []
+
+        def check(name, value, unit):
+            if value > thresholds[name]:
+                flags.append("%s: %s %.1f%s > %s" % (self.name, name, value, unit,
+                                                     thresholds[name]))
+
+        for name in ("steal", "irq", "swapping"):
+            if name in peaks:
+                check(name, peaks[name], "/s" if name == "swapping" else "%")
+        if "pressure_memory_some" in peaks:
+            check("memory_pressure", peaks["pressure_memory_some"], "")
+        if "pressure_io_full" in peaks:
+            check("io_pressure", peaks["pressure_io_full"], "")
+        if "cpufreq" in series:
+            frequencies = [value for _, value in series["cpufreq"]]
+            check("throttling", 100.0 * (1 - min(frequencies) / max(frequencies)), "%")
+        if len(self.samples) > 1 and "oom_kill" in self.samples[0]:
+            check("oom_kill", self.samples[-1]["oom_kill"] - self.samples[0]["oom_kill"], "")
+        return flags
+
+
+class HostSampler:
+    """Samples host telemetry of a machine in the background. Usage:
+
+    sampler = HostSampler(machine)
+    sampler.start()
+    # run the benchmark.
+    telemetry = sampler.stop()
+
+    A single command is left running on the machine for the whole iteration,
+    so sampling costs no round trips.
+    """
+
+    def __init__(self, machine: Machine, interval: float = 1.0):
+        self._machine = machine
+        self._interval = interval
+        self._samples = []
+        self._thread = None
+        self._loop = None
+        self._task = None
+        self._started = threading.Event()
+
+    def start(self):
+        """Starts sampling."""
+        self._thread = threading.Thread(target=asyncio.run, args=(self._run(),), daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self) -> Telemetry:
+        """Stops sampling.
+
+        :return: the samples taken since start.
+        """
+        try:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        except RuntimeError:
+            pass  # The stream already ended and closed the loop.
+        self._thread.join()
+        return Telemetry(str(self._machine), self._samples)
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        self._started.set()
+        lines = []
+        stream = self._machine.run_stream(TELEMETRY_SCRIPT.replace("{interval}", str(self._interval)))
+        try:
+            async for line in stream:
+                if line.startswith("sample ") and lines:
+                    self._samples.append(parse_sample(lines))
+                    lines = []
+                lines.append(line)
+        except asyncio.CancelledError:
+            pass
+        except Exception as exc:  #pylint: disable-msg=broad-except
+            logging.warning("Host telemetry of %s stopped: %s", self._machine, exc)
+        finally:
+            await stream.aclose()
@@ -0,0 +1,82 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for host telemetry."""
+
+import time
+
+from harness.machine import LocalMachine, MockMachine
+from harness.telemetry import HostSampler, Telemetry, parse_sample
+
+SAMPLE_LINES = """sample 1000000000000
+cpu  100 0 50 800 10 5 5 30 0 0
+/proc/pressure/memory:some avg10=12.50 avg60=1.00 avg300=0.00 total=100
+/proc/pressure/io:full avg10=0.00 avg60=0.00 avg300=0.00 total=0
+interrupts 5000
+pswpin 0
+pswpout 0
+oom_kill 0
+cpufreq 3000000
+"""
+
+
+def sample(seconds: float, steal: int, swapped: int, oom_kill: int) -> dict:
+    """Returns a parsed sample, shifted by seconds, with some counters changed."""
+    result = parse_sample(SAMPLE_LINES.splitlines())
+    result["time"] += seconds
+    result["cpu"]["idle"] += int(seconds * 1000)
+    result["cpu"]["steal"] += steal
+    result["pswpout"] += swapped
+    result["oom_kill"] += oom_kill
+    return result
+
+
+def test_parse_sample():
+    """Test parse_sample."""
+    result = parse_sample(SAMPLE_LINES.splitlines())
+    assert result["time"] == 1000.0
+    assert result["cpu"]["steal"] == 30
+    assert result["pressure"] == {"memory_some": 12.5, "io_full": 0.0}
+    assert result["interrupts"] == 5000
+    assert result["cpufreq"] == 3000000
+
+
+def test_flags_quiet_host():
+    """Test a quiet host is not flagged."""
+    telemetry = Telemetry("host", [sample(0, 0, 0, 0), sample(1, 0, 0, 0)])
+    assert telemetry.flags(thresholds={"memory_pressure": 20.0}) == []
+
+
+def test_flags_anomalies():
+    """Test steal, swapping, memory pressure and OOM kills are flagged."""
+    telemetry = Telemetry("host", [sample(0, 0, 0, 0), sample(1, 200, 10, 1)])
+    flags = " ".join(telemetry.flags())
+    for name in ("steal", "swapping", "memory_pressure", "oom_kill"):
+        assert "host: " + name in flags
+    assert "irq" not in flags
+
+
+def test_sampler_mock():
+    """Test a machine without telemetry yields no samples."""
+    sampler = HostSampler(MockMachine())
+    sampler.start()
+    assert sampler.stop().samples == []
+
+
+def test_sampler_local():
+    """Test samples are taken in the background until stopped."""
+    sampler = HostSampler(LocalMachine("local"), interval=0.1)
+    sampler.start()
+    time.sleep(0.5)
+    telemetry = sampler.stop()
+    assert len(telemetry.samples) >= 2
+    assert "interrupts" in telemetry.series()
@@ -11,67 +11,177 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Tunnel handles setting up connections to remote machine's docker daemons via
-SSH port forwarding."""
+direct-streamlocal channels on an existing SSH transport."""
 
-import os
+import threading
 import time
-import tempfile
+
 import docker
-import pexpect
+import docker.constants
+import requests.adapters
+import urllib3.connection
+import urllib3.connectionpool
+from paramiko import Channel, Transport, SSHException
+from paramiko.common import cMSG_CHANNEL_OPEN
+from paramiko.message import Message
+
+from harness.ssh_connection import SSHConnection
+
+
+# REMOTE_DOCKER_SOCKET is the unix socket the remote docker daemon listens on.
+REMOTE_DOCKER_SOCKET = "/var/run/docker.sock"
+
+# STREAMLOCAL_CHANNEL is the OpenSSH channel type for unix socket forwarding.
+STREAMLOCAL_CHANNEL = "direct-streamlocal@openssh.com"
+
+# DOCKER_BASE_URL is the base url the docker client uses for requests. The
+# "ssh" host makes docker-py treat response sockets as paramiko channels.
+DOCKER_BASE_URL = "http+docker://ssh"
+
+
+#pylint: disable-msg=protected-access
+def open_streamlocal_channel(transport: Transport, path: str, timeout: float = 10) -> Channel:
+    """Opens a channel to a unix socket on the remote end of transport.
+
+    paramiko only knows how to open tcpip and x11 forwarding channels, so this
+    mirrors Transport.open_channel with the direct-streamlocal payload.
+
+    :param transport: An active, authenticated paramiko transport.
+    :param path: The remote unix socket path.
+    :param timeout: Seconds to wait for the server to accept the channel.
+    :return: a connected paramiko channel.
+    """
+    if not transport.is_active():
+        raise SSHException("SSH session not active")
+    with transport.lock:
+        window_size = transport._sanitize_window_size(None)
+        max_packet_size = transport._sanitize_packet_size(None)
+        chanid = transport._next_channel()
+        msg = Message()
+        msg.add_byte(cMSG_CHANNEL_OPEN)
+        msg.add_string(STREAMLOCAL_CHANNEL)
+        msg.add_int(chanid)
+        msg.add_int(window_size)
+        msg.add_int(max_packet_size)
+        msg.add_string(path)
+        msg.add_string("")  # Reserved.
+        msg.add_int(0)  # Reserved.
+        chan = Channel(chanid)
+        transport._channels.put(chanid, chan)
+        transport.channel_events[chanid] = event = threading.Event()
+        transport.channels_seen[chanid] = True
+        chan._set_transport(transport)
+        chan._set_window(window_size, max_packet_size)
+    transport._send_user_message(msg)
+    deadline = time.time() + timeout
+    while not event.wait(0.1):
+        if not transport.is_active():
+            _forget_channel(transport, chanid)
+            raise transport.get_exception() or SSHException("Unable to open channel.")
+        if time.time() > deadline:
+            _forget_channel(transport, chanid)
+            raise SSHException("Timeout opening channel.")
+    chan = transport._channels.get(chanid)
+    if chan is None:
+        raise transport.get_exception() or SSHException("Unable to open channel.")
+    return chan
+
+
+def _forget_channel(transport: Transport, chanid: int):
+    """Unregisters a channel that was never confirmed by the server."""
+    with transport.lock:
+        transport._channels.delete(chanid)
+        transport.channel_events.pop(chanid, None)
+
+
+class StreamLocalConnection(urllib3.connection.HTTPConnection):
+    """HTTP connection carried by a direct-streamlocal channel."""
+
+    def __init__(self, ssh_connection: SSHConnection, path: str, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self._ssh_connection = ssh_connection
+        self._path = path
+        self.timeout = timeout
+
+    def connect(self):
+        sock = open_streamlocal_channel(self._ssh_connection.transport(), self._path)
+        sock.settimeout(self.timeout)
+        self.sock = sock
+
+
+class StreamLocalConnectionPool(urllib3.connectionpool.HTTPConnectionPool):
+    """Connection pool of StreamLocalConnections."""
+
+    def __init__(self, ssh_connection: SSHConnection, path: str, timeout=60, maxsize=10):
+        super().__init__("localhost", timeout=timeout, maxsize=maxsize)
+        self._ssh_connection = ssh_connection
+        self._path = path
+        self.timeout = timeout
+
+    def _new_conn(self):
+        return StreamLocalConnection(self._ssh_connection, self._path, self.timeout)
+
+
+class StreamLocalAdapter(requests.adapters.HTTPAdapter):
+    """Requests adapter sending every request over a single SSH transport."""
+
+    def __init__(self, ssh_connection: SSHConnection, path: str, timeout=60, maxsize=10):
+        self._pool = StreamLocalConnectionPool(ssh_connection, path, timeout, maxsize)
+        super().__init__()
 
+    def get_connection(self, url, proxies=None):
+        return self._pool
 
-SSH_TUNNEL_COMMAND = \
-    "ssh " \
-    "-o GlobalKnownHostsFile=/dev/null " \
-    "-o UserKnownHostsFile=/dev/null " \
-    "-o StrictHostKeyChecking=no " \
-    "-nNT -L {filename}:/var/run/docker.sock " \
-    "-i {key_path} " \
-    "{username}@{hostname}"
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        """Alias of get_connection used by newer versions of requests."""
+        return self.get_connection(request.url, proxies)
+
+    def close(self):
+        super().close()
+        self._pool.close()
+
+
+class StreamLocalAPIClient(docker.APIClient):
+    """Docker API client whose requests travel over direct-streamlocal channels."""
+
+    def __init__(self, ssh_connection: SSHConnection, path: str, timeout=60):
+        # A tcp base url mounts no adapter of its own and opens no connection;
+        # requests are routed to the streamlocal adapter through base_url.
+        super().__init__(base_url="tcp://localhost:2375", timeout=timeout,
+                         version=docker.constants.DEFAULT_DOCKER_API_VERSION)
+        self.mount(DOCKER_BASE_URL, StreamLocalAdapter(ssh_connection, path, timeout))
+        self.base_url = DOCKER_BASE_URL
+
+
+class StreamLocalDockerClient(docker.DockerClient):
+    """Docker client backed by a StreamLocalAPIClient."""
+
+    #pylint: disable-msg=super-init-not-called
+    def __init__(self, ssh_connection: SSHConnection, path: str = REMOTE_DOCKER_SOCKET):
+        self.api = StreamLocalAPIClient(ssh_connection, path)
 
 
 class Tunnel:
-    """The tunnel object represents the tunnel via ssh between a local unix
-    domain socket and the remote unix socket that the docker daemon is listening
-    on (/var/run/docker.sock)."""
-
-    def __init__(self, name, hostname: str, username: str, key_path: str, **kwargs):
-        self._filename = tempfile.NamedTemporaryFile(prefix=name).name
-        self._hostname = hostname
-        self._username = username
-        self._key_path = key_path
-        self._kwargs = kwargs
-        self._process = None
+    """The tunnel object represents the forwarding of the remote unix socket
+    that the docker daemon is listening on (/var/run/docker.sock) over the
+    machine's existing SSH connection. No local socket file or additional ssh
+    process is created."""
+
+    def __init__(self, ssh_connection: SSHConnection, path: str = REMOTE_DOCKER_SOCKET):
+        self._ssh_connection = ssh_connection
+        self._path = path
 
     def connect(self):
-        """Connects the SSH tunnel."""
-        cmd = SSH_TUNNEL_COMMAND.format(filename=self._filename, key_path=self._key_path,
-                                        username=self._username, hostname=self._hostname)
-        self._process = pexpect.spawn(cmd, timeout=10)
-
-        if "key_password" in self._kwargs: # if given a password, assume we'll be asked for it
-            self._process.expect(["Enter passphrase for key .*: "])
-            self._process.sendline(self._kwargs["key_password"])
-
-        while True:
-            # Wait for the tunnel to appear.
-            if self._process.exitstatus is not None:
-                raise ConnectionError("Error in setting up ssh tunnel")
-            if os.path.exists(self._filename):
-                return
-            time.sleep(0.1)
+        """Checks that the remote docker socket can be reached."""
+        try:
+            open_streamlocal_channel(self._ssh_connection.transport(), self._path).close()
+        except SSHException as exc:
+            raise ConnectionError("Error in setting up ssh tunnel: %s" % exc)
 
     def path(self):
-        """Return the socket file."""
-        return self._filename
+        """Return the remote socket path."""
+        return self._path
 
     def get_docker_client(self):
-        """Returns a docker client for this Tunne0l."""
-        return docker.DockerClient(base_url="unix:/" + self._filename)
-
-    def __del__(self):
-        """Closes the ssh connection process and deletes the socket file."""
-        if self._process:
-            self._process.close()
-        if os.path.exists(self._filename):
-            os.remove(self._filename)
+        """Returns a docker client for this Tunnel. The caller must close it."""
+        return StreamLocalDockerClient(self._ssh_connection, self._path)
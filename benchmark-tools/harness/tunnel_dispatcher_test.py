@@ -0,0 +1,170 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the direct-streamlocal docker tunnel.
+
+These run against an in-process paramiko server, so that a paramiko upgrade
+that changes the internals open_streamlocal_channel relies on is caught.
+"""
+
+import json
+import socket
+import threading
+import time
+
+import paramiko
+import pytest
+
+import harness.tunnel_dispatcher as td
+
+HOST_KEY = paramiko.RSAKey.generate(1024)
+
+
+class ServerTransport(paramiko.Transport):
+    """Server transport recording the socket path of streamlocal requests."""
+
+    def __init__(self, sock):
+        super().__init__(sock)
+        self.paths = []
+
+    def _parse_channel_open(self, m):
+        start = m.packet.tell()
+        kind = m.get_text()
+        m.get_int()  # Channel id.
+        m.get_int()  # Window size.
+        m.get_int()  # Packet size.
+        if kind == td.STREAMLOCAL_CHANNEL:
+            self.paths.append(m.get_text())
+        m.packet.seek(start)
+        super()._parse_channel_open(m)
+
+
+class Server(paramiko.ServerInterface):
+    """Accepts streamlocal channels, optionally after a delay."""
+
+    def __init__(self, accept=True, delay=0):
+        self.accept = accept
+        self.delay = delay
+
+    def check_auth_none(self, username):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "none"
+
+    def check_channel_request(self, kind, chanid):
+        time.sleep(self.delay)
+        if self.accept and kind == td.STREAMLOCAL_CHANNEL:
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+def serve_http(channel: paramiko.Channel):
+    """Answers each request on the channel with a docker version response."""
+    with channel.makefile("rb") as requests:
+        while True:
+            line = requests.readline()
+            if not line:
+                return
+            while requests.readline() not in (b"\r\n", b""):
+                pass
+            body = json.dumps({"Version": "test", "Path": line.split()[1].decode()})
+            channel.sendall(("HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             "Content-Length: %d\r\n\r\n%s" % (len(body), body)).encode())
+
+
+@pytest.fixture(name="connect")
+def fixture_connect():
+    """Returns a function connecting a client transport to a new server."""
+    transports = []
+
+    def connect(server: Server):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        server_transport = []
+
+        def accept():
+            sock, _ = listener.accept()
+            transport = ServerTransport(sock)
+            transport.add_server_key(HOST_KEY)
+            transport.start_server(server=server)
+            server_transport.append(transport)
+            while transport.is_active():
+                channel = transport.accept(1)
+                if channel is not None:
+                    threading.Thread(target=serve_http, args=(channel,), daemon=True).start()
+
+        threading.Thread(target=accept, daemon=True).start()
+        client = paramiko.Transport(socket.create_connection(listener.getsockname()))
+        client.connect()
+        client.auth_none("test")
+        while not server_transport:
+            time.sleep(0.01)
+        transports.extend([client, server_transport[0]])
+        return client, server_transport[0]
+
+    yield connect
+    for transport in transports:
+        transport.close()
+
+
+class FakeConnection:
+    """Stands in for SSHConnection."""
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def transport(self):
+        """Returns the client transport."""
+        return self._transport
+
+
+def test_open_streamlocal_channel(connect):
+    """Test the channel request carries the socket path."""
+    client, server = connect(Server())
+    channel = td.open_streamlocal_channel(client, "/var/run/docker.sock")
+    assert channel.active
+    assert server.paths == ["/var/run/docker.sock"]
+    channel.close()
+
+
+def test_open_streamlocal_channel_rejected(connect):
+    """Test a rejected channel raises and is not left registered."""
+    client, _ = connect(Server(accept=False))
+    with pytest.raises(paramiko.SSHException):
+        td.open_streamlocal_channel(client, "/var/run/docker.sock")
+    #pylint: disable-msg=protected-access
+    assert not client._channels.values()
+
+
+def test_open_streamlocal_channel_timeout(connect):
+    """Test a timed out channel is not left registered."""
+    client, _ = connect(Server(delay=1))
+    with pytest.raises(paramiko.SSHException):
+        td.open_streamlocal_channel(client, "/var/run/docker.sock", timeout=0.2)
+    #pylint: disable-msg=protected-access
+    assert not client._channels.values()
+    assert not client.channel_events
+
+
+def test_docker_client(connect):
+    """Test docker API requests travel over the transport."""
+    client, server = connect(Server())
+    docker_client = td.Tunnel(FakeConnection(client)).get_docker_client()
+    try:
+        assert docker_client.version()["Version"] == "test"
+        assert docker_client.version()["Path"].endswith("/version")
+        # Both requests share one kept-alive channel.
+        assert server.paths == ["/var/run/docker.sock"]
+    finally:
+        docker_client.close()
@@ -16,18 +16,23 @@
 
 import copy
 import csv
+import datetime
+import functools
 import logging
-import pkgutil
-import pydoc
+import os
 import sys
-import re
 
 import click
 
-from benchmarks import is_benchmark, benchmark_metrics
+from benchmarks import benchmark_metrics
+import harness.machine_producers.vm_pool_producer as vp
 import harness.machine_producers.yaml_producer as yp
-import harness.machine_producers.mock_producer as mp
+from harness.api import find_benchmarks, make_producer, store_iterations
 from harness.benchmark_driver import BenchmarkDriver
+from harness.comparison import (HIGHER_IS_BETTER, LOWER_IS_BETTER, BaselineStore,
+                                compare as compare_results)
+from harness.result_store import STATS, ResultStore
+from harness.telemetry import HostSampler
 
 
 @click.group()
@@ -44,28 +49,6 @@ def perf(verbose: bool = False, debug: bool = False):
         logging.basicConfig(level=logging.INFO)
 
 
-def find_benchmarks(regex: str) -> list:
-    """Finds all available benchmarks.
-
-    :param patterns: A set of patterns that can match.
-    :return: a (short_name, module, function) tuple for each match.
-    """
-    benchmarks = pydoc.locate("benchmarks")
-    pkgs = pkgutil.walk_packages(benchmarks.__path__, benchmarks.__name__ + '.')
-    found = []
-    for _, name, _ in pkgs:
-        mod = pydoc.locate(name)
-        funcs = [getattr(mod, x) for x in dir(mod)
-                 if is_benchmark(getattr(mod, x))]
-        for func in funcs:
-            # Use the short_name with the benchmarks. prefix stripped.
-            short_name = mod.__name__[len("benchmarks."):] + "." + func.__name__
-            # Add to the list if a pattern is provided.
-            if re.compile(regex).match(short_name):
-                found.append((short_name, mod, func))
-    return found
-
-
 @perf.command('list')
 @click.argument('method', nargs=-1)
 def list_all(method):
@@ -96,22 +79,35 @@ def list_all(method):
 @click.argument('method')
 @click.option('--mock/--no-mock', default=False, help="Mock the machines.")
 @click.option('--env', default=None, help="Specify a yaml file with machines.")
+@click.option('--record', default=None, help="Record all machine outputs to this archive.")
+@click.option('--replay', default=None, help="Replay machine outputs from this archive.")
+@click.option('--replay-latency/--no-replay-latency', default=False,
+              help="Take as long as recorded to replay each output, so that metrics timed"
+                   " here (e.g. startup times) are replayed too.")
 @click.option('--runtime', default=['runc'], help="The runtime to use.", multiple=True)
 @click.option('--metric', help="The metric to extract.", multiple=True)
 @click.option('--runs', default=1, help="The number of times to run each benchmark.")
+@click.option('--telemetry', default=0.0, help="Sample host telemetry every this many seconds"
+                                               " and report anomalous host conditions.")
 @click.option('--stat', default='median', help="How to aggregate the data from all runs."
                                                "\nmedian - returns the median of all runs (default)"
                                                "\nall - returns all results comma separated"
                                                "\nmeanstd - returns result as mean,std")
+@click.option('--store', default=None, help="Also add every run to this result store.")
 # pylint: disable-msg=too-many-statements
 def run(ctx,
         method: str,
         runs: int,
+        telemetry: float,
         env: str,
         mock: bool,
+        record: str,
+        replay: str,
+        replay_latency: bool,
         runtime: list,
         metric: list,
         stat: str,
+        store: str,
         **kwargs):
     """Runs arbitrary benchmarks.
 
@@ -128,9 +124,14 @@ def run(ctx,
     All benchmarks are run in parallel where possible, but have exclusive
     ownership over the individual machines.
 
-    Exactly one of the --mock and --env flag must be specified.
+    Exactly one of the --mock, --env and --replay flag must be specified.
+    With --record, every output of the machines is saved to an archive that
+    --replay serves back instead of running anything. Metrics timed here
+    rather than on the machines replay as about 0, unless --replay-latency.
 
     Every benchmark method will be run the times indicated by --runs.
+    With --store, the results of every run are also added to a result store,
+    which the query command aggregates.
     """
     # First, calculate additional arguments.
     #
@@ -198,17 +199,12 @@ def run(ctx,
     fold('method', list(methods.keys()), allow_flatten=True)
 
     # Construct the environment.
-    if mock and env:
-        # You can't provide both.
-        logging.error("both --mock and --env are set: which one is it?")
-        sys.exit(1)
-    elif mock:
-        producer = mp.MockMachineProducer()
-    elif env:
-        producer = yp.YamlMachineProducer(env)
-    else:
-        # You must provide one of mock or env.
-        logging.error("no enviroment provided: use --mock or --env.")
+    try:
+        producer = make_producer(env=env, mock=mock, replay=replay, record=record,
+                                 replay_latency=replay_latency)
+    except ValueError as error:
+        # You must provide exactly one of mock, env and replay.
+        logging.error(error)
         sys.exit(1)
 
     # Spin up the drivers.
@@ -216,6 +212,7 @@ def run(ctx,
     # We ensure that metric is the last entry, because we have special behavior.
     # They actually run the test once and the benchmark is a generator that
     # produces all viable metrics.
+    sampler = functools.partial(HostSampler, interval=telemetry) if telemetry else None
     dimension_keys = list(dimensions.keys())
     if 'metric' in dimension_keys:
         dimension_keys.remove('metric')
@@ -228,9 +225,9 @@ def run(ctx,
             keywords['method'] = methods[keywords['method']]
         # Is this a non-recursive case?
         if not left:
-            driver = BenchmarkDriver(producer, runs=runs, **keywords)
+            driver = BenchmarkDriver(producer, runs=runs, sampler=sampler, **keywords)
             driver.start()
-            drivers.append((finished, driver))
+            drivers.append((finished, driver, keywords))
         else:
             # Recurse on the next dimension.
             current, left = left[0], left[1:]
@@ -253,12 +250,19 @@ def run(ctx,
     # Finish all tests, write results.
     output = csv.writer(sys.stdout)
     output.writerow(dimension_keys + ["result"])
-    for (done, driver) in drivers:
+    results = ResultStore(store) if store else None
+    names = {func: short_name for short_name, func in methods.items()}
+    for (done, driver, keywords) in drivers:
         driver.join()
         for (metric_name, result) in getattr(driver, stat)():
             output.writerow([  # Collapse the method name.
                                 hasattr(x, '__name__') and x.__name__ or x for x in done]
                             + [metric_name] + result)
+        if results:
+            store_iterations(results, names[keywords['method']], driver, keywords)
+    if record:
+        producer.save()
+    producer.close()
 
 
 @perf.command()
@@ -267,14 +271,131 @@ def run(ctx,
 @click.option('--workload', default="true", help="workload to run all found machines")
 def validate(env, cmd, workload):
     """Validates an environment described by yaml file."""
-    producer = yp.YamlMachineProducer(env)
-    for machine in producer.machines:
+    pool = vp.pool_producer(env)
+    # A pool is validated on one guest.
+    machines = pool.get_machines(1) if pool else yp.YamlMachineProducer(env).machines
+    for machine in machines:
         print("Machine %s:" % machine)
         stdout, _ = machine.run(cmd)
         print("  Output of '%s': %s" % (cmd, stdout.lstrip().rstrip()))
         image = machine.pull(workload)
         stdout = machine.container(image).run()
         print("  Container %s: %s" % (workload, stdout.lstrip().rstrip()))
+    if pool:
+        pool.close()
+
+
+# BASELINES is the default baseline store directory.
+BASELINES = "~/.benchmark-tools/baselines"
+
+
+@perf.command()
+@click.argument('name')
+@click.argument('results')
+@click.option('--store', default=BASELINES, help="The baseline store directory.")
+def baseline(name, results, store):
+    """Stores a results csv (from run --stat=all) as the named baseline."""
+    BaselineStore(store).save(name, results)
+
+
+# pylint: disable-msg=too-many-arguments
+@perf.command()
+@click.argument('base')
+@click.argument('results')
+@click.option('--store', default=BASELINES, help="The baseline store directory.")
+@click.option('--alpha', default=0.05, help="The significance level.")
+@click.option('--threshold', default=0.05, help="The smallest relative change to flag.")
+@click.option('--lower-is-better', default=LOWER_IS_BETTER,
+              help="Regex of metrics for which lower values are better.")
+@click.option('--higher-is-better', default=HIGHER_IS_BETTER,
+              help="Regex of metrics for which higher values are better, checked first.")
+def compare(base, results, store, alpha, threshold, lower_is_better, higher_is_better):
+    """Compares results with a baseline and exits non-zero on regressions.
+
+    BASE is a stored baseline name or a results file. Both should be written
+    by run --stat=all, so that every run is a sample. Each point (the same
+    parameters and metric) is compared with a Mann-Whitney U test, and the
+    ratio of medians is given with a bootstrap confidence interval.
+    """
+    baseline_store = BaselineStore(store)
+    comparisons = compare_results(baseline_store.load(base), baseline_store.load(results),
+                                  alpha=alpha, threshold=threshold,
+                                  lower_is_better=lower_is_better,
+                                  higher_is_better=higher_is_better)
+    output = csv.writer(sys.stdout)
+    output.writerow(["point", "baseline", "current", "ratio", "ratio_low", "ratio_high",
+                     "p_value", "effect", "verdict"])
+    for comparison in comparisons:
+        output.writerow(["/".join(comparison["point"])] + [
+            "%.6g" % comparison[key] if key in comparison else ""
+            for key in ["baseline", "current", "ratio", "ratio_low", "ratio_high",
+                        "p_value", "effect"]] + [comparison["verdict"]])
+    regressions = [c for c in comparisons if c["verdict"] == "regression"]
+    for regression in regressions:
+        logging.error("regression in %s: %.3gx (p=%.3g)", "/".join(regression["point"]),
+                      regression["ratio"], regression["p_value"])
+    if regressions:
+        sys.exit(1)
+
+
+def _timestamp(value: str) -> float:
+    """Parses an ISO date or time, or seconds since the epoch."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+@perf.command()
+@click.argument('store')
+@click.argument('filters', nargs=-1)
+@click.option('--group-by', multiple=True,
+              help="Columns (benchmark, platform, host, source, metric) or parameters to"
+                   " group by. Default: benchmark, platform and metric.")
+@click.option('--stat', multiple=True, help="Statistics of each group, from: %s."
+                                            " Default: count and median." % ", ".join(STATS))
+@click.option('--since', default=None, help="Only runs at or after this date or time.")
+@click.option('--until', default=None, help="Only runs before this date or time.")
+def query(store, filters, group_by, stat, since, until):
+    """Aggregates the results in a result store.
+
+    FILTERS are KEY=VALUE pairs on columns (benchmark, platform, host, source,
+    metric) or parameters. A key given more than once matches any of its
+    values. For example:
+
+        perf.py query results.db benchmark=sysbench.cpu --group-by=platform --group-by=threads
+    """
+    conditions = {}
+    for item in filters:
+        if '=' not in item:
+            logging.error("illegal filter: %s", item)
+            sys.exit(1)
+        key, value = item.split("=", 1)
+        conditions.setdefault(key, []).append(value)
+    columns, rows = ResultStore(store).query(
+        group_by=list(group_by) or ["benchmark", "platform", "metric"],
+        stats=list(stat) or ["count", "median"],
+        since=_timestamp(since) if since else None,
+        until=_timestamp(until) if until else None,
+        **conditions)
+    output = csv.writer(sys.stdout)
+    output.writerow(columns)
+    output.writerows(rows)
+
+
+@perf.command('import')
+@click.argument('store')
+@click.argument('results', nargs=-1)
+@click.option('--benchmark', default=None, help="The benchmark. Default: the file name.")
+@click.option('--platform', default="", help="The platform (e.g. runtime) of the results.")
+@click.option('--host', default="", help="The host of the results.")
+def import_results(store, results, benchmark, platform, host):
+    """Adds existing csv results (from run, or experiments/) to a result store."""
+    result_store = ResultStore(store)
+    for path in results:
+        name = benchmark or os.path.splitext(os.path.basename(path))[0]
+        count = result_store.import_csv(path, name, platform=platform, host=host)
+        logging.info("Imported %d runs from %s", count, path)
 
 
 if __name__ == '__main__':
@@ -18,3 +18,19 @@ import re
 def elapsed_time(data: str, **kwargs) -> float:
     """Returns the elapsed time for running an absl build."""
     return float(re.compile(r"Elapsed time: (\d*.?\d*)s").search(data).group(1))
+
+
+def completed_actions(line: str) -> int:
+    """Returns the completed action count of a bazel progress line, or None."""
+    match = re.match(r"\[([\d,]+) / [\d,]+\]", line)
+    if match is None:
+        return None
+    return int(match.group(1).replace(",", ""))
+
+
+def action_rate(data: str, **kwargs) -> float:
+    """Returns the average number of bazel actions completed per second."""
+    samples = data.series["completed_actions"]
+    if len(samples) < 2 or samples[-1][0] == samples[0][0]:
+        return 0.0
+    return (samples[-1][1] - samples[0][1]) / (samples[-1][0] - samples[0][0])
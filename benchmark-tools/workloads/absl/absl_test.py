@@ -13,6 +13,7 @@
 # limitations under the License.
 """abseil build test"""
 
+import benchmarks.helpers as helpers
 import workloads.absl as absl
 
 SAMPLE_BAZEL_OUTPUT = """Extracting Bazel installation...
@@ -52,7 +53,31 @@ INFO: Build completed successfully, 1084 total actions
 INFO: Build completed successfully, 1084 total actions"""
 
 
+#pylint: disable-msg=unused-argument
+def sample(**kwargs):
+    """Returns sample data."""
+    return SAMPLE_BAZEL_OUTPUT
+
+
 def test_elapsed_time():
     """Test elapsed_time."""
     res = absl.elapsed_time(SAMPLE_BAZEL_OUTPUT)
     assert res == 81.861
+
+
+def test_completed_actions():
+    """Test completed_actions."""
+    assert absl.completed_actions("[1,082 / 1,084] Compiling absl/x.cc") == 1082
+    assert absl.completed_actions("INFO: Found 241 targets...") is None
+
+
+def test_action_rate():
+    """Test action_rate over a timestamped stream."""
+    lines = [(index * 2.0, line) for index, line in
+             enumerate(SAMPLE_BAZEL_OUTPUT.splitlines(keepends=True))]
+    output = helpers.parse_stream(lines, progress={"completed_actions": absl.completed_actions},
+                                  keep=r"Elapsed time")
+    assert absl.elapsed_time(output) == 81.861
+    first, last = output.series["completed_actions"][0], output.series["completed_actions"][-1]
+    assert first[1] == 0 and last[1] == 1082
+    assert absl.action_rate(output) == 1082 / (last[0] - first[0])
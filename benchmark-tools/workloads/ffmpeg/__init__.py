@@ -10,9 +10,28 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+"""FFMPEG workload parsers."""
+
+import re
 
 
 #pylint: disable-msg=unused-argument
 def run_time(value, **kwargs):
     """Returns the startup and runtime of the ffmpeg workload in seconds."""
-    return value
+    return value.elapsed
+
+
+def fps(line: str) -> float:
+    """Returns the frames per second of an ffmpeg progress line, or None."""
+    match = re.search(r"fps=\s*(\d+\.?\d*)", line)
+    if match is None:
+        return None
+    return float(match.group(1))
+
+
+def mean_fps(value, **kwargs):
+    """Returns the mean frames per second reported while transcoding."""
+    samples = [sample for _, sample in value.series["fps"]]
+    if not samples:
+        return 0.0
+    return sum(samples) / len(samples)
@@ -0,0 +1,43 @@
+# Copyright 2019 The gVisor Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Parser test."""
+
+import benchmarks.helpers as helpers
+import workloads.ffmpeg as ffmpeg
+
+SAMPLE_DATA = ("frame=   53 fps=0.0 q=28.0 size=       0kB time=00:00:00.34 bitrate=   1.1kbits/s speed=0.675x    \r"
+               "frame=  115 fps=113 q=28.0 size=     256kB time=00:00:02.41 bitrate= 868.2kbits/s speed=2.37x    \r"
+               "frame=  176 fps=116 q=28.0 size=     512kB time=00:00:04.44 bitrate= 943.5kbits/s speed=2.92x    \r"
+               "video:1024kB audio:0kB subtitle:0kB other streams:0kB global headers:0kB muxing overhead: 0.1%\n")
+
+
+#pylint: disable-msg=unused-argument
+def sample(**kwargs):
+    """Returns sample data."""
+    return SAMPLE_DATA
+
+
+def test_fps():
+    """Test fps."""
+    assert ffmpeg.fps("frame=  115 fps=113 q=28.0 size=     256kB") == 113.0
+    assert ffmpeg.fps("video:1024kB audio:0kB") is None
+
+
+def test_mean_fps():
+    """Test mean_fps samples every progress update."""
+    lines = enumerate(SAMPLE_DATA.splitlines(keepends=True))
+    output = helpers.parse_stream(lines, progress={"fps": ffmpeg.fps}, keep=r"^video:")
+    assert output.series["fps"] == [(0, 0.0), (1, 113.0), (2, 116.0)]
+    assert output.startswith("video:1024kB")
+    assert ffmpeg.mean_fps(output) == (113.0 + 116.0) / 3
@@ -1,26 +1,143 @@
 import os
+import shlex
+import socket
+import subprocess
+import sys
 
 from enum import Enum
 
+from experiments import BENCHMARK_TOOLS_DIR
+
+# The result store is shared with benchmark-tools
+sys.path.append(BENCHMARK_TOOLS_DIR)
+from harness.result_store import ResultStore
+
+# Machines for the Docker platform
+LOCALHOST_YAML = os.path.join(BENCHMARK_TOOLS_DIR, 'examples', 'localhost.yaml')
+
+
+def new_session():
+    """Returns a benchmark-tools session on the local machine."""
+    # Imported here so that native runs do not need the harness dependencies
+    from harness.api import Session
+    return Session(env=LOCALHOST_YAML)
+
 
 class Platform(Enum):
     NATIVE = 1
     DOCKER = 2
+    # The Docker images, run in Firecracker microVMs by benchmark-tools
+    FIRECRACKER = 3
+    # The native command lines, run in a QEMU/KVM guest
+    KVM = 4
+
+
+# Platforms running the native command lines, on the host or in a guest
+NATIVE_PLATFORMS = (Platform.NATIVE, Platform.KVM)
+
+# Platforms whose points run through benchmark-tools, with the same images
+# and results
+HARNESS_PLATFORMS = (Platform.DOCKER, Platform.FIRECRACKER)
+
+
+class Footprint(object):
+    """Resources a benchmark point uses on its host while it runs.
+
+    The Dispatcher runs points concurrently only where their footprints do
+    not overlap, so that each point measures the same as when run alone.
+    """
+
+    def __init__(self, cpus=1, numa_node=False, disk=False, exclusive=False):
+        # Number of CPUs the point is pinned to
+        self.cpus = max(1, int(cpus))
+        # Whether the point needs whole NUMA nodes (e.g. for memory bandwidth)
+        self.numa_node = numa_node
+        # Whether the point needs the host's disk to itself
+        self.disk = disk
+        # Whether the point needs the whole host
+        self.exclusive = exclusive
+
+    def __repr__(self):
+        return (f'Footprint(cpus={self.cpus}, numa_node={self.numa_node}, '
+                f'disk={self.disk}, exclusive={self.exclusive})')
 
 
 class Benchmark(object):
     EXPERIMENTS_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
-    RESULTS_CSV_DIR = os.path.join(EXPERIMENTS_ROOT_DIR, 'results')
-    NATIVE_RESULTS_DIR = os.path.join(RESULTS_CSV_DIR, 'native')
-    DOCKER_RESULTS_DIR = os.path.join(RESULTS_CSV_DIR, 'docker')
+    RESULTS_DIR = os.path.join(EXPERIMENTS_ROOT_DIR, 'results')
+    # Result store shared by all benchmarks and platforms (see `perf.py query`)
+    RESULTS_DB = os.path.join(RESULTS_DIR, 'results.db')
 
     def __init__(self, platform=Platform.NATIVE):
         self.platform = platform
+        # Set by subclasses: benchmark name and metric name in the result store
+        self.result_name = None
+        self.metric_name = None
+        # benchmark-tools session running Docker benchmarks (set by the Dispatcher)
+        self.session = None
+        # Host the point runs on, and CPUs and NUMA nodes it is pinned to (set
+        # by the Dispatcher, no CPUs means unpinned)
+        self.host = socket.gethostname()
+        self.cpus = []
+        self.mems = []
+        # CPUs of the container runtime's helper processes (Docker and Firecracker only)
+        self.helper_cpus = ''
+        # Guest running the native command lines (KVM only, set by the Dispatcher)
+        self.guest = None
+
+    def footprint(self):
+        """Returns the resources the point uses. By default it needs the whole host."""
+        return Footprint(exclusive=True)
+
+    def pin(self, cmd):
+        """Returns the native command pinned to the point's CPUs and NUMA nodes."""
+        if not self.cpus:
+            return cmd
+        cpus = ','.join(str(cpu) for cpu in self.cpus)
+        if self.mems:
+            mems = ','.join(str(node) for node in self.mems)
+            return f'numactl --physcpubind={cpus} --membind={mems} {cmd}'
+        return f'taskset -c {cpus} {cmd}'
+
+    def execute(self, cmd, stderr=None, pin=True):
+        """Runs a native command line, pinned unless pin is False, on the host
+        or, for KVM, in the guest (whose vCPUs are pinned instead).
+
+        Returns the CompletedProcess, with stdout (and stderr if PIPE) as text.
+        """
+        if self.guest is not None:
+            return self.guest.run(cmd, stderr=stderr)
+        return subprocess.run(shlex.split(self.pin(cmd) if pin else cmd),
+                              stdout=subprocess.PIPE,
+                              stderr=stderr,
+                              universal_newlines=True)
+
+    def exists(self, path):
+        """Returns whether a file the native command lines need exists, on the host or in the guest."""
+        if self.guest is not None:
+            return self.guest.exists(path)
+        return os.path.exists(path)
+
+    def upload(self, path):
+        """Copies a local file to the guest, if any."""
+        if self.guest is not None:
+            self.guest.put(path)
+
+    def pinning(self):
+        """Returns the pinning of the point, to store with its results."""
+        pinning = {}
+        if self.cpus:
+            pinning['cpus'] = ','.join(str(cpu) for cpu in self.cpus)
+        if self.mems:
+            pinning['mems'] = ','.join(str(node) for node in self.mems)
+        if self.helper_cpus and self.platform in HARNESS_PLATFORMS:
+            pinning['helper_cpus'] = self.helper_cpus
+        return pinning
 
     def run(self):
-        if self.platform == Platform.NATIVE:
+        if self.platform in NATIVE_PLATFORMS:
             return self.run_native()
-        elif self.platform == Platform.DOCKER:
+        elif self.platform in HARNESS_PLATFORMS:
             return self.run_docker()
         else:
             pass
@@ -32,9 +149,9 @@ class Benchmark(object):
         pass
 
     def parse_output(self, output):
-        if self.platform == Platform.NATIVE:
+        if self.platform in NATIVE_PLATFORMS:
             return self._parse_native_output(output)
-        elif self.platform == Platform.DOCKER:
+        elif self.platform in HARNESS_PLATFORMS:
             return self._parse_docker_output(output)
 
     def _parse_native_output(self, output):
@@ -42,3 +159,42 @@ class Benchmark(object):
 
     def _parse_docker_output(self, output):
         pass
+
+    def run_perf(self, method, params=None):
+        """Runs a benchmark-tools benchmark in process with the given parameters.
+
+        Parameters are passed to the container when it is run, so every run
+        uses the same image and nothing in the source tree is rewritten.
+        Returns the results, metric names to one value per iteration.
+        """
+        print(f'[{self.result_name}] {method} {params or {}}')
+        if self.session is None:
+            # Not run by the Dispatcher: use a session for this run only
+            self.session = new_session()
+        params = dict(params or {})
+        # Pinning options of benchmark-tools (see harness/pinning.py)
+        if self.cpus:
+            params['cpuset'] = ','.join(str(cpu) for cpu in self.cpus)
+        if self.mems:
+            params['mems'] = ','.join(str(node) for node in self.mems)
+        if self.helper_cpus:
+            params['helper_cpuset'] = self.helper_cpus
+        if self.platform == Platform.FIRECRACKER:
+            params['runtime'] = 'firecracker'
+        return self.session.run(method, **params)
+
+    def parameters(self):
+        return {}
+
+    def write_results(self, data, store=None):
+        """Adds the parameters, pinning and performance metric value to the result store."""
+        if store is None:
+            store = ResultStore(self.RESULTS_DB)
+        parameters = self.parameters()
+        parameters.update(self.pinning())
+        store.add(self.result_name,
+                  parameters,
+                  {self.metric_name: data},
+                  platform=self.platform.name.lower(),
+                  host=self.host,
+                  source='experiments')
@@ -1,22 +1,149 @@
 import configparser
+import itertools
+import re
 
-from typing import List
+from typing import Dict, Iterator, List
 
 from util import MultiDict
 
 
+class Sweep(object):
+    """Parameter points of one INI section.
+
+    Values can sweep over several points:
+        num_threads = [1, 2, 4, 8]     list
+        count = range(1000, 5000, 1000)  range (stop is excluded, step defaults to 1)
+    Swept keys are combined as a cartesian product, in the order they appear,
+    so the last swept key varies fastest. Keys named together in the `zip`
+    key vary together instead, and must have the same number of values:
+        zip = nrfiles, numjobs
+    Several zipped groups are separated by semicolons.
+
+    Points are generated lazily, so large sweeps are never materialised.
+    """
+    ZIP = 'zip'
+    REGEX_LIST = re.compile(r'^\[(.*)\]$', re.S)
+    REGEX_RANGE = re.compile(r'^range\(\s*(-?\d+)\s*,\s*(-?\d+)\s*(?:,\s*(-?\d+)\s*)?\)$')
+
+    def __init__(self, section, items):
+        self.section = section
+        self.fixed = {BenchmarkParser.BENCHMARK: section}
+        swept = {}
+        groups = []
+        for key, val in items:
+            if key == self.ZIP:
+                groups = [[k.strip() for k in group.split(',') if k.strip()]
+                          for group in val.split(';') if group.strip()]
+                continue
+            values = self._parse_values(val)
+            if values is None:
+                self.fixed[key] = val
+            else:
+                swept[key] = values
+
+        # Each axis is (keys, values): the values of one key, or the list of
+        # value sequences of zipped keys
+        self.axes = []
+        zipped = {}
+        for group in groups:
+            for key in group:
+                if key not in swept:
+                    raise ValueError(f'[{section}] zipped key {key} is not a list or range')
+            lengths = set(len(swept[key]) for key in group)
+            if len(lengths) > 1:
+                raise ValueError(f'[{section}] zipped keys {", ".join(group)} have different lengths')
+            for key in group:
+                zipped[key] = group
+        for key, values in swept.items():
+            if key not in zipped:
+                self.axes.append(((key,), values))
+            elif zipped[key][0] == key:
+                group = zipped[key]
+                self.axes.append((tuple(group), [swept[k] for k in group]))
+
+    def _parse_values(self, val):
+        """Returns the sequence of values of a swept value, or None if it is fixed."""
+        val = val.strip()
+        match = self.REGEX_RANGE.match(val)
+        if match:
+            start, stop, step = match.groups()
+            return range(int(start), int(stop), int(step or 1))
+        match = self.REGEX_LIST.match(val)
+        if match:
+            return [item.strip() for item in match.group(1).split(',') if item.strip()]
+        return None
+
+    def __len__(self):
+        count = 1
+        for keys, values in self.axes:
+            count *= len(values if len(keys) == 1 else values[0])
+        return count
+
+    def __iter__(self) -> Iterator[Dict]:
+        for combination in self._product(self.axes):
+            point = dict(self.fixed)
+            for keys, values in combination:
+                for key, value in zip(keys, values):
+                    point[key] = str(value)
+            yield point
+
+    def _product(self, axes):
+        """Yields every combination of axis values, without keeping any axis or point."""
+        if not axes:
+            yield ()
+            return
+        keys, values = axes[0]
+        for head in (zip(values) if len(keys) == 1 else zip(*values)):
+            for rest in self._product(axes[1:]):
+                yield ((keys, head),) + rest
+
+    def describe(self):
+        """Returns a one line summary of the sweep."""
+        name = self.section[:self.section.rindex(MultiDict.TOKEN)]
+        axes = []
+        for keys, values in self.axes:
+            if len(keys) == 1:
+                axes.append(f'{keys[0]}={self._format(values)}')
+            else:
+                axes.append('(' + ', '.join(f'{key}={self._format(vals)}'
+                                            for key, vals in zip(keys, values)) + ')')
+        return f'{name}: {len(self)} point(s)' + (': ' + ' x '.join(axes) if axes else '')
+
+    @staticmethod
+    def _format(values):
+        if isinstance(values, range):
+            return f'range({values.start}, {values.stop}, {values.step})'
+        return '[' + ', '.join(str(value) for value in values) + ']'
+
+
+class SweepPlan(object):
+    """All points of an INI file, in order. Points are generated lazily."""
+
+    def __init__(self, sweeps: List[Sweep]):
+        self.sweeps = sweeps
+
+    def __len__(self):
+        return sum(len(sweep) for sweep in self.sweeps)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return itertools.chain.from_iterable(self.sweeps)
+
+    def describe(self):
+        """Returns a printable summary of the plan."""
+        lines = [sweep.describe() for sweep in self.sweeps]
+        lines.append(f'Total: {len(self)} point(s)')
+        return '\n'.join(lines)
+
+
 class BenchmarkParser(object):
     BENCHMARK = 'BENCHMARK'
 
     def __init__(self):
         self.config = configparser.ConfigParser(defaults=None, dict_type=MultiDict, strict=False)
 
-    def parse_ini_file(self, filepath) -> List:
+    def parse_ini_file(self, filepath) -> SweepPlan:
         self.config.read(filepath)
-        bench_configs = []
+        sweeps = []
         for section in self.config.sections():
-            bench_config = {BenchmarkParser.BENCHMARK: section}
-            for key, val in self.config.items(section):
-                bench_config[key] = val
-            bench_configs.append(bench_config)
-        return bench_configs
+            sweeps.append(Sweep(section, self.config.items(section)))
+        return SweepPlan(sweeps)
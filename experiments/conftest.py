@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The experiments import each other by module name, and the experiments
+# package for its directories
+EXPERIMENTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, EXPERIMENTS_DIR)
+sys.path.insert(0, os.path.dirname(EXPERIMENTS_DIR))
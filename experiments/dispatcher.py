@@ -1,3 +1,5 @@
+import socket
+
 from benchmark_parser import BenchmarkParser
 from util import MultiDict
 from sysbench_cpu import SysbenchCPU
@@ -7,15 +9,81 @@ from syscall import Syscall
 from ml_tensorflow import MLTensorflow
 from media_ffmpeg import MediaFFMPEG
 
-from benchmark import Platform
+from benchmark import HARNESS_PLATFORMS, LOCALHOST_YAML, Benchmark, Platform
+from kvm import Guest
+from scheduler import Host, Scheduler, local_topology, read_topology, restrict_topology
+from harness.cpus import busy_cpus, parse_cpus
+from harness.result_store import ResultStore
+
+
+def usable_topology(nodes, cpus='', helper_cpus=''):
+    """Returns the nodes with only the CPUs points may use: the given CPUs (all
+    by default) without those of the runtime helpers."""
+    usable = set(parse_cpus(cpus)) if cpus else set(cpu for node_cpus in nodes.values() for cpu in node_cpus)
+    nodes = restrict_topology(nodes, usable - set(parse_cpus(helper_cpus)))
+    if not nodes:
+        raise ValueError(f'No CPUs to run points on: cpus={cpus or "all"}, helper_cpus={helper_cpus}')
+    return nodes
+
+
+def docker_hosts(hosts_yaml, cpus='', helper_cpus=''):
+    """Returns a Host, with its own session, for each distinct machine of a
+    benchmark-tools machines file."""
+    # Imported here so that native runs do not need the harness dependencies
+    from harness.api import Session
+    from harness.machine_producers.shared_producer import SharedMachineProducer
+    from harness.machine_producers.yaml_producer import build_machines
+
+    hosts = []
+    names = set()
+    for machine in build_machines(hosts_yaml):
+        # Several entries can name the same machine (e.g. client and server)
+        stdout, _ = machine.run('hostname')
+        name = stdout.strip() or str(machine)
+        if name in names:
+            continue
+        names.add(name)
+        stdout, _ = machine.run('lscpu -p=CPU,NODE')
+        nodes = read_topology(stdout)
+        if not nodes:
+            stdout, _ = machine.run('nproc')
+            nodes = {0: list(range(int(stdout.strip() or 1)))}
+        hosts.append(Host(name, usable_topology(nodes, cpus, helper_cpus), machine,
+                          Session(producer=SharedMachineProducer([machine])),
+                          pinned=bool(cpus or helper_cpus)))
+    return hosts
 
 
 class Dispatcher(object):
     MSG_DISPATCH_LOOKUP_NOT_FOUND = 'Key not found.'
 
-    def __init__(self, platform: str):
+    def __init__(self, platform: str, results_db=Benchmark.RESULTS_DB, jobs=1,
+                 hosts_yaml=LOCALHOST_YAML, cpus='', helper_cpus='', check_idle=False,
+                 guest_config=None):
         # Platform Enum can convert given string (platform) to corresponding Enum
         self.platform = Platform[platform.upper()]
+        # All results go to one store, queried with `perf.py query`
+        self.store = ResultStore(results_db)
+        # Points only use the given CPUs (all by default), and the container
+        # runtime's helpers run on helper_cpus (Docker only)
+        self.helper_cpus = helper_cpus
+        # Whether to check that a point's CPUs are idle before running it
+        self.check_idle = check_idle
+        # How KVM points boot their guest (a kvm.GuestConfig)
+        self.guest_config = guest_config
+        if self.platform == Platform.KVM and guest_config is None:
+            raise ValueError('The kvm platform needs a guest image')
+        # Native and KVM points run on this machine; Docker and Firecracker
+        # points on the machines of hosts_yaml, each with its own
+        # benchmark-tools session
+        if self.platform in HARNESS_PLATFORMS:
+            self.hosts = docker_hosts(hosts_yaml, cpus, helper_cpus)
+        else:
+            self.hosts = [Host(socket.gethostname(), usable_topology(local_topology(), cpus),
+                               pinned=bool(cpus))]
+        # Up to `jobs` points run at once, where their footprints do not overlap
+        self.scheduler = Scheduler(self.hosts, jobs)
+        # Each entry builds the benchmark runner of a point
         self.dispatch_lookup = {SysbenchCPU.BENCH_NAME: self.dispatch_sysbench_cpu,
                                 SysbenchMemory.BENCH_NAME: self.dispatch_sysbench_memory,
                                 'fio_randread': self.dispatch_fio,
@@ -25,17 +93,45 @@ class Dispatcher(object):
                                 MediaFFMPEG.BENCH_NAME: self.dispatch_media_ffmpeg}
 
     def dispatch_benchmarks(self, bench_configs):
+        """Runs every point, returning the number of points that failed."""
+        return self.scheduler.run(self._points(bench_configs))
+
+    def _points(self, bench_configs):
+        """Yields the benchmark runner of each point, with the job running it."""
         for bench_config in bench_configs:
             benchmark_name = self._strip_multidict_token(bench_config[BenchmarkParser.BENCHMARK])
             # Get the benchmark runner for given benchmark
             bench_runner = self.dispatch_lookup.get(benchmark_name, self.MSG_DISPATCH_LOOKUP_NOT_FOUND)
-            # Run the benchmark
             if callable(bench_runner):
-                bench_runner(bench_config)
+                yield bench_runner(bench_config), self.run_benchmark
             else:
                 print(f'[Error] Unrecognized benchmark name: {benchmark_name}')
                 print('Skipping this benchmark...')
 
+    def run_benchmark(self, bench, slot):
+        """Runs a point in its slot and adds its result to the store."""
+        bench.host = slot.host.name
+        bench.cpus = slot.cpus
+        bench.mems = slot.mems
+        bench.helper_cpus = self.helper_cpus
+        bench.session = slot.host.session
+        if self.check_idle and slot.cpus:
+            busy = busy_cpus(slot.host.machine, slot.cpus + parse_cpus(self.helper_cpus))
+            if busy:
+                raise RuntimeError(f'CPUs are not idle on {slot.host.name}: ' +
+                                   ', '.join(f'{cpu} ({fraction:.0%} busy)' for cpu, fraction in sorted(busy.items())))
+        if self.platform == Platform.KVM:
+            # Each point boots its own guest, with a vCPU per CPU of its slot
+            # (or per CPU of the host if unpinned)
+            with Guest(self.guest_config, slot.cpus, slot.mems,
+                       vcpus=slot.host.num_cpus()) as guest:
+                bench.guest = guest
+                output = bench.run()
+        else:
+            output = bench.run()
+        data = bench.parse_output(output)
+        bench.write_results(data, self.store)
+
     def dispatch_sysbench_cpu(self, bench_config):
         # Get the parameters
         num_threads = bench_config[SysbenchCPU.PARAM_NUM_THREADS]
@@ -43,9 +139,7 @@ class Dispatcher(object):
         cpu_max_prime = bench_config[SysbenchCPU.PARAM_CPU_MAX_PRIME]
 
         sysbench_cpu = SysbenchCPU(num_threads, max_time, cpu_max_prime, self.platform)
-        output = sysbench_cpu.run()
-        data = sysbench_cpu.parse_output(output)
-        sysbench_cpu.write_to_csv(data)
+        return sysbench_cpu
 
     def dispatch_sysbench_memory(self, bench_config):
         # Get the parameters
@@ -58,9 +152,7 @@ class Dispatcher(object):
         memory_access_mode = bench_config[SysbenchMemory.PARAM_MEMORY_ACCESS_MODE]
 
         sysbench_memory = SysbenchMemory(num_threads, memory_block_size, memory_total_size, memory_scope, memory_hugetlb, memory_oper, memory_access_mode, self.platform)
-        output = sysbench_memory.run()
-        data = sysbench_memory.parse_output(output)
-        sysbench_memory.write_to_csv(data)
+        return sysbench_memory
 
     def dispatch_fio(self, bench_config):
         # Get the parameters
@@ -75,6 +167,7 @@ class Dispatcher(object):
         numjobs = bench_config[Fio.PARAM_NUMJOBS]
         time_based = bench_config[Fio.PARAM_TIME_BASED]
         runtime = bench_config[Fio.PARAM_RUNTIME]
+        backend = bench_config.get(Fio.PARAM_BACKEND, Fio.default_backend(self.platform))
 
         benchmark_name = self._strip_multidict_token(bench_config[BenchmarkParser.BENCHMARK])
         if benchmark_name == 'fio_randread':
@@ -83,37 +176,30 @@ class Dispatcher(object):
             sub_bench = FioSubBench.RANDWRITE
 
         # Instantiate the corresponding benchmark runner
-        fio = Fio(ramp_time, ioengine, bs, rw, nrfiles, filesize, thread, numjobs, time_based, runtime, sub_bench, self.platform)
-        output = fio.run()
-        data = fio.parse_output(output)
-        fio.write_to_csv(data)
+        fio = Fio(ramp_time, ioengine, bs, rw, nrfiles, filesize, thread, numjobs, time_based, runtime, sub_bench, self.platform,
+                  backend=backend)
+        return fio
 
     def dispatch_syscall_syscall(self, bench_config):
         # Get the parameters
         count = bench_config[Syscall.PARAM_COUNT]
 
         syscall = Syscall(count, self.platform)
-        output = syscall.run()
-        data = syscall.parse_output(output)
-        syscall.write_to_csv(data)
+        return syscall
 
     def dispatch_ml_tensorflow(self, bench_config):
         # Get the parameters
         network = bench_config[MLTensorflow.PARAM_NETWORK]
 
         ml_tensorflow = MLTensorflow(network, self.platform)
-        output = ml_tensorflow.run()
-        data = ml_tensorflow.parse_output(output)
-        ml_tensorflow.write_to_csv(data)
+        return ml_tensorflow
 
     def dispatch_media_ffmpeg(self, bench_config):
         # Get the parameters
         input_file = bench_config[MediaFFMPEG.PARAM_INPUT_FILE]
 
         media_ffmpeg = MediaFFMPEG(input_file, self.platform)
-        output = media_ffmpeg.run()
-        data = media_ffmpeg.parse_output(output)
-        media_ffmpeg.write_to_csv(data)
+        return media_ffmpeg
 
     def _strip_multidict_token(self, name):
         """Strips away trailing token for multidict unique id."""
@@ -1,14 +1,14 @@
-import csv
 import os
 import re
-import shlex
-import subprocess
 import json
+import shlex
+import uuid
 
 from enum import Enum
 
-from experiments import WORKLOADS_DIR, BENCHMARK_TOOLS_DIR
-from benchmark import Benchmark, Platform
+from benchmark import Benchmark, Footprint, Platform
+# On the path once benchmark is imported
+from workloads.fio import read_bandwidth, write_bandwidth
 
 
 class FioSubBench(Enum):
@@ -23,8 +23,10 @@ class Fio(Benchmark):
     # Performance metric for native output
     BW = 'bw'
 
-    # Performance metric for Docker output
-    DOCKER_METRIC = 'bandwidth'
+    # Performance metrics for Docker output, by sub benchmark: the names the
+    # benchmark-tools metrics report
+    DOCKER_METRICS = {FioSubBench.RANDREAD: read_bandwidth.__name__,
+                      FioSubBench.RANDWRITE: write_bandwidth.__name__}
 
     # Experiment parameters
     PARAM_RAMP_TIME = 'ramp_time'
@@ -38,12 +40,16 @@ class Fio(Benchmark):
     PARAM_NUMJOBS = 'numjobs'
     PARAM_TIME_BASED = 'time_based'
     PARAM_RUNTIME = 'runtime'
+    PARAM_BACKEND = 'backend'
 
-    ORIGINAL_DOCKERFILE_DIR = os.path.join(WORKLOADS_DIR, 'fio')
-    # Default Dockerfile provided by benchmark-tools (backed up to .Dockerfile)
-    DEFAULT_DOCKERFILE_NAME = os.path.join(ORIGINAL_DOCKERFILE_DIR, '.Dockerfile')
-    # Dockerfile we'll use with the parameters in INI file
-    DOCKERFILE_NAME = os.path.join(ORIGINAL_DOCKERFILE_DIR, 'Dockerfile')
+    # Storage backends of the files, as in benchmark-tools (harness/storage.py):
+    # a directory of the host's filesystem, a tmpfs, an overlayfs, an ext4
+    # image loop mounted, and a preallocated raw file used as the only file.
+    # fio does all I/O to the one raw file, so raw needs nrfiles=1 and numjobs=1
+    BACKENDS = ('bind', 'tmpfs', 'overlay', 'loop', 'raw')
+
+    # Space of loop images beyond the files, for ext4
+    LOOP_HEADROOM = 64 * 1024 * 1024
 
     def __init__(self,
                  ramp_time,
@@ -57,8 +63,19 @@ class Fio(Benchmark):
                  time_based,
                  runtime,
                  sub_bench: FioSubBench,
-                 platform=Platform.NATIVE):
+                 platform=Platform.NATIVE,
+                 backend=None):
         super(Fio, self).__init__(platform)
+        if backend is None:
+            backend = self.default_backend(platform)
+        if backend not in self.BACKENDS:
+            raise ValueError(f'unknown fio backend {backend}: use one of {", ".join(self.BACKENDS)}')
+        if backend == 'raw' and (int(nrfiles) != 1 or int(numjobs) != 1):
+            raise ValueError(f'fio backend raw is a single file: it needs nrfiles=1 and numjobs=1, '
+                             f'not {nrfiles} and {numjobs}')
+        if platform == Platform.FIRECRACKER and backend in ('bind', 'loop'):
+            raise ValueError(f'fio backend {backend} needs a directory shared with the host: '
+                             f'use tmpfs, overlay or raw on firecracker')
         self.ramp_time = ramp_time
         self.ioengine = ioengine
         self.bs = bs
@@ -69,14 +86,61 @@ class Fio(Benchmark):
         self.numjobs = numjobs
         self.time_based = (time_based == 'True')
         self.runtime = runtime
+        self.backend = backend
 
         self.sub_bench = sub_bench
 
-        self.csv_headers = ['ramp_time', 'ioengine', 'bs', 'rw', 'nrfiles', 'filesize', 'thread', 'numjobs', 'time_based', 'runtime', 'bw']
+        self.metric_name = 'bw'
         if self.sub_bench == FioSubBench.RANDREAD:
-            self.csv_filename = 'fio_randread.csv'
+            self.result_name = 'fio_randread'
         elif self.sub_bench == FioSubBench.RANDWRITE:
-            self.csv_filename = 'fio_randwrite.csv'
+            self.result_name = 'fio_randwrite'
+
+    @staticmethod
+    def default_backend(platform):
+        """Returns the backend of points not given one: bind, or overlay on
+        Firecracker, whose microVMs share no directories with the host."""
+        return 'overlay' if platform == Platform.FIRECRACKER else 'bind'
+
+    def _shell(self, script, check=True):
+        """Runs a shell script of the storage setup, on the host or in the guest."""
+        process = self.execute(f'sh -c {shlex.quote(script)}', pin=False)
+        if check and process.returncode != 0:
+            raise RuntimeError(f'[{self.result_name}] storage setup failed: {script}')
+
+    def provision_storage(self):
+        """Provisions the point's storage backend in a new directory of the
+        working directory, and returns the directory and the fio option
+        locating the files in it."""
+        storage = f'fio-storage-{uuid.uuid4().hex[:12]}'
+        mnt = f'{storage}/mnt'
+        size = int(self.filesize) * int(self.nrfiles) * int(self.numjobs)
+        writable = f'&& sudo chmod 777 {mnt}'
+        scripts = {
+            'bind': f'mkdir -p {mnt}',
+            'tmpfs': f'mkdir -p {mnt} && sudo mount -t tmpfs tmpfs {mnt} {writable}',
+            'overlay': (f'mkdir -p {storage}/lower {storage}/upper {storage}/work {mnt} && '
+                        f'sudo mount -t overlay overlay -o lowerdir={storage}/lower,'
+                        f'upperdir={storage}/upper,workdir={storage}/work {mnt} {writable}'),
+            'loop': (f'mkdir -p {mnt} && truncate -s {size + self.LOOP_HEADROOM} {storage}/disk.img && '
+                     f'mkfs.ext4 -q -F {storage}/disk.img && '
+                     f'sudo mount -o loop {storage}/disk.img {mnt} {writable}'),
+            'raw': (f'mkdir -p {storage} && (fallocate -l {self.filesize} {storage}/file.raw || '
+                    f'truncate -s {self.filesize} {storage}/file.raw)'),
+        }
+        try:
+            self._shell(scripts[self.backend])
+        except Exception:
+            self.remove_storage(storage)
+            raise
+        if self.backend == 'raw':
+            return storage, f'--filename={storage}/file.raw'
+        return storage, f'--directory={mnt}'
+
+    def remove_storage(self, storage):
+        """Unmounts and removes the storage backend's directory."""
+        self._shell(f'sudo umount {storage}/mnt 2>/dev/null; '
+                    f'rm -rf {storage} 2>/dev/null || sudo rm -rf {storage}', check=False)
 
     def run_native(self):
         thread_option = '' if self.thread is False else '--thread'
@@ -94,74 +158,39 @@ class Fio(Benchmark):
                f'--group_reporting '
                f'{time_based_option} '
                f'--runtime={self.runtime}')
+        storage, location = self.provision_storage()
+        cmd = f'{cmd} {location}'
         if self.sub_bench == FioSubBench.RANDREAD:
             print(f'[fio_randread] {cmd}')
         elif self.sub_bench == FioSubBench.RANDWRITE:
             print(f'[fio_randwrite] {cmd}')
-        process = subprocess.run(shlex.split(cmd),
-                             stdout=subprocess.PIPE,
-                             universal_newlines=True)
+        try:
+            process = self.execute(cmd)
+        finally:
+            self.remove_storage(storage)
         output_str = process.stdout
         return output_str
 
     def run_docker(self):
-        # Copy the default Dockerfile into a list of strings
-        with open(self.DEFAULT_DOCKERFILE_NAME, 'r') as f:
-            lines = f.readlines()
-
-        # Find the lines with ENV declarations
-        env_linenos = []
-        for lineno, line in enumerate(lines):
-            if 'ENV' in line:
-                env_linenos.append(lineno)
-
-        # Remove ENV lines - assumes ENV lines are grouped together
-        del lines[env_linenos[0] : env_linenos[-1] + 1]
-
-        # Remove CMD lines - we'll hardcode in the param values
-        for lineno, line in enumerate(lines):
-            if 'CMD' in line:
-                cmd_lineno = lineno
-        del lines[cmd_lineno : cmd_lineno + 2]
-
-        # Fio-specific: find the CMD lines
+        # Parameters are passed to the fio image when the container runs
         thread_option = '' if self.thread is False else '--thread'
-        time_based_option = '' if self.time_based is False else '--time_based'
-        fio_cmd = (f'fio --output-format=json --name=test '
-                   f'--ramp_time={self.ramp_time} '
-                   f'--ioengine={self.ioengine} '
-                   f'--bs={self.bs} '
-                   f'--fsync={self.bs} '
-                   f'--rw={self.rw} '
+        options = (f'--fsync={self.bs} '
                    f'--nrfiles={self.nrfiles} '
-                   f'--filesize={self.filesize} '
                    f'{thread_option} '
                    f'--numjobs={self.numjobs} '
-                   f'--group_reporting '
-                   f'{time_based_option} '
-                   f'--runtime={self.runtime}'
-        )
-        cmd = f'CMD ["sh", "-c", "{fio_cmd}"]'
-        lines[-1] = cmd
-
-        # Write to Dockerfile
-        new_dockerfile = self.DOCKERFILE_NAME
-        with open(new_dockerfile, 'w') as f:
-            for line in lines:
-                f.write(line)
-
-        # Run perf.py script
+                   f'--group_reporting')
+        params = {'ioengine': self.ioengine,
+                  'blocksize': self.bs,
+                  'size': self.filesize,
+                  'ramp_time': self.ramp_time,
+                  'options': options,
+                  'backend': self.backend}
+        if self.time_based:
+            params['time'] = self.runtime
         if self.sub_bench == FioSubBench.RANDREAD:
-            perf_cmd = f'python3 {BENCHMARK_TOOLS_DIR}/perf.py run --env {BENCHMARK_TOOLS_DIR}/examples/localhost.yaml fio.randread'
-            print(f'[fio_randread] {perf_cmd}')
+            return self.run_perf('fio.randread', params)
         elif self.sub_bench == FioSubBench.RANDWRITE:
-            perf_cmd = f'python3 {BENCHMARK_TOOLS_DIR}/perf.py run --env {BENCHMARK_TOOLS_DIR}/examples/localhost.yaml fio.randwrite'
-            print(f'[fio_randwrite] {perf_cmd}')
-        process = subprocess.run(shlex.split(perf_cmd),
-                                 stdout=subprocess.PIPE,
-                                 universal_newlines=True)
-        output_str = process.stdout
-        return output_str.split('\n')
+            return self.run_perf('fio.randwrite', params)
 
     def _parse_native_output(self, output):
         results_json = json.loads(output)
@@ -177,48 +206,28 @@ class Fio(Benchmark):
             return metric
 
     def _parse_docker_output(self, output):
-        for line in output:
-            if self.DOCKER_METRIC in line:
-                bw = int(line.split(',')[1])
-                if self.sub_bench == FioSubBench.RANDREAD:
-                    print(f'[fio randread] Bandwidth: {bw}\n')
-                elif self.sub_bench == FioSubBench.RANDWRITE:
-                    print(f'[fio randwrite] Bandwidth: {bw}\n')
-                return bw
-
-    def write_to_csv(self, data):
-        csv_row = {'ramp_time': self.ramp_time,
-                   'ioengine': self.ioengine,
-                   'bs': self.bs,
-                   'rw': self.rw,
-                   'nrfiles': self.nrfiles,
-                   'filesize': self.filesize,
-                   'thread': self.thread,
-                   'numjobs': self.numjobs,
-                   'time_based': self.time_based,
-                   'runtime': self.runtime,
-                   'bw': data}
-
-        # Check if results directory have been created
-        if not os.path.isdir(self.RESULTS_CSV_DIR):
-            os.mkdir(self.RESULTS_CSV_DIR)
-
-        if self.platform == Platform.NATIVE:
-            if not os.path.isdir(self.NATIVE_RESULTS_DIR):
-                os.mkdir(self.NATIVE_RESULTS_DIR)
-            filepath = os.path.join(self.NATIVE_RESULTS_DIR, self.csv_filename)
-        elif self.platform == Platform.DOCKER:
-            if not os.path.isdir(self.DOCKER_RESULTS_DIR):
-                os.mkdir(self.DOCKER_RESULTS_DIR)
-            filepath = os.path.join(self.DOCKER_RESULTS_DIR, self.csv_filename)
-
-        # Write CSV headers when creating file for first time
-        if not os.path.isfile(filepath):
-            with open(filepath, 'w') as csv_file:
-                csv_writer = csv.DictWriter(csv_file, fieldnames=self.csv_headers)
-                csv_writer.writeheader()
-
-        # Append row to CSV file
-        with open(filepath, 'a') as csv_file:
-            csv_writer = csv.DictWriter(csv_file, fieldnames=self.csv_headers)
-            csv_writer.writerow(csv_row)
+        # Results of the in-process run, one value per iteration
+        bw = output.median(self.DOCKER_METRICS[self.sub_bench])
+        if self.sub_bench == FioSubBench.RANDREAD:
+            print(f'[fio randread] Bandwidth: {bw}\n')
+        elif self.sub_bench == FioSubBench.RANDWRITE:
+            print(f'[fio randwrite] Bandwidth: {bw}\n')
+        return bw
+
+    def footprint(self):
+        """One CPU per job, and the disk (and working directory) to itself."""
+        return Footprint(cpus=self.numjobs, disk=True)
+
+    def parameters(self):
+        """Returns the parameters to store with the results."""
+        return {'ramp_time': self.ramp_time,
+                'ioengine': self.ioengine,
+                'bs': self.bs,
+                'rw': self.rw,
+                'nrfiles': self.nrfiles,
+                'filesize': self.filesize,
+                'thread': self.thread,
+                'numjobs': self.numjobs,
+                'time_based': self.time_based,
+                'runtime': self.runtime,
+                'backend': self.backend}
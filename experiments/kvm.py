@@ -0,0 +1,183 @@
+import json
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+
+class GuestConfig(object):
+    """How KVM points boot their guest.
+
+    The image must have sshd, the benchmarks' tools (as the native host has
+    them) and the public half of key for user. It is booted with snapshot=on,
+    so points never change it and may share it.
+    """
+
+    def __init__(self, image, user='ubuntu', key='~/.ssh/id_rsa', memory='4G',
+                 vcpus=0, hugepages=False, qemu='qemu-system-x86_64', boot_timeout=300):
+        self.image = os.path.expanduser(image)
+        self.user = user
+        self.key = os.path.expanduser(key)
+        # Guest memory, as QEMU's -m (e.g. 4G)
+        self.memory = memory
+        # vCPUs of unpinned points (0: as many as the host has CPUs for points)
+        self.vcpus = int(vcpus)
+        # Whether guest memory is backed by the host's hugepages (/dev/hugepages)
+        self.hugepages = hugepages
+        self.qemu = qemu
+        self.boot_timeout = boot_timeout
+
+
+def free_port():
+    """Returns a local TCP port that is free at the moment."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Guest(object):
+    """A QEMU/KVM virtual machine running the native command lines of a point.
+
+    Commands run over SSH, forwarded from a local port. If the point is pinned,
+    each vCPU thread is pinned to one of its CPUs, and the guest memory is
+    allocated from its NUMA nodes. Usage:
+
+    with Guest(config, cpus=[2, 3], mems=[0]) as guest:
+        guest.run('sysbench cpu run')
+    """
+
+    def __init__(self, config: GuestConfig, cpus=None, mems=None, vcpus=0):
+        self.config = config
+        self.cpus = list(cpus or [])
+        self.mems = list(mems or [])
+        # One vCPU per CPU if pinned, otherwise as configured or given
+        self.vcpus = len(self.cpus) or config.vcpus or vcpus or os.cpu_count() or 1
+        self.port = None
+        self.process = None
+        self.workdir = None
+
+    def qemu_cmd(self):
+        """Returns the QEMU command line booting the guest."""
+        cmd = [self.config.qemu,
+               '-enable-kvm', '-cpu', 'host',
+               '-smp', str(self.vcpus),
+               '-m', self.config.memory,
+               '-drive', f'file={self.config.image},if=virtio,snapshot=on',
+               '-netdev', f'user,id=net0,hostfwd=tcp:127.0.0.1:{self.port}-:22',
+               '-device', 'virtio-net-pci,netdev=net0',
+               '-qmp', f'unix:{self.qmp_path()},server,nowait',
+               '-display', 'none', '-serial', f'file:{os.path.join(self.workdir, "console.log")}']
+        if self.config.hugepages:
+            cmd += ['-mem-path', '/dev/hugepages', '-mem-prealloc']
+        if self.mems:
+            mems = ','.join(str(node) for node in self.mems)
+            cmd = ['numactl', f'--membind={mems}'] + cmd
+        if self.cpus:
+            # QEMU's own threads run on the point's CPUs, and each vCPU on one of them
+            cpus = ','.join(str(cpu) for cpu in self.cpus)
+            cmd = ['taskset', '-c', cpus] + cmd
+        return cmd
+
+    def qmp_path(self):
+        return os.path.join(self.workdir, 'qmp.socket')
+
+    def start(self):
+        """Boots the guest and waits until it accepts SSH connections."""
+        self.workdir = tempfile.mkdtemp(prefix='kvm-guest-')
+        self.port = free_port()
+        cmd = self.qemu_cmd()
+        print(f'[kvm] {" ".join(cmd)}')
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                        universal_newlines=True)
+        try:
+            if self.cpus:
+                self._pin_vcpus()
+            self._wait_ssh()
+        except Exception:
+            self.stop()
+            raise
+
+    def _qmp(self, command):
+        """Runs a QMP command and returns its result."""
+        deadline = time.time() + 30
+        while not os.path.exists(self.qmp_path()):
+            self._check_alive()
+            if time.time() > deadline:
+                raise RuntimeError('QEMU did not create its QMP socket')
+            time.sleep(0.1)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.qmp_path())
+            replies = sock.makefile('r')
+            # Greeting, then capabilities negotiation
+            replies.readline()
+            for execute in ['qmp_capabilities', command]:
+                sock.sendall(json.dumps({'execute': execute}).encode() + b'\n')
+                while True:
+                    reply = json.loads(replies.readline())
+                    # Skip asynchronous events
+                    if 'return' in reply or 'error' in reply:
+                        break
+                if 'error' in reply:
+                    raise RuntimeError(f'QMP {execute} failed: {reply["error"]}')
+            return reply['return']
+
+    def _pin_vcpus(self):
+        """Pins vCPU i to the i-th CPU of the point."""
+        for vcpu in self._qmp('query-cpus-fast'):
+            cpu = self.cpus[vcpu['cpu-index'] % len(self.cpus)]
+            os.sched_setaffinity(vcpu['thread-id'], {cpu})
+
+    def _check_alive(self):
+        if self.process.poll() is not None:
+            raise RuntimeError(f'QEMU exited with {self.process.returncode}: {self.process.stderr.read().strip()}')
+
+    def _wait_ssh(self):
+        deadline = time.time() + self.config.boot_timeout
+        while self.run('true', stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode != 0:
+            self._check_alive()
+            if time.time() > deadline:
+                raise RuntimeError(f'Guest did not accept SSH connections on port {self.port} '
+                                   f'within {self.config.boot_timeout}s')
+            time.sleep(1)
+
+    def ssh_cmd(self):
+        return ['ssh', '-p', str(self.port), '-i', self.config.key,
+                '-o', 'StrictHostKeyChecking=no', '-o', 'UserKnownHostsFile=/dev/null',
+                '-o', 'LogLevel=ERROR', '-o', 'BatchMode=yes', '-o', 'ConnectTimeout=5',
+                f'{self.config.user}@127.0.0.1']
+
+    def run(self, cmd, stdout=subprocess.PIPE, stderr=None):
+        """Runs a command line in the guest's shell, in the user's home directory."""
+        return subprocess.run(self.ssh_cmd() + [cmd], stdout=stdout, stderr=stderr,
+                              universal_newlines=True)
+
+    def exists(self, path):
+        """Returns whether a path exists in the guest."""
+        return self.run(f'test -e {shlex.quote(path)}', stdout=subprocess.DEVNULL).returncode == 0
+
+    def put(self, path):
+        """Copies a local file to the same relative path in the guest."""
+        with open(path) as source:
+            subprocess.run(self.ssh_cmd() + [f'cat > {shlex.quote(path)}'], stdin=source, check=True)
+
+    def stop(self):
+        """Powers the guest off."""
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
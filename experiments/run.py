@@ -4,8 +4,10 @@ sys.path.append('/home/ubuntu/vm-measurements')
 
 import argparse
 
+from benchmark import LOCALHOST_YAML, Benchmark
 from benchmark_parser import BenchmarkParser
 from dispatcher import Dispatcher
+from kvm import GuestConfig
 
 
 def main(args):
@@ -13,11 +15,28 @@ def main(args):
     bench_parser = BenchmarkParser()
     bench_configs = bench_parser.parse_ini_file(args.benchmark_file)
 
-    print(f'Running on {args.platform}...\n')
+    # Print the plan (and its points) without running anything
+    if args.plan:
+        print(bench_configs.describe())
+        if args.plan > 1:
+            for bench_config in bench_configs:
+                print(bench_config)
+        return
+
+    print(f'Running {len(bench_configs)} point(s) on {args.platform}, {args.jobs} at a time...\n')
+
+    guest_config = None
+    if args.kvm_image:
+        guest_config = GuestConfig(args.kvm_image, args.kvm_user, args.kvm_key, args.kvm_memory,
+                                   args.kvm_vcpus, args.kvm_hugepages)
 
     # For each config, dispatch benchmark runner
-    dispatcher = Dispatcher(args.platform)
-    dispatcher.dispatch_benchmarks(bench_configs)
+    dispatcher = Dispatcher(args.platform, args.results_db, args.jobs, args.hosts,
+                            args.cpus, args.helper_cpus, args.check_idle, guest_config)
+    failures = dispatcher.dispatch_benchmarks(bench_configs)
+    if failures:
+        print(f'[Error] {failures} point(s) failed')
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -27,7 +46,59 @@ if __name__ == '__main__':
                            help='Benchmark config INI file. Default: benchmarks.ini')
     argparser.add_argument('-p', '--platform',
                            default='native',
-                           help='Platform to run benchmarks on (either native or docker). Default: native')
+                           help='Platform to run benchmarks on (native, kvm, docker or firecracker). Default: native')
+    argparser.add_argument('-r', '--results_db',
+                           default=Benchmark.RESULTS_DB,
+                           help=f'Result store to add results to. Default: {Benchmark.RESULTS_DB}')
+    argparser.add_argument('-j', '--jobs',
+                           type=int,
+                           default=1,
+                           help='Number of points to run at once. Points only run together on '
+                                'disjoint CPUs, NUMA nodes and disks, as each benchmark\'s '
+                                'footprint allows. Default: 1 (one after the other, unpinned)')
+    argparser.add_argument('--hosts',
+                           default=LOCALHOST_YAML,
+                           help='benchmark-tools machines file of the hosts to run Docker and Firecracker points on '
+                                '(Firecracker: local machines only). '
+                                f'Default: {LOCALHOST_YAML}')
+    argparser.add_argument('--cpus',
+                           default='',
+                           help='CPUs to run points on, e.g. 2-7. Points are pinned to them (with numactl '
+                                'natively, the container\'s cpuset on Docker, the vCPUs on KVM) even with -j 1. '
+                                'Default: all')
+    argparser.add_argument('--helper_cpus',
+                           default='',
+                           help='CPUs to pin the container runtime\'s helper processes to (Docker only). '
+                                'Points do not run on them. Default: not pinned')
+    argparser.add_argument('--check_idle',
+                           action='store_true',
+                           help='Check that the CPUs of each point are idle before running it')
+    argparser.add_argument('--kvm_image',
+                           default='',
+                           help='Disk image KVM guests boot from (unchanged by points), with sshd and the '
+                                'benchmarks\' tools. Required for -p kvm')
+    argparser.add_argument('--kvm_user',
+                           default='ubuntu',
+                           help='User to run commands as in KVM guests. Default: ubuntu')
+    argparser.add_argument('--kvm_key',
+                           default='~/.ssh/id_rsa',
+                           help='SSH key of the KVM guest user. Default: ~/.ssh/id_rsa')
+    argparser.add_argument('--kvm_memory',
+                           default='4G',
+                           help='Memory of KVM guests. Default: 4G')
+    argparser.add_argument('--kvm_vcpus',
+                           type=int,
+                           default=0,
+                           help='vCPUs of unpinned KVM guests (pinned guests have one per CPU of the point). '
+                                'Default: as many as the CPUs points may use')
+    argparser.add_argument('--kvm_hugepages',
+                           action='store_true',
+                           help='Back KVM guest memory with hugepages (/dev/hugepages)')
+    argparser.add_argument('--plan',
+                           action='count',
+                           default=0,
+                           help='Print the sweep plan and number of points, then exit. '
+                                'Given twice, also print every point.')
     args = argparser.parse_args()
 
     main(args)
@@ -214,51 +214,69 @@ run_native() {
     fi
 }
 
-# TODO
+# The native command lines, in a QEMU/KVM guest booted for each point (see kvm.py).
+# KVM_IMAGE is the guest disk image, with sshd, the benchmarks' tools and KVM_KEY
+# (default: ~/.ssh/id_rsa) authorized for KVM_USER (default: ubuntu). Set
+# KVM_HUGEPAGES=1 to back guest memory with hugepages, and KVM_CPUS to pin points
+# (one vCPU per CPU).
 run_kvm() {
     echo "Running KVM"
-    ### Microbenchmarks ###
 
-    # 1. sysbench.cpu
-
-    # 2. sysbench.memory
-
-    # 3. fio.randread
-
-    # 4. fio.radnwrite
-
-    # 5. syscall.syscall
-
-
-    ### Applications ###
+    if [[ -z "${KVM_IMAGE}" ]]; then
+	echo "KVM_IMAGE is not set, skipping KVM"
+	return
+    fi
+    options=( -p kvm --kvm_image="${KVM_IMAGE}" --kvm_user="${KVM_USER:-ubuntu}" --kvm_key="${KVM_KEY:-~/.ssh/id_rsa}" )
+    if [[ -n "${KVM_HUGEPAGES}" ]]; then
+	options+=( --kvm_hugepages )
+    fi
+    if [[ -n "${KVM_CPUS}" ]]; then
+	options+=( --cpus="${KVM_CPUS}" )
+    fi
 
-    # 1. ml.tensorflow
+    if [[ -n "${BENCHMARK}" ]]; then
+	# e.g. sysbench.cpu runs config/sysbench_cpu.ini, and syscall.syscall config/syscall.ini
+	name=${BENCHMARK//./_}
+	ini=${ROOT_DIR}/experiments/config/${name/syscall_syscall/syscall}.ini
+	if [[ -f "${ini}" ]]; then
+	    echo "Benchmark = ${BENCHMARK}"
+	    python3 ${ROOT_DIR}/experiments/run.py "${options[@]}" -b "${ini}"
+	else
+	    echo "Unrecognized benchmark ${BENCHMARK}"
+	fi
+    else
+	echo "Running all benchmarks in platform ${PLATFORM}"
+	python3 ${ROOT_DIR}/experiments/run.py "${options[@]}" -b ${ROOT_DIR}/experiments/benchmarks.ini
+    fi
+}
 
-    # 2. media.ffmpeg
+# The Docker images, run in Firecracker microVMs (see benchmark-tools/harness/firecracker.py).
+# Needs /dev/kvm, and the firecracker binary and a guest kernel at FIRECRACKER_BIN and
+# FIRECRACKER_KERNEL (default: firecracker on the PATH and ~/.benchmark-tools/firecracker/vmlinux).
+# Set FIRECRACKER_SNAPSHOT to full or diff to restore each run from a snapshot instead of booting.
+firecracker_perf() {
+    snapshot=${FIRECRACKER_SNAPSHOT:+--snapshot=${FIRECRACKER_SNAPSHOT}}
+    echo "python3 perf.py run --env examples/localhost.yaml --runtime=firecracker ${snapshot} $1"
+    python3 ${DOCKER_SCRIPT_DIR}/perf.py run --env ${DOCKER_SCRIPT_DIR}/examples/localhost.yaml --runtime=firecracker ${snapshot} $1
 }
 
-# TODO
 run_firecracker() {
     echo "Running Firecracker"
-    ### Microbenchmarks ###
-
-    # 1. sysbench.cpu
-
-    # 2. sysbench.memory
-
-    # 3. fio.randread
-
-    # 4. fio.radnwrite
-
-    # 5. syscall.syscall
-
-
-    ### Applications ###
-
-    # 1. ml.tensorflow
-
-    # 2. media.ffmpeg
 
+    benchmarks=( sysbench.cpu sysbench.memory fio.randread fio.randwrite syscall.syscall ml.tensorflow media.ffmpeg )
+    if [[ -n "${BENCHMARK}" ]]; then
+	if [[ " ${benchmarks[*]} " == *" ${BENCHMARK} "* ]]; then
+	    echo "Benchmark = ${BENCHMARK}"
+	    firecracker_perf ${BENCHMARK}
+	else
+	    echo "Unrecognized benchmark ${BENCHMARK}"
+	fi
+    else
+	echo "Running all benchmarks in platform ${PLATFORM}"
+	for benchmark in "${benchmarks[@]}"; do
+	    firecracker_perf ${benchmark}
+	done
+    fi
 }
 
 sysbench_cpu_docker() {
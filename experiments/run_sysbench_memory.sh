@@ -7,7 +7,5 @@ fi
 
 platform=$1
 
-sudo python3 run.py -p $platform -b config/sysbench_memory_write_seq.ini
-sudo python3 run.py -p $platform -b config/sysbench_memory_write_rnd.ini
-sudo python3 run.py -p $platform -b config/sysbench_memory_read_seq.ini
-sudo python3 run.py -p $platform -b config/sysbench_memory_read_rnd.ini
+# Sweeps memory_oper x memory_access_mode x num_threads
+sudo python3 run.py -p $platform -b config/sysbench_memory.ini
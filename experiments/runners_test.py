@@ -0,0 +1,77 @@
+"""Checks the Docker output parsers against the metrics benchmark-tools reports."""
+
+import re
+
+import pytest
+
+from benchmark import Platform
+from fio import Fio, FioSubBench
+from media_ffmpeg import MediaFFMPEG
+from ml_tensorflow import MLTensorflow
+from sysbench_cpu import SysbenchCPU
+from sysbench_memory import SysbenchMemory
+from syscall import Syscall
+
+from benchmarks import benchmark_metrics
+from harness.api import Results, find_benchmarks
+
+
+class MetricsSession(object):
+    """Stands in for a benchmark-tools session: returns two iterations of
+    every metric of the benchmark run, and only those."""
+
+    def __init__(self):
+        self.runs = []
+
+    def run(self, name, **kwargs):
+        found = find_benchmarks(f'^{re.escape(name)}$')
+        assert len(found) == 1, f'no benchmark {name}'
+        _, _, func = found[0]
+        self.runs.append(name)
+        return Results({metric: [1.0, 3.0] for metric, _ in benchmark_metrics(func)})
+
+
+RUNNERS = [
+    SysbenchCPU(1, 10, 10000, platform=Platform.DOCKER),
+    SysbenchMemory(1, '1K', '1G', 'global', 'off', 'read', 'seq', platform=Platform.DOCKER),
+    Fio(0, 'sync', '4K', 'randread', 1, '1G', 'False', 1, 'False', 10,
+        FioSubBench.RANDREAD, platform=Platform.DOCKER),
+    Fio(0, 'sync', '4K', 'randwrite', 1, '1G', 'False', 1, 'False', 10,
+        FioSubBench.RANDWRITE, platform=Platform.DOCKER),
+    Syscall(1000000, platform=Platform.DOCKER),
+    MLTensorflow('cnn', platform=Platform.DOCKER),
+    MediaFFMPEG('input.mp4', platform=Platform.DOCKER),
+]
+
+
+@pytest.mark.parametrize('runner', RUNNERS, ids=lambda runner: type(runner).__name__)
+def test_parse_docker_output(runner):
+    """Each runner parses the results of the benchmark it runs."""
+    runner.session = MetricsSession()
+    value = runner.parse_output(runner.run())
+    assert len(runner.session.runs) == 1
+    assert value is not None
+
+
+def test_fio_backend_defaults():
+    """Fio points without a backend use one their platform can provision."""
+    def fio(platform, **kwargs):
+        return Fio(0, 'sync', '4K', 'randread', 1, '1G', 'False', 1, 'False', 10,
+                   FioSubBench.RANDREAD, platform=platform, **kwargs)
+
+    assert fio(Platform.DOCKER).backend == 'bind'
+    assert fio(Platform.FIRECRACKER).backend == 'overlay'
+    with pytest.raises(ValueError, match='shared with the host'):
+        fio(Platform.FIRECRACKER, backend='bind')
+
+
+def test_fio_raw_single_file():
+    """The raw backend is refused for points of several files or jobs."""
+    def fio(nrfiles, numjobs):
+        return Fio(0, 'sync', '4K', 'randread', nrfiles, '1G', 'False', numjobs, 'False', 10,
+                   FioSubBench.RANDREAD, platform=Platform.DOCKER, backend='raw')
+
+    assert fio('1', '1').backend == 'raw'
+    for nrfiles, numjobs in (('2', '1'), ('1', '4')):
+        with pytest.raises(ValueError, match='nrfiles=1 and numjobs=1'):
+            fio(nrfiles, numjobs)
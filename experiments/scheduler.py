@@ -0,0 +1,205 @@
+import os
+import subprocess
+import threading
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import Footprint
+
+
+def read_topology(output):
+    """Returns NUMA node ids to their sorted CPUs, from `lscpu -p=CPU,NODE` output."""
+    nodes = {}
+    for line in output.splitlines():
+        if not line.strip() or line.startswith('#'):
+            continue
+        cpu, node = line.split(',')[:2]
+        nodes.setdefault(int(node or 0), []).append(int(cpu))
+    return {node: sorted(cpus) for node, cpus in sorted(nodes.items())}
+
+
+def restrict_topology(nodes, cpus):
+    """Returns the nodes with only the given CPUs, dropping nodes left empty."""
+    restricted = {node: [cpu for cpu in node_cpus if cpu in cpus] for node, node_cpus in nodes.items()}
+    return {node: node_cpus for node, node_cpus in restricted.items() if node_cpus}
+
+
+class LocalShell(object):
+    """Runs commands on this machine, as a benchmark-tools machine would."""
+
+    def run(self, cmd):
+        process = subprocess.run(cmd, shell=True,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+        return process.stdout, process.stderr
+
+    def sleep(self, amount):
+        time.sleep(amount)
+
+    def __str__(self):
+        return 'localhost'
+
+
+def local_topology():
+    """Returns the CPUs of each NUMA node of this machine."""
+    try:
+        stdout, _ = LocalShell().run('lscpu -p=CPU,NODE')
+        nodes = read_topology(stdout)
+    except OSError:
+        nodes = {}
+    # Without lscpu, assume a single node
+    return nodes or {0: list(range(os.cpu_count() or 1))}
+
+
+class Slot(object):
+    """The host, CPUs and NUMA nodes given to a running point."""
+
+    def __init__(self, host, cpus, footprint, exclusive=False):
+        self.host = host
+        # No CPUs means the point is not pinned
+        self.cpus = cpus
+        self.mems = host.nodes_of(cpus)
+        self.footprint = footprint
+        self.exclusive = exclusive
+
+
+class Host(object):
+    """A machine points run on, and which of its CPUs and disk are in use.
+
+    nodes maps the host's NUMA node ids to the CPUs points may use. Commands
+    (e.g. the idle check) run on machine, and Docker points on the host's
+    benchmark-tools session. If pinned, points that have the host to
+    themselves are pinned to all its CPUs, otherwise they are not pinned.
+    """
+
+    def __init__(self, name, nodes, machine=None, session=None, pinned=False):
+        self.name = name
+        self.nodes = nodes
+        self.machine = machine or LocalShell()
+        self.session = session
+        self.pinned = pinned
+        self.free = {node: set(cpus) for node, cpus in nodes.items()}
+        self.disk_busy = False
+        self.running = 0
+        self.exclusive = False
+
+    def num_cpus(self):
+        return sum(len(cpus) for cpus in self.nodes.values())
+
+    def nodes_of(self, cpus):
+        """Returns the NUMA nodes of the given CPUs."""
+        return sorted(node for node, node_cpus in self.nodes.items()
+                      if any(cpu in node_cpus for cpu in cpus))
+
+    def allocate(self, footprint: Footprint):
+        """Returns a Slot for a point with the given footprint, or None if it
+        does not fit next to the points already running."""
+        if self.exclusive:
+            return None
+        if footprint.exclusive or footprint.cpus > self.num_cpus():
+            # Points larger than the host have it to themselves
+            if self.running:
+                return None
+            self.exclusive = True
+            self.running = 1
+            cpus = sorted(cpu for cpus in self.nodes.values() for cpu in cpus) if self.pinned else []
+            return Slot(self, cpus, footprint, exclusive=True)
+        if footprint.disk and self.disk_busy:
+            return None
+        cpus = self._pick(footprint)
+        if cpus is None:
+            return None
+        for free in self.free.values():
+            free.difference_update(cpus)
+        self.disk_busy = self.disk_busy or footprint.disk
+        self.running += 1
+        return Slot(self, cpus, footprint)
+
+    def _pick(self, footprint):
+        """Returns the CPUs to give to a point, or None if not enough are free."""
+        if footprint.numa_node:
+            # Whole idle nodes, as many as the point has CPUs
+            picked = []
+            for node, cpus in self.nodes.items():
+                if len(self.free[node]) == len(cpus):
+                    picked.extend(cpus)
+                    if len(picked) >= footprint.cpus:
+                        return sorted(picked)
+            return None
+        # The fullest node that fits the point, so that whole nodes stay free
+        fits = [free for free in self.free.values() if len(free) >= footprint.cpus]
+        if fits:
+            return sorted(min(fits, key=len))[:footprint.cpus]
+        # Otherwise spread the point over nodes
+        free = sorted(cpu for cpus in self.free.values() for cpu in cpus)
+        if len(free) >= footprint.cpus:
+            return free[:footprint.cpus]
+        return None
+
+    def release(self, slot: Slot):
+        """Frees the resources of a finished point."""
+        self.running -= 1
+        if slot.exclusive:
+            self.exclusive = False
+            return
+        for node, cpus in self.nodes.items():
+            self.free[node].update(cpu for cpu in slot.cpus if cpu in cpus)
+        if slot.footprint.disk:
+            self.disk_busy = False
+
+
+class Scheduler(object):
+    """Runs benchmark points concurrently on hosts, as their footprints allow.
+
+    Points are started in order: a point waits until it fits on a host (and
+    fewer than jobs points run), and the points after it wait behind it. With
+    a single job, each point has the first host to itself, as when points
+    were run one after the other.
+    """
+
+    def __init__(self, hosts, jobs=1):
+        self.hosts = hosts
+        self.jobs = max(1, jobs)
+        self.running = 0
+        self.failures = 0
+        self.condition = threading.Condition()
+
+    def run(self, points):
+        """Runs each (benchmark, job) of points as job(benchmark, slot).
+
+        Returns the number of points that failed.
+        """
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for bench, job in points:
+                footprint = bench.footprint() if self.jobs > 1 else Footprint(exclusive=True)
+                slot = self._acquire(footprint)
+                executor.submit(self._run, job, bench, slot)
+        return self.failures
+
+    def _acquire(self, footprint):
+        with self.condition:
+            while True:
+                if self.running < self.jobs:
+                    for host in self.hosts:
+                        slot = host.allocate(footprint)
+                        if slot is not None:
+                            self.running += 1
+                            return slot
+                self.condition.wait()
+
+    def _run(self, job, bench, slot):
+        try:
+            job(bench, slot)
+        except Exception:
+            traceback.print_exc()
+            print(f'[Error] {bench.result_name} {bench.parameters()} failed\n')
+            with self.condition:
+                self.failures += 1
+        finally:
+            with self.condition:
+                slot.host.release(slot)
+                self.running -= 1
+                self.condition.notify_all()
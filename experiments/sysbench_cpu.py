@@ -1,11 +1,7 @@
-import csv
 import os
 import re
-import shlex
-import subprocess
 
-from experiments import WORKLOADS_DIR, BENCHMARK_TOOLS_DIR
-from benchmark import Benchmark, Platform
+from benchmark import HARNESS_PLATFORMS, NATIVE_PLATFORMS, Benchmark, Footprint, Platform
 
 
 class SysbenchCPU(Benchmark):
@@ -24,12 +20,6 @@ class SysbenchCPU(Benchmark):
     PARAM_MAX_TIME = 'max_time'
     PARAM_CPU_MAX_PRIME = 'cpu_max_prime'
 
-    ORIGINAL_DOCKERFILE_DIR = os.path.join(WORKLOADS_DIR, 'sysbench')
-    # Default Dockerfile provided by benchmark-tools (backed up to .Dockerfile)
-    DEFAULT_DOCKERFILE_NAME = os.path.join(ORIGINAL_DOCKERFILE_DIR, '.Dockerfile')
-    # Dockerfile we'll use with the parameters in INI file
-    DOCKERFILE_NAME = os.path.join(ORIGINAL_DOCKERFILE_DIR, 'Dockerfile')
-
     def __init__(self, num_threads, max_time, cpu_max_prime, platform=Platform.NATIVE):
         super(SysbenchCPU, self).__init__(platform)
         # Parameters
@@ -37,66 +27,26 @@ class SysbenchCPU(Benchmark):
         self.max_time = max_time
         self.cpu_max_prime = cpu_max_prime
 
-        self.csv_headers = ['num_threads', 'max_time', 'cpu_max_prime', 'events_per_second']
-        self.csv_filename = 'sysbench_cpu.csv'
+        self.metric_name = 'events_per_second'
+        self.result_name = 'sysbench_cpu'
 
     def run_native(self):
         cmd = f"sysbench --threads={self.num_threads} --max-time={self.max_time} --cpu-max-prime={self.cpu_max_prime} cpu run"
         print(f'[sysbench_cpu] {cmd}')
-        process = subprocess.run(shlex.split(cmd),
-                                 stdout=subprocess.PIPE,
-                                 universal_newlines=True)
+        process = self.execute(cmd)
         output_str = process.stdout
         return output_str.split('\n')
 
     def run_docker(self):
-        # Copy the default Dockerfile into a list of strings
-        with open(self.DEFAULT_DOCKERFILE_NAME, 'r') as f:
-            lines = f.readlines()
-
-        # # Find the lines with ENV declarations
-        # env_linenos = []
-        # for lineno, line in enumerate(lines):
-        #     if 'ENV' in line:
-        #         env_linenos.append(lineno)
-
-        # Sysbench-specific: find the last line
-        last_line = len(lines) - 1
-
-        # # Remove these lines - assumes ENV lines are grouped together
-        # del lines[env_linenos[0] : env_linenos[-1] + 1]
-
-        # # Create ENV declaration strings
-        # env_decls = [f'ENV threads {self.num_threads}\n',
-        #              f'ENV max_time {self.max_time}\n',
-        #              f'ENV cpu_max_prime {self.cpu_max_prime}\n']
-
-        # # Insert the new ENV decalrations to lines
-        # lines[env_linenos[0] : env_linenos[0]] = env_decls
-
-        # This will be the last line in the Dockerflie
-        cmd = f'sysbench --num_threads={self.num_threads} --max-time={self.max_time} --cpu-max-prime={self.cpu_max_prime} cpu run"]'
-        lines[-1] = cmd
-
-        # Write to Dockerfile
-        new_dockerfile = self.DOCKERFILE_NAME
-        with open(new_dockerfile, 'w') as f:
-            for line in lines:
-                f.write(line)
-
-        # Run perf.py script
-        perf_cmd = f'python3 {BENCHMARK_TOOLS_DIR}/perf.py run --env {BENCHMARK_TOOLS_DIR}/examples/localhost.yaml sysbench.cpu'
-        print(f'[sysbench_cpu] {perf_cmd}')
-        process = subprocess.run(shlex.split(perf_cmd),
-                                 stdout=subprocess.PIPE,
-                                 universal_newlines=True)
-        output_str = process.stdout
-        return output_str.split('\n')
+        # Parameters are passed to the sysbench image when the container runs
+        return self.run_perf('sysbench.cpu', {'threads': self.num_threads,
+                                              'max_prime': self.cpu_max_prime,
+                                              'options': f'--max-time={self.max_time}'})
 
     def parse_output(self, output):
-        if self.platform == Platform.NATIVE:
+        if self.platform in NATIVE_PLATFORMS:
             return self._parse_native_output(output)
-        elif self.platform == Platform.DOCKER:
+        elif self.platform in HARNESS_PLATFORMS:
             return self._parse_docker_output(output)
 
     def _parse_native_output(self, output):
@@ -109,39 +59,17 @@ class SysbenchCPU(Benchmark):
                 return events_per_second
 
     def _parse_docker_output(self, output):
-        for line in output:
-            if self.DOCKER_METRIC in line:
-                events_per_second = float(line.split(',')[1])
-                print(f"[sysbench cpu] {events_per_second} events per second\n")
-                return events_per_second
-
-    def write_to_csv(self, data):
-        """Appends the given parameters and performance metric values to the csv file."""
-        csv_row = {'num_threads': self.num_threads,
-                   'max_time': self.max_time,
-                   'cpu_max_prime': self.cpu_max_prime,
-                   'events_per_second': data}
-
-        # Check if results directory have been created
-        if not os.path.isdir(self.RESULTS_CSV_DIR):
-            os.mkdir(self.RESULTS_CSV_DIR)
-
-        if self.platform == Platform.NATIVE:
-            if not os.path.isdir(self.NATIVE_RESULTS_DIR):
-                os.mkdir(self.NATIVE_RESULTS_DIR)
-            filepath = os.path.join(self.NATIVE_RESULTS_DIR, self.csv_filename)
-        elif self.platform == Platform.DOCKER:
-            if not os.path.isdir(self.DOCKER_RESULTS_DIR):
-                os.mkdir(self.DOCKER_RESULTS_DIR)
-            filepath = os.path.join(self.DOCKER_RESULTS_DIR, self.csv_filename)
-
-        # Write CSV headers when creating file for first time
-        if not os.path.isfile(filepath):
-            with open(filepath, 'w') as csv_file:
-                csv_writer = csv.DictWriter(csv_file, fieldnames=self.csv_headers)
-                csv_writer.writeheader()
-
-        # Append row to CSV file
-        with open(filepath, 'a') as csv_file:
-            csv_writer = csv.DictWriter(csv_file, fieldnames=self.csv_headers)
-            csv_writer.writerow(csv_row)
+        # Results of the in-process run, one value per iteration
+        events_per_second = output.median(self.DOCKER_METRIC)
+        print(f"[sysbench cpu] {events_per_second} events per second\n")
+        return events_per_second
+
+    def footprint(self):
+        """One CPU per thread."""
+        return Footprint(cpus=self.num_threads)
+
+    def parameters(self):
+        """Returns the parameters to store with the results."""
+        return {'num_threads': self.num_threads,
+                'max_time': self.max_time,
+                'cpu_max_prime': self.cpu_max_prime}